@@ -13,6 +13,8 @@ NODES_TO_LOAD = {
     "TextOnImage": "✍️ Text on Image",
     "PasteTextOnImageBatch": "✍️ Paste Text on Image Batch",
     "AnimateTextOnImage": "✍️ Animate Text on Image",
+    "KaraokeCaptions": "🎤 Karaoke Captions",
+    "SubtitleBurnIn": "🔥 Subtitle Burn-In (Streaming)",
     "GaussianBlur": "✨ Gaussian Blur",
     "S3Uploader": "☁️ S3 Uploader",
     "WebhookUploader": "🚀 Webhook Uploader",
@@ -20,6 +22,7 @@ NODES_TO_LOAD = {
     "MaskBatchRepeater": "🔂 Mask Batch Repeater",
     "LayeredImageProcessor": "🖼️ Layered Image Processor",
     "AudioReactivePaster": "🔊 Audio Reactive Paster",
+    "AudioFeatureExtractor": "🎵 Audio Features",
     "ImageSelectorByIndex": "🖼️🎭 Image Selector by Index",
     "StringToInteger": "🔢 String to Integer",
     "StringToListConverter": "🔧 String Literal to List Converter",
@@ -0,0 +1,223 @@
+# Contains the audio analysis used by the audio-reactive nodes. The waveform is analyzed for every video frame
+# at once with numpy segment reductions instead of one slice and reduction per frame. Frame windows follow
+# the exact, fractional samples-per-frame (e.g. 1470.0 at 44.1 kHz / 30 fps or 1471.47 at 29.97 fps), so
+# long timelines never drift out of sync. The spectral features (frequency bands, onsets, beats) come from one
+# batched STFT per audio input, cached by waveform hash so several reactive nodes share the work, whatever
+# fps or frame count each of them asks for.
+
+# --- IMPORTS ---
+import threading
+import weakref
+from collections import OrderedDict
+import numpy as np
+import torch
+from scipy.signal import butter, sosfiltfilt, find_peaks
+from .sprite_cache import tensor_key
+
+ENVELOPE_MODES = ["Peak", "RMS", "Band Energy"]
+# Default frequency bands as (name, low_hz, high_hz); the high band runs up to the Nyquist frequency.
+DEFAULT_BANDS = (("bass", 20.0, 250.0), ("mid", 250.0, 4000.0), ("high", 4000.0, float('inf')))
+FEATURE_NAMES = ["bass", "mid", "high", "onset", "beat_pulse"]
+
+_SETTINGS = {
+    "n_fft": 2048,
+    "max_hop": 512,              # STFT hop in samples; lowered when a video frame is shorter than this.
+    "stft_chunk_frames": 8192,   # STFT frames computed per batch, which bounds the spectrogram's memory on long audio.
+    "cache_size": 8,             # STFT analyses kept (one per audio input, hop and band layout).
+}
+_CACHE = OrderedDict()
+_CACHE_LOCK = threading.Lock()
+# Waveform digests by id(tensor), as (weakref to the tensor, its version counter, digest), so the same
+# input tensor is hashed once and not on every analyze call. A dead ref or a new version forces a re-hash.
+_DIGESTS = OrderedDict()
+
+def _waveform_key(waveform):
+    """Returns tensor_key(waveform), reusing the digest while the same tensor object is unmodified."""
+    version = waveform._version
+    with _CACHE_LOCK:
+        entry = _DIGESTS.get(id(waveform))
+        if entry is not None and entry[0]() is waveform and entry[1] == version:
+            _DIGESTS.move_to_end(id(waveform))
+            return entry[2]
+    key = tensor_key(waveform)
+    with _CACHE_LOCK:
+        _DIGESTS[id(waveform)] = (weakref.ref(waveform), version, key)
+        while len(_DIGESTS) > _SETTINGS["cache_size"]: _DIGESTS.popitem(last=False)
+    return key
+
+def to_mono(audio):
+    """Returns (mono float32 numpy waveform, sample_rate) from a ComfyUI AUDIO dict, averaging the channels."""
+    waveform = audio['waveform'][0]
+    if waveform.shape[0] > 1: waveform = waveform.mean(dim=0, keepdim=True)
+    return waveform[0].detach().cpu().numpy().astype(np.float32, copy=False), audio['sample_rate']
+
+def frame_bounds(num_samples, sample_rate, fps, num_frames):
+    """
+    Returns the sample index where each frame's window starts, plus one final end index, as an int64 array
+    of length num_frames + 1. Frame i covers [i * sample_rate / fps, (i + 1) * sample_rate / fps), rounded down,
+    clipped to the audio's length. When sample_rate / fps is not an integer the windows differ by one sample
+    (e.g. 1837 or 1838 samples at 44.1 kHz / 24 fps).
+    """
+    bounds = np.floor(np.arange(num_frames + 1, dtype=np.float64) * sample_rate / fps).astype(np.int64)
+    return np.minimum(bounds, num_samples)
+
+def band_filter(samples, sample_rate, low_hz, high_hz, order=4):
+    """
+    Zero-phase Butterworth band-pass of a 1-D signal. A band edge at or beyond 0 / Nyquist turns it into a high- or
+    low-pass. Reversed edges are swapped; an empty band (equal edges after clamping) returns the signal unfiltered.
+    """
+    nyquist = sample_rate / 2.0
+    low_hz, high_hz = sorted((low_hz, high_hz))
+    low, high = min(max(low_hz, 0.0), nyquist) / nyquist, min(max(high_hz, 0.0), nyquist) / nyquist
+    if low >= high or (low <= 0 and high >= 1): return samples
+    if low <= 0: sos = butter(order, high, btype='lowpass', output='sos')
+    elif high >= 1: sos = butter(order, low, btype='highpass', output='sos')
+    else: sos = butter(order, [low, high], btype='bandpass', output='sos')
+    return sosfiltfilt(sos, samples).astype(np.float32, copy=False)
+
+def frame_envelope(samples, sample_rate, fps, num_frames, mode="Peak", low_hz=20.0, high_hz=250.0):
+    """
+    Returns one amplitude per video frame as a float64 array, computed for all frames in one reduction.
+    'Peak' is the largest absolute sample in the frame's window, 'RMS' its root mean square and 'Band Energy'
+    the RMS after a band-pass between low_hz and high_hz (e.g. 20-250 Hz follows the kick and bass; equal edges
+    fall back to plain RMS).
+    Frames that start after the end of the audio get 0.
+    """
+    bounds = frame_bounds(len(samples), sample_rate, fps, num_frames)
+    starts, lengths = bounds[:-1], np.diff(bounds)
+    envelope = np.zeros(num_frames, dtype=np.float64)
+    has_audio = lengths > 0
+    if not has_audio.any(): return envelope
+
+    if mode == "Band Energy": samples = band_filter(samples, sample_rate, low_hz, high_hz)
+    # reduceat reduces each [start_i, start_(i+1)) segment; frames past the audio are empty and skipped.
+    seg_starts = starts[has_audio]
+    if mode == "Peak":
+        envelope[has_audio] = np.maximum.reduceat(np.abs(samples[:bounds[-1]]), seg_starts)
+    else:
+        energy = np.add.reduceat(np.square(samples[:bounds[-1]]), seg_starts, dtype=np.float64)
+        envelope[has_audio] = np.sqrt(energy / lengths[has_audio])
+    return envelope
+
+def _stft_features(samples, sample_rate, hop, bands):
+    """
+    Runs a Hann-windowed STFT over the whole signal in batches of frames and reduces each batch right away,
+    returning per-STFT-frame band energies {name: array} and the spectral flux onset strength.
+    """
+    n_fft = _SETTINGS["n_fft"]
+    signal = torch.from_numpy(np.ascontiguousarray(samples))
+    # Centered frames, like torch.stft(center=True): frame k is centered on sample k * hop.
+    signal = torch.nn.functional.pad(signal.view(1, 1, -1), (n_fft // 2, n_fft // 2), mode='reflect' if len(samples) > n_fft // 2 else 'constant').view(-1)
+    num_frames = 1 + (len(signal) - n_fft) // hop
+    window = torch.hann_window(n_fft)
+    freqs = np.fft.rfftfreq(n_fft, 1.0 / sample_rate)
+    band_bins = [(name, torch.from_numpy((freqs >= low) & (freqs < high))) for name, low, high in bands]
+
+    energies = {name: np.empty(num_frames) for name, _, _ in bands}
+    onset = np.empty(num_frames)
+    previous = None
+    chunk = _SETTINGS["stft_chunk_frames"]
+    for k0 in range(0, num_frames, chunk):
+        k1 = min(k0 + chunk, num_frames)
+        spectrum = torch.stft(signal[k0 * hop:(k1 - 1) * hop + n_fft], n_fft, hop_length=hop, window=window, center=False, return_complex=True).abs()
+        power = spectrum.square()
+        for name, bins in band_bins:
+            energies[name][k0:k1] = power[bins].mean(dim=0).sqrt().numpy() if bins.any() else 0.0
+        # Spectral flux: how much the log spectrum rose since the previous frame, summed over frequencies.
+        log_mag = torch.log1p(spectrum)
+        prior = torch.cat((log_mag[:, :1] if previous is None else previous, log_mag[:, :-1]), dim=1)
+        onset[k0:k1] = (log_mag - prior).clamp_(min=0).sum(dim=0).numpy()
+        previous = log_mag[:, -1:]
+    return energies, onset
+
+def _to_video_frames(values, hop, sample_rate, fps, num_frames, reduce="mean"):
+    """Resamples per-STFT-frame values to video frames by pooling the STFT frames centered inside each video frame."""
+    frame_of = np.floor(np.arange(len(values)) * hop * fps / sample_rate).astype(np.int64)
+    inside = frame_of < num_frames
+    result = np.zeros(num_frames)
+    if reduce == "max": np.maximum.at(result, frame_of[inside], values[inside])
+    else:
+        counts = np.bincount(frame_of[inside], minlength=num_frames)
+        sums = np.bincount(frame_of[inside], weights=values[inside], minlength=num_frames)
+        np.divide(sums, counts, out=result, where=counts > 0)
+    return result
+
+def _normalize(values):
+    peak = values.max() if len(values) else 0.0
+    return values / peak if peak > 0 else values
+
+def _track_beats(onset, frame_rate, min_bpm=60.0, max_bpm=200.0):
+    """
+    Estimates the tempo from the onset envelope's autocorrelation and picks beats as onset peaks at
+    least about one beat apart. Returns (beat frame indices, tempo in BPM) at the onset's frame rate.
+    """
+    if len(onset) < 4 or not onset.any(): return np.array([], dtype=np.int64), 0.0
+    centered = onset - onset.mean()
+    spectrum = np.fft.rfft(centered, n=2 * len(centered))
+    autocorr = np.fft.irfft(spectrum * np.conj(spectrum))[:len(centered)]
+    min_lag, max_lag = max(1, int(frame_rate * 60.0 / max_bpm)), min(len(autocorr) - 1, int(np.ceil(frame_rate * 60.0 / min_bpm)))
+    if min_lag >= max_lag: return np.array([], dtype=np.int64), 0.0
+    period = min_lag + int(np.argmax(autocorr[min_lag:max_lag + 1]))
+    beats, _ = find_peaks(onset, distance=max(1, int(period * 0.7)), height=onset.mean() + 0.5 * onset.std())
+    return beats, 60.0 * frame_rate / period
+
+def _spectral_analysis(audio, hop, bands):
+    """
+    Returns the STFT-rate analysis of an audio input as a dict with 'num_samples', 'energies' ({band name:
+    array}), 'onset', 'beats' (STFT frame indices) and 'tempo'. It does not depend on the video fps or length,
+    so it is cached by waveform hash, sample rate, n_fft, hop and bands and shared by every caller.
+    """
+    key = (_waveform_key(audio['waveform']), audio['sample_rate'], _SETTINGS["n_fft"], hop, tuple(bands))
+    with _CACHE_LOCK:
+        if key in _CACHE:
+            _CACHE.move_to_end(key)
+            return _CACHE[key]
+
+    samples, sample_rate = to_mono(audio)
+    energies, onset = _stft_features(samples, sample_rate, hop, bands)
+    beats, tempo = _track_beats(onset, sample_rate / hop)
+    analysis = {"num_samples": len(samples), "energies": energies, "onset": onset, "beats": beats, "tempo": tempo}
+
+    with _CACHE_LOCK:
+        _CACHE[key] = analysis
+        while len(_CACHE) > _SETTINGS["cache_size"]: _CACHE.popitem(last=False)
+    return analysis
+
+def feature_bands(bass_max_hz=250.0, mid_max_hz=4000.0):
+    """Returns the bass/mid/high bands for the given edges: bass from 20 Hz, high up to the Nyquist frequency."""
+    mid_max_hz = max(mid_max_hz, bass_max_hz)
+    return (("bass", 20.0, bass_max_hz), ("mid", bass_max_hz, mid_max_hz), ("high", mid_max_hz, float('inf')))
+
+def analyze(audio, fps, num_frames=0, bands=DEFAULT_BANDS):
+    """
+    Returns the per-frame audio features of a ComfyUI AUDIO input at the given video fps, as a dict with
+    'fps', 'num_frames', 'tempo' (BPM), 'beats' (frame indices) and one float array per frame for each
+    band name plus 'onset' and 'beat_pulse' (1.0 on a beat, decaying over ~0.15 s). Arrays are normalized
+    to [0, 1]. num_frames=0 covers the whole audio. The STFT analysis is cached (see _spectral_analysis);
+    only the cheap resampling to video frames runs on every call.
+    """
+    sample_rate = audio['sample_rate']
+    hop = max(1, min(_SETTINGS["max_hop"], int(sample_rate / fps)))
+    nyquist = sample_rate / 2.0
+    bands = tuple((name, low, min(high, nyquist + 1.0)) for name, low, high in bands)
+    analysis = _spectral_analysis(audio, hop, bands)
+    if num_frames <= 0: num_frames = max(1, int(np.ceil(analysis["num_samples"] * fps / sample_rate)))
+
+    features = {"fps": fps, "num_frames": num_frames}
+    for name, values in analysis["energies"].items():
+        features[name] = _normalize(_to_video_frames(values, hop, sample_rate, fps, num_frames))
+    features["onset"] = _normalize(_to_video_frames(analysis["onset"], hop, sample_rate, fps, num_frames, reduce="max"))
+
+    # Beats are found at the STFT rate for precision, then mapped to the video frame they fall in.
+    beat_frames = np.unique(np.floor(analysis["beats"] * hop * fps / sample_rate).astype(np.int64))
+    beat_frames = beat_frames[beat_frames < num_frames]
+    frames_since = np.full(num_frames, np.inf)
+    if len(beat_frames):
+        last_beat = np.maximum.accumulate(np.where(np.isin(np.arange(num_frames), beat_frames), np.arange(num_frames), -1))
+        frames_since = np.where(last_beat >= 0, np.arange(num_frames) - last_beat, np.inf)
+    features["beat_pulse"] = np.exp(-frames_since / max(0.15 * fps, 1e-6))
+    features["beats"], features["tempo"] = beat_frames, analysis["tempo"]
+    return features
+
+def clear_cache():
+    with _CACHE_LOCK: _CACHE.clear(); _DIGESTS.clear()
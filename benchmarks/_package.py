@@ -0,0 +1,15 @@
+# Imports the node pack's modules straight from this checkout, so the benchmarks run without a ComfyUI install.
+import os
+import sys
+import types
+import importlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def load(module):
+    """Returns ComfyUI_Automation.<module>, registering the checkout as that package without running its __init__."""
+    if "ComfyUI_Automation" not in sys.modules:
+        package = types.ModuleType("ComfyUI_Automation")
+        package.__path__ = [ROOT]
+        sys.modules["ComfyUI_Automation"] = package
+    return importlib.import_module(f"ComfyUI_Automation.{module}")
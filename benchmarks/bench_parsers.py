@@ -0,0 +1,84 @@
+# Compares the scraper's HTML parser engines on a folder of saved pages.
+#
+#   python benchmarks/bench_parsers.py [fixtures_dir] [--selectors "article, main"] [--repeat 5] [--max-kb 0]
+#
+# Every .html/.htm file in fixtures_dir is parsed with each installed engine and run through the same work
+# as the scraper nodes: text and images of the whole body (Simple Web Scraper) and of the selected regions
+# after removing the ignore selectors (Targeted Web Scraper). Without a folder, a synthetic news-style page is used.
+
+import os
+import sys
+import time
+import argparse
+from _package import load
+
+nodes = load("nodes")
+
+def synthetic_page(paragraphs=4000):
+    """Returns a large page with navigation, ads and an article, similar in shape to a news site."""
+    nav = "".join(f'<li><a href="/section/{i}">Section {i}</a></li>' for i in range(200))
+    ads = "".join(f'<div class="ad-container"><img src="/ads/{i}.gif"><span>Sponsored {i}</span></div>' for i in range(200))
+    body = "".join(f'<p>Paragraph {i} of the article with <a href="/link/{i}">a link</a> and <b>some</b> <i>inline</i> markup.</p>'
+                   + (f'<figure><img data-src="/img/{i}.jpg" srcset="/img/{i}-480.jpg 480w, /img/{i}-960.jpg 960w"></figure>' if i % 20 == 0 else "")
+                   for i in range(paragraphs))
+    return f'<html><head><title>Benchmark</title></head><body><nav><ul>{nav}</ul></nav>{ads}<main><article>{body}</article></main><footer>Footer</footer></body></html>'.encode()
+
+def load_fixtures(directory):
+    if not directory: return [("synthetic.html", synthetic_page())]
+    files = sorted(f for f in os.listdir(directory) if f.lower().endswith(('.html', '.htm')))
+    if not files: sys.exit(f"No .html files found in '{directory}'.")
+    fixtures = []
+    for name in files:
+        with open(os.path.join(directory, name), 'rb') as f: fixtures.append((name, f.read()))
+    return fixtures
+
+def simple_scrape(content, engine):
+    doc, images = nodes._HtmlDocument(content, engine), nodes._ImageUrlCollector()
+    for attrs in doc.image_attrs(doc.body()): images.add_element("https://example.com/", attrs)
+    return len(doc.text(doc.body())), len(images.urls)
+
+def targeted_scrape(content, engine, selectors, ignore_selectors):
+    doc, images, chars = nodes._HtmlDocument(content, engine), nodes._ImageUrlCollector(), 0
+    doc.remove(ignore_selectors)
+    for element in doc.select(selectors):
+        chars += len(doc.text(element))
+        for attrs in doc.image_attrs(element): images.add_element("https://example.com/", attrs)
+    return chars, len(images.urls)
+
+def best_time(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter(); result = fn(); times.append(time.perf_counter() - start)
+    return min(times), result
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares the scraper HTML parser engines.")
+    parser.add_argument("fixtures_dir", nargs="?", default="")
+    parser.add_argument("--selectors", default="article, main")
+    parser.add_argument("--ignore-selectors", default="nav, footer, .ad-container")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--max-kb", type=int, default=0, help="Only parse the first N KB of each page, like the max_page_kb input.")
+    args = parser.parse_args()
+
+    engines = ["html.parser"] + (["lxml"] if nodes.LXML_AVAILABLE else []) + (["selectolax"] if nodes.SELECTOLAX_AVAILABLE else [])
+    fixtures = load_fixtures(args.fixtures_dir)
+    if args.max_kb > 0: fixtures = [(name, content[:args.max_kb * 1024]) for name, content in fixtures]
+    print(f"{len(fixtures)} page(s), {sum(len(c) for _, c in fixtures) / 1024:.0f} KB, best of {args.repeat} runs")
+
+    totals = {}
+    for name, content in fixtures:
+        print(f"\n{name} ({len(content) / 1024:.0f} KB)")
+        for engine in engines:
+            simple, (chars, image_count) = best_time(lambda: simple_scrape(content, engine), args.repeat)
+            targeted, _ = best_time(lambda: targeted_scrape(content, engine, args.selectors, args.ignore_selectors), args.repeat)
+            totals.setdefault(engine, [0.0, 0.0])
+            totals[engine][0] += simple; totals[engine][1] += targeted
+            print(f"  {engine:<12} simple {simple * 1000:8.1f} ms   targeted {targeted * 1000:8.1f} ms   ({chars} chars, {image_count} images)")
+
+    print("\nTotal")
+    baseline = totals["html.parser"]
+    for engine, (simple, targeted) in totals.items():
+        print(f"  {engine:<12} simple {simple * 1000:8.1f} ms ({baseline[0] / simple:4.1f}x)   targeted {targeted * 1000:8.1f} ms ({baseline[1] / targeted:4.1f}x)")
+
+if __name__ == "__main__":
+    main()
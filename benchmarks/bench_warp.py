@@ -0,0 +1,58 @@
+# Compares the per-frame PIL transform loop with the Batched Warp engine of Transform Paster (Batch).
+#
+#   python benchmarks/bench_warp.py [--frames 48] [--width 1920] [--height 1080]
+#
+# Every frame gets a different size, rotation and position from a keyframe track, which is the case the warp
+# engine is for. The PIL loop does what the node did per frame before the warp engine: mask, resize with
+# LANCZOS, rotate with BICUBIC and blend the result. Three overlays are timed: a full-frame still image, a
+# 512 px logo and a full-frame animated overlay with 12 distinct frames.
+
+import time
+import argparse
+import numpy as np
+import torch
+from PIL import Image
+from _package import load
+
+nodes = load("nodes")
+compositing, keyframes = load("compositing"), load("keyframes")
+
+def pil_loop(background, overlay, mask, track):
+    node = nodes.TransformPasterBatch()
+    for i in range(background.shape[0]):
+        sprite = node._prepare_overlay(overlay[i % overlay.shape[0]], mask[i % mask.shape[0]], int(track["size"][i]), float(track["rotation"][i]), Image.Resampling.LANCZOS)[0]
+        x = background.shape[2] // 2 + int(track["x_offset"][i]) - sprite.shape[1] // 2
+        y = background.shape[1] // 2 - sprite.shape[0] // 2
+        compositing.blend(background[i:i + 1], sprite, x, y)
+
+def warp(background, overlay, mask, keyframes_json):
+    nodes.TransformPasterBatch()._process_warp(background, overlay, mask, 0, background.shape[0], 100, 0.0, 0, 0, keyframes.parse_keyframes(keyframes_json))
+
+def run(name, frames, width, height, overlay_frames, overlay_h, overlay_w):
+    overlay, mask = torch.rand(overlay_frames, overlay_h, overlay_w, 3), torch.rand(overlay_frames, overlay_h, overlay_w)
+    longest = max(overlay_h, overlay_w)
+    keyframes_json = f'[{{"frame": 0, "size": {longest // 2}, "rotation": -20, "x_offset": -300}}, {{"frame": {frames - 1}, "size": {longest}, "rotation": 20, "x_offset": 300}}]'
+    track = {prop: keyframes.evaluate(keyframes.parse_keyframes(keyframes_json), prop, np.arange(frames), 0) for prop in ("size", "rotation", "x_offset")}
+    background = torch.rand(frames, height, width, 3)
+
+    start = time.perf_counter(); pil_loop(background, overlay, mask, track); pil_seconds = time.perf_counter() - start
+    start = time.perf_counter(); warp(background, overlay, mask, keyframes_json); warp_seconds = time.perf_counter() - start
+    print(f"\n{name}")
+    print(f"  per-frame PIL   {pil_seconds:7.2f} s   {pil_seconds / frames * 1000:7.1f} ms/frame")
+    print(f"  batched warp    {warp_seconds:7.2f} s   {warp_seconds / frames * 1000:7.1f} ms/frame")
+    print(f"  speed-up        {pil_seconds / warp_seconds:7.1f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares PIL transforms and the batched warp engine.")
+    parser.add_argument("--frames", type=int, default=48)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    args = parser.parse_args()
+    torch.manual_seed(0)
+    print(f"{args.frames} frames at {args.width}x{args.height}, {torch.get_num_threads()} torch thread(s)")
+    run("Full-frame still overlay", args.frames, args.width, args.height, 1, args.height, args.width)
+    run("512 px logo", args.frames, args.width, args.height, 1, 512, 512)
+    run("Full-frame animated overlay (12 frames)", args.frames, args.width, args.height, 12, args.height, args.width)
+
+if __name__ == "__main__":
+    main()
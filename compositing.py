@@ -0,0 +1,171 @@
+# Contains the shared compositing core used by the text and overlay nodes. Frames stay float tensors
+# the whole time; only the small overlay/text sprite is ever drawn with PIL, and it is blended into the
+# affected region of the frame batch with a single tensor operation.
+
+# --- IMPORTS ---
+import math
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+# Output pixels sampled per batched warp call (frames x region area). Bounds the sampling grid's memory.
+WARP_PIXEL_BUDGET = 4_000_000
+
+def pil_to_sprite(image, premultiplied=False, crop=True):
+    """
+    Converts an RGBA PIL image into a premultiplied float sprite of shape (h, w, 4).
+    Returns (sprite, x, y) where (x, y) is the sprite's offset inside the image, or None if it
+    has no visible pixels. Set premultiplied=True for layers that were drawn with opaque inks
+    onto transparent black, whose color bands already carry the coverage.
+    """
+    if image.mode != "RGBA": image = image.convert("RGBA")
+    x = y = 0
+    if crop:
+        bbox = image.getchannel("A").getbbox()
+        if bbox is None: return None
+        if bbox != (0, 0, image.width, image.height): image = image.crop(bbox)
+        x, y = bbox[0], bbox[1]
+    sprite = torch.from_numpy(np.asarray(image, dtype=np.float32) / 255.0)
+    if not premultiplied: sprite[..., :3] *= sprite[..., 3:]
+    return sprite, x, y
+
+def trim(sprite, x, y):
+    """
+    Crops an (h, w, 4) sprite placed at (x, y) to the rows and columns that have any alpha,
+    so blending never touches fully transparent pixels. Returns (sprite, x, y) or None if empty.
+    """
+    alpha = sprite[..., 3] > 0
+    rows, cols = torch.nonzero(alpha.any(dim=1)).flatten(), torch.nonzero(alpha.any(dim=0)).flatten()
+    if rows.numel() == 0: return None
+    y0, y1, x0, x1 = int(rows[0]), int(rows[-1]) + 1, int(cols[0]), int(cols[-1]) + 1
+    if (y0, x0, y1, x1) == (0, 0, sprite.shape[0], sprite.shape[1]): return sprite, x, y
+    return sprite[y0:y1, x0:x1], x + x0, y + y0
+
+def straight_to_premultiplied(sprite):
+    """Returns a copy of a straight-alpha (..., h, w, 4) float sprite with its colors multiplied by alpha."""
+    sprite = sprite.clone()
+    sprite[..., :3] *= sprite[..., 3:]
+    return sprite
+
+def image_mask_to_sprite(image, mask):
+    """Builds a premultiplied (..., h, w, 4) sprite from an IMAGE tensor (..., h, w, 3) and a MASK tensor (..., h, w)."""
+    alpha = mask.unsqueeze(-1).to(image.dtype)
+    return torch.cat((image[..., :3] * alpha, alpha), dim=-1)
+
+def clip_region(frame_w, frame_h, x, y, w, h):
+    """
+    Clips a w x h box placed at (x, y) against a frame_w x frame_h frame. Returns the frame
+    slice and the matching sprite slice as (frame_ys, frame_xs, sprite_ys, sprite_xs), or None.
+    """
+    x0, y0, x1, y1 = max(x, 0), max(y, 0), min(x + w, frame_w), min(y + h, frame_h)
+    if x0 >= x1 or y0 >= y1: return None
+    return slice(y0, y1), slice(x0, x1), slice(y0 - y, y1 - y), slice(x0 - x, x1 - x)
+
+def blend(frames, sprite, x, y):
+    """
+    Composites a premultiplied RGBA sprite over a (B, H, W, 3) frame batch in place, with the
+    sprite's top-left corner at (x, y) and clipped to the frame. The sprite is either one
+    (h, w, 4) image shared by every frame or a (B, h, w, 4) batch with one sprite per frame.
+    Only the covered region of the frames is read and written.
+    """
+    region = clip_region(frames.shape[2], frames.shape[1], int(x), int(y), sprite.shape[-2], sprite.shape[-3])
+    if region is None: return frames
+    frame_ys, frame_xs, sprite_ys, sprite_xs = region
+    s = sprite[..., sprite_ys, sprite_xs, :].to(device=frames.device, dtype=frames.dtype)
+    target = frames[:, frame_ys, frame_xs, :]
+    target.mul_(1.0 - s[..., 3:]).add_(s[..., :3])
+    return frames
+
+def warp_boxes(width, height, center_x, center_y, scale_x, scale_y, angle):
+    """
+    Returns the integer bounding boxes (x0, y0, x1, y1), as four arrays, of a width x height sprite
+    scaled by (scale_x, scale_y), rotated by angle degrees and centered at (center_x, center_y).
+    """
+    rad = np.radians(angle); c, s = np.abs(np.cos(rad)), np.abs(np.sin(rad))
+    half_w, half_h = width * np.asarray(scale_x) / 2.0, height * np.asarray(scale_y) / 2.0
+    extent_x, extent_y = c * half_w + s * half_h, s * half_w + c * half_h
+    return (np.floor(center_x - extent_x).astype(int), np.floor(center_y - extent_y).astype(int),
+            np.ceil(center_x + extent_x).astype(int), np.ceil(center_y + extent_y).astype(int))
+
+def mip_level(scale):
+    """
+    Returns the pyramid level each sprite drawn at `scale` is filtered to before warping. Level L halves the
+    sprite L times, which keeps it at least as large as it is drawn but less than twice as large, so bilinear
+    sampling never skips source pixels (which aliases when shrinking).
+    """
+    return np.floor(np.log2(1.0 / np.clip(np.asarray(scale, dtype=np.float64), 1e-6, 1.0))).astype(int)
+
+def mip_size(width, height, level):
+    """Returns the (w, h) of a width x height sprite at a pyramid level."""
+    return (max(1, math.ceil(width / 2 ** level)), max(1, math.ceil(height / 2 ** level)))
+
+def prefilter(sprites, size):
+    """Area-filters (B, h, w, 4) sprites down to size=(w, h). Returns them as they are if already that size."""
+    if (sprites.shape[2], sprites.shape[1]) == tuple(size): return sprites
+    source = F.interpolate(sprites.permute(0, 3, 1, 2), size=(size[1], size[0]), mode='bilinear', antialias=True, align_corners=False)
+    return source.permute(0, 2, 3, 1)
+
+def _warp_chunk(frames, source, center_x, center_y, scale_x, scale_y, angle, opacity, box):
+    x0, y0, x1, y1 = box
+    region_w, region_h = x1 - x0, y1 - y0
+    batch, src_h, src_w = frames.shape[0], source.shape[2], source.shape[3]
+    # A single shared sprite is broadcast to every frame of the chunk.
+    if source.shape[0] != batch: source = source.expand(batch, -1, -1, -1)
+
+    # theta maps the region's normalized output coordinates to the sprite's normalized input coordinates:
+    # back to frame pixels, relative to the center, un-rotate, un-scale.
+    rad = torch.as_tensor(np.radians(angle), dtype=torch.float64); c, s = torch.cos(rad), torch.sin(rad)
+    ax = 2.0 / torch.as_tensor(src_w * scale_x, dtype=torch.float64); ay = 2.0 / torch.as_tensor(src_h * scale_y, dtype=torch.float64)
+    off_x = torch.as_tensor(region_w / 2.0 + x0 - center_x, dtype=torch.float64); off_y = torch.as_tensor(region_h / 2.0 + y0 - center_y, dtype=torch.float64)
+    theta = torch.stack((
+        torch.stack((ax * c * region_w / 2.0, -ax * s * region_h / 2.0, ax * (c * off_x - s * off_y)), dim=-1),
+        torch.stack((ay * s * region_w / 2.0, ay * c * region_h / 2.0, ay * (s * off_x + c * off_y)), dim=-1),
+    ), dim=1).to(device=source.device, dtype=source.dtype)
+    grid = F.affine_grid(theta, (batch, 4, region_h, region_w), align_corners=False)
+    warped = F.grid_sample(source, grid, mode='bilinear', padding_mode='zeros', align_corners=False).permute(0, 2, 3, 1)
+    if (opacity < 1.0).any(): warped.mul_(torch.as_tensor(opacity, dtype=warped.dtype, device=warped.device).view(-1, 1, 1, 1))
+    target = frames[:, y0:y1, x0:x1, :]
+    target.mul_(1.0 - warped[..., 3:]).add_(warped[..., :3])
+
+def warp_blend(frames, sprites, center_x, center_y, scale_x, scale_y, angle, opacity, source_size=None):
+    """
+    Composites a batch of premultiplied (B, h, w, 4) sprites, or one (1, h, w, 4) sprite shared by
+    every frame, over a (B, H, W, 3) frame batch in place. Each is scaled by (scale_x, scale_y), rotated
+    counter-clockwise by angle degrees (like PIL's rotate), centered at (center_x, center_y) in frame
+    pixels and faded by opacity. The per-frame parameters are arrays of length B. Frames are warped in batched affine_grid/grid_sample calls over the union of
+    their boxes, in chunks that keep the sampling grid within WARP_PIXEL_BUDGET.
+    Sprites are filtered to their mip_level first. Sprites the caller already filtered are given with the
+    (w, h) they had before as source_size; the scales stay relative to that size.
+    """
+    num_frames, frame_h, frame_w = frames.shape[0], frames.shape[1], frames.shape[2]
+    params = [np.array(np.broadcast_to(np.asarray(p, dtype=np.float64), (num_frames,))) for p in (center_x, center_y, scale_x, scale_y, angle, opacity)]
+    width, height = source_size or (sprites.shape[2], sprites.shape[1])
+    x0, y0, x1, y1 = warp_boxes(width, height, *params[:5])
+    x0, y0, x1, y1 = np.maximum(x0, 0), np.maximum(y0, 0), np.minimum(x1, frame_w), np.minimum(y1, frame_h)
+    visible = (x0 < x1) & (y0 < y1) & (params[5] > 0)
+    shared = sprites.shape[0] != num_frames
+    levels = np.zeros(num_frames, dtype=int) if source_size else mip_level(np.maximum(params[2], params[3]))
+    # A shared sprite is filtered once per level and reused by every chunk drawn at that level.
+    shared_levels = {}
+
+    start = 0
+    while start < num_frames:
+        if not visible[start]: start += 1; continue
+        end, box = start + 1, (x0[start], y0[start], x1[start], y1[start])
+        # Grow the chunk while the frames share a level and the union box times the frame count stays within the budget.
+        while end < num_frames and visible[end] and levels[end] == levels[start]:
+            union = (min(box[0], x0[end]), min(box[1], y0[end]), max(box[2], x1[end]), max(box[3], y1[end]))
+            if (end + 1 - start) * (union[2] - union[0]) * (union[3] - union[1]) > WARP_PIXEL_BUDGET: break
+            box, end = union, end + 1
+        chunk = slice(start, end)
+        if source_size: source = sprites[:1] if shared else sprites[chunk]
+        elif shared:
+            level = int(levels[start])
+            if level not in shared_levels: shared_levels[level] = prefilter(sprites[:1], mip_size(width, height, level))
+            source = shared_levels[level]
+        else: source = prefilter(sprites[chunk], mip_size(width, height, int(levels[start])))
+        chunk_params = [p[chunk] for p in params]
+        chunk_params[2], chunk_params[3] = chunk_params[2] * width / source.shape[2], chunk_params[3] * height / source.shape[1]
+        _warp_chunk(frames[chunk], source.permute(0, 3, 1, 2), *chunk_params, tuple(int(v) for v in box))
+        start = end
+    return frames
@@ -0,0 +1,135 @@
+# Contains the process-wide font registry used by the text nodes. System font folders are scanned once and
+# only rescanned when one of them changes (checked by directory mtime), and loaded FreeType fonts are pooled
+# by (path, size) so repeated queue runs do not re-open and re-parse the same font files.
+
+# --- IMPORTS ---
+import os
+import threading
+from collections import OrderedDict
+from PIL import ImageFont
+
+# Always offered in the font list, even when they are not installed, to keep existing workflows loadable.
+DEFAULT_FONT_FILES = ["arial.ttf", "verdana.ttf", "tahoma.ttf", "cour.ttf", "times.ttf", "DejaVuSans.ttf", "LiberationSans-Regular.ttf"]
+FALLBACK_FONT = "DejaVuSans.ttf"
+
+_SETTINGS = {
+    # Also index fonts in sub-folders (e.g. /usr/share/fonts/truetype/dejavu/). Can be enabled with COMFYUI_AUTOMATION_FONTS_RECURSIVE=1.
+    "recursive": os.environ.get("COMFYUI_AUTOMATION_FONTS_RECURSIVE", "0") == "1",
+    # Also index OpenType (.otf) and TrueType collection (.ttc) files. Can be enabled with COMFYUI_AUTOMATION_FONTS_ALL_FORMATS=1.
+    "all_formats": os.environ.get("COMFYUI_AUTOMATION_FONTS_ALL_FORMATS", "0") == "1",
+    "pool_size": 64,  # Number of loaded (path, size) fonts kept open.
+}
+
+def get_font_dirs():
+    """Returns the system font folders that are searched, in priority order."""
+    font_dirs = []
+    if os.name == 'nt': font_dirs.append(os.path.join(os.environ.get('WINDIR', 'C:\\Windows'), 'Fonts'))
+    elif os.name == 'posix': font_dirs.extend(['/usr/share/fonts/truetype/', '/usr/local/share/fonts/', '~/.fonts/', '/System/Library/Fonts/', '/Library/Fonts/'])
+    return [os.path.expanduser(d) for d in font_dirs]
+
+class FontRegistry:
+    """
+    Index of font file names to paths across the system font folders. The first folder
+    that contains a name wins, like a direct lookup in each folder would. The index is
+    rebuilt only when a scanned folder's mtime changes (a font was added or removed).
+    """
+    def __init__(self, directories=None, recursive=False, extensions=('.ttf',)):
+        self.directories = directories if directories is not None else get_font_dirs()
+        self.recursive = recursive
+        self.extensions = tuple(extensions)
+        self._index = {}
+        self._mtimes = None
+        self._lock = threading.Lock()
+
+    def _scan(self):
+        index, mtimes = {}, {}
+        for directory in self.directories:
+            if not os.path.isdir(directory): continue
+            walker = os.walk(directory) if self.recursive else [(directory, None, None)]
+            for folder, _, files in walker:
+                try:
+                    mtimes[folder] = os.stat(folder).st_mtime_ns
+                    if files is None: files = os.listdir(folder)
+                except OSError: continue
+                for f in files:
+                    if f.lower().endswith(self.extensions): index.setdefault(f, os.path.join(folder, f))
+        # Missing folders are remembered too, so that creating one triggers a rescan.
+        for directory in self.directories: mtimes.setdefault(directory, None)
+        return index, mtimes
+
+    def _is_stale(self):
+        if self._mtimes is None: return True
+        for folder, mtime in self._mtimes.items():
+            try: current = os.stat(folder).st_mtime_ns
+            except OSError: current = None
+            if current != mtime: return True
+        return False
+
+    def refresh(self, force=False):
+        """Rescans the font folders if any of them changed since the last scan (or always, with force=True)."""
+        with self._lock:
+            if force or self._is_stale():
+                self._index, self._mtimes = self._scan()
+            return self._index
+
+    def font_names(self):
+        """Returns the sorted font names offered by the text nodes."""
+        return sorted(set(DEFAULT_FONT_FILES) | set(self.refresh()))
+
+    def find(self, font_name):
+        """Returns the full path of an installed font, or None. A path that was already resolved is returned as is."""
+        if os.path.isabs(font_name) and os.path.isfile(font_name): return font_name
+        return self.refresh().get(font_name)
+
+_REGISTRY = None
+_REGISTRY_LOCK = threading.Lock()
+_FONT_POOL = OrderedDict()
+_POOL_LOCK = threading.Lock()
+
+def configure(recursive=None, all_formats=None, pool_size=None):
+    """Changes the scan and pool settings. The index is rebuilt on its next use."""
+    global _REGISTRY
+    with _REGISTRY_LOCK:
+        for key, value in (("recursive", recursive), ("all_formats", all_formats), ("pool_size", pool_size)):
+            if value is not None: _SETTINGS[key] = value
+        _REGISTRY = None
+
+def get_registry():
+    """Returns the process-wide FontRegistry, creating it on first use."""
+    global _REGISTRY
+    with _REGISTRY_LOCK:
+        if _REGISTRY is None:
+            extensions = ('.ttf', '.otf', '.ttc') if _SETTINGS["all_formats"] else ('.ttf',)
+            _REGISTRY = FontRegistry(recursive=_SETTINGS["recursive"], extensions=extensions)
+        return _REGISTRY
+
+def list_fonts():
+    return get_registry().font_names()
+
+def find_font(font_name):
+    """Returns the path of a font by file name, falling back to DejaVuSans.ttf like the nodes always have."""
+    path = get_registry().find(font_name)
+    if path: return path
+    print(f"ComfyUI_Automation: Font '{font_name}' not found. Falling back to default."); return FALLBACK_FONT
+
+def load_font(path, size):
+    """
+    Returns a pooled FreeTypeFont for (path, size), loading it on first use. Raises IOError
+    like ImageFont.truetype if the file cannot be loaded.
+    """
+    key = (path, size)
+    with _POOL_LOCK:
+        font = _FONT_POOL.get(key)
+        if font is not None:
+            _FONT_POOL.move_to_end(key)
+            return font
+    font = ImageFont.truetype(path, size)
+    with _POOL_LOCK:
+        _FONT_POOL[key] = font
+        while len(_FONT_POOL) > _SETTINGS["pool_size"]: _FONT_POOL.popitem(last=False)
+    return font
+
+def get_font(font_name, size):
+    """Finds and loads a font by file name, falling back to Pillow's default font if it cannot be loaded."""
+    try: return load_font(find_font(font_name), size)
+    except IOError: return ImageFont.load_default()
@@ -0,0 +1,98 @@
+# Contains the shared HTTP client used by all network nodes: keep-alive connection pooling per host,
+# retries with backoff and compressed transfers. Reusing one session avoids a new TCP/TLS handshake per URL.
+
+# --- IMPORTS ---
+import threading
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util import Retry, make_headers
+
+# urllib3 only advertises brotli/zstd when a decoder is installed (pip install brotli), so this is always safe to send.
+ACCEPT_ENCODING = make_headers(accept_encoding=True)['accept-encoding']
+DEFAULT_HEADERS = {'User-Agent': 'Mozilla/5.0', 'Accept-Encoding': ACCEPT_ENCODING}
+
+# Only idempotent requests are retried; a webhook POST is never sent twice.
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+_SETTINGS = {
+    "pool_connections": 32,  # Number of hosts that keep a connection pool.
+    "pool_maxsize": 16,      # Keep-alive connections per host.
+    "retries": 3,
+    "backoff_factor": 0.5,
+}
+_SESSION = None
+_LOCK = threading.Lock()
+
+# Counters are kept here rather than read from the pools, because the pool manager drops the pools of
+# least recently used hosts (and their counts) once more than pool_connections hosts were contacted.
+_STATS = {"requests": 0, "connections_opened": 0}
+_HOSTS = set()
+_STATS_LOCK = threading.Lock()
+
+def _count_connection():
+    with _STATS_LOCK: _STATS["connections_opened"] += 1
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        _count_connection()
+        return super()._new_conn()
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        _count_connection()
+        return super()._new_conn()
+
+class _CountingAdapter(HTTPAdapter):
+    """HTTPAdapter that counts the requests it sends and the connections its pools open."""
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": _CountingHTTPConnectionPool, "https": _CountingHTTPSConnectionPool}
+
+    def send(self, request, **kwargs):
+        with _STATS_LOCK:
+            _STATS["requests"] += 1; _HOSTS.add(urlparse(request.url).netloc.lower())
+        return super().send(request, **kwargs)
+
+def configure(pool_connections=None, pool_maxsize=None, retries=None, backoff_factor=None):
+    """Changes the pool and retry settings. The shared session is rebuilt on its next use."""
+    global _SESSION
+    with _LOCK:
+        for key, value in (("pool_connections", pool_connections), ("pool_maxsize", pool_maxsize), ("retries", retries), ("backoff_factor", backoff_factor)):
+            if value is not None: _SETTINGS[key] = value
+        if _SESSION is not None: _SESSION.close()
+        _SESSION = None
+
+def get_session():
+    """Returns the process-wide requests.Session, creating it on first use."""
+    global _SESSION
+    with _LOCK:
+        if _SESSION is None:
+            retry = Retry(total=_SETTINGS["retries"], read=1, backoff_factor=_SETTINGS["backoff_factor"],
+                          status_forcelist=RETRY_STATUS_CODES, allowed_methods=frozenset(["GET", "HEAD", "OPTIONS"]), raise_on_status=False)
+            adapter = _CountingAdapter(pool_connections=_SETTINGS["pool_connections"], pool_maxsize=_SETTINGS["pool_maxsize"], max_retries=retry)
+            session = requests.Session()
+            session.headers.update(DEFAULT_HEADERS)
+            session.mount("http://", adapter); session.mount("https://", adapter)
+            _SESSION = session
+        return _SESSION
+
+def get(url, **kwargs):
+    return get_session().get(url, **kwargs)
+
+def post(url, **kwargs):
+    return get_session().post(url, **kwargs)
+
+def get_stats():
+    """
+    Returns connection counters since the process started:
+    {'hosts', 'requests', 'connections_opened', 'connections_reused'}.
+    """
+    with _STATS_LOCK:
+        hosts, sent, opened = len(_HOSTS), _STATS["requests"], _STATS["connections_opened"]
+    return {"hosts": hosts, "requests": sent, "connections_opened": opened, "connections_reused": max(0, sent - opened)}
+
+def format_stats():
+    stats = get_stats()
+    return f"HTTP pool: {stats['requests']} requests to {stats['hosts']} hosts, {stats['connections_opened']} connections opened, {stats['connections_reused']} reused."
@@ -0,0 +1,56 @@
+# Contains the keyframe tracks used by the animated transform nodes. Keyframes are given as a JSON list and
+# every property is evaluated for a whole range of frames at once with numpy, so animating a long timeline
+# costs one vectorized interpolation per property instead of per-frame Python work.
+
+# --- IMPORTS ---
+import json
+import numpy as np
+
+# Easing curves map the progress t in [0, 1] through a segment to the interpolation weight.
+EASINGS = {
+    "linear": lambda t: t,
+    "ease_in": lambda t: t * t,
+    "ease_out": lambda t: 1.0 - (1.0 - t) ** 2,
+    "ease_in_out": lambda t: t * t * (3.0 - 2.0 * t),
+    "hold": lambda t: np.zeros_like(t),
+}
+
+def parse_keyframes(text):
+    """
+    Parses a JSON list of keyframes such as [{"frame": 0, "x_offset": -300, "easing": "ease_out"}, {"frame": 24, "x_offset": 0}].
+    Each keyframe needs a "frame" and any of the animated properties; "easing" shapes the segment that starts
+    at that keyframe. Returns the keyframes sorted by frame. Raises ValueError on malformed input.
+    """
+    if not text or not text.strip(): return []
+    try: data = json.loads(text)
+    except json.JSONDecodeError as e: raise ValueError(f"Keyframes are not valid JSON: {e}")
+    if isinstance(data, dict): data = [data]
+    if not isinstance(data, list) or not all(isinstance(k, dict) and "frame" in k for k in data):
+        raise ValueError("Keyframes must be a list of objects that each have a 'frame'.")
+    for k in data:
+        easing = k.get("easing", "linear")
+        if easing not in EASINGS: raise ValueError(f"Unknown easing '{easing}'. Use one of: {', '.join(EASINGS)}.")
+    return sorted(data, key=lambda k: k["frame"])
+
+def evaluate(keyframes, prop, frames, default):
+    """
+    Returns the value of one property at each of the given frames as a float64 array. Only keyframes that
+    set the property form its track; it holds its first/last value outside them and is `default` without any.
+    """
+    frames = np.asarray(frames, dtype=np.float64)
+    track = [k for k in keyframes if prop in k]
+    if not track: return np.full(frames.shape, float(default))
+    times = np.array([k["frame"] for k in track], dtype=np.float64)
+    values = np.array([float(k[prop]) for k in track], dtype=np.float64)
+    if len(track) == 1: return np.full(frames.shape, values[0])
+
+    segment = np.clip(np.searchsorted(times, frames, side='right') - 1, 0, len(track) - 2)
+    t0, t1 = times[segment], times[segment + 1]
+    t = np.clip((frames - t0) / np.maximum(t1 - t0, 1e-9), 0.0, 1.0)
+    weight = np.empty_like(t)
+    for i, k in enumerate(track[:-1]):
+        in_segment = segment == i
+        if in_segment.any(): weight[in_segment] = EASINGS[k.get("easing", "linear")](t[in_segment])
+    result = values[segment] + (values[segment + 1] - values[segment]) * weight
+    result[frames >= times[-1]] = values[-1]
+    return result
@@ -5,9 +5,10 @@ import platform # Import platform to detect the OS
 import feedparser
 import re
 import json
-import requests
+import hashlib
+import traceback
 from bs4 import BeautifulSoup
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlparse
 from PIL import Image, ImageDraw, ImageFont, ImageOps, ImageFilter
 import numpy as np
 import torch
@@ -24,6 +25,19 @@ from botocore.exceptions import NoCredentialsError, PartialCredentialsError
 import datetime
 from pytz import timezone, utc
 import gc
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import torch.multiprocessing
+import runpy
+from .persistent_cache import get_feed_cache, get_seen_index, get_image_cache
+from . import http_client
+from . import compositing
+from .text_layout import TextLayout, font_key
+from . import font_registry
+from . import sprite_cache
+from . import video_io
+from . import keyframes
+from . import audio_features
 
 try:
     import psutil
@@ -32,6 +46,22 @@ except ImportError:
     PSUTIL_AVAILABLE = False
     print("MemoryPurge Node: `psutil` library not found. RAM usage will not be reported. To enable, run: pip install psutil")
 
+try:
+    import lxml
+    LXML_AVAILABLE = True
+except ImportError:
+    LXML_AVAILABLE = False
+
+try:
+    from selectolax.lexbor import LexborHTMLParser as FastHTMLParser
+    SELECTOLAX_AVAILABLE = True
+except ImportError:
+    try:
+        from selectolax.parser import HTMLParser as FastHTMLParser
+        SELECTOLAX_AVAILABLE = True
+    except ImportError:
+        SELECTOLAX_AVAILABLE = False
+
 try:
     from tqdm import tqdm
     TQDM_AVAILABLE = True
@@ -39,11 +69,36 @@ except ImportError:
     TQDM_AVAILABLE = False
     print("ComfyUI_Automation: `tqdm` library not found. Progress bars will use console output. To enable, run: pip install tqdm")
 
+def _map_ordered(fn, items, max_workers=1, key=None, per_key_limit=0):
+    """
+    Runs `fn` over `items` on a bounded thread pool and returns a list of
+    (result, error) tuples in the same order as `items`. With max_workers <= 1
+    everything runs inline, which keeps the old sequential behaviour.
+    If `key` and `per_key_limit` are given, at most `per_key_limit` items with the
+    same key (e.g. the same host) run at the same time.
+    """
+    limits, limits_lock = {}, threading.Lock()
+    def _call(item):
+        limit = None
+        if key is not None and per_key_limit > 0:
+            with limits_lock: limit = limits.setdefault(key(item), threading.Semaphore(per_key_limit))
+            limit.acquire()
+        try: return (fn(item), None)
+        except Exception as e: return (None, e)
+        finally:
+            if limit is not None: limit.release()
+    if max_workers <= 1 or len(items) <= 1:
+        return [_call(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        return list(executor.map(_call, items))
+
+def _url_host(url): return urlparse(url).netloc.lower()
+
 # --- RSS FEEDER NODE ---
 class RssFeedReader:
     CATEGORY = "⚫mimikry/Automation/RSS"
-    RETURN_TYPES = ("STRING", "STRING", "STRING", "STRING")
-    RETURN_NAMES = ("raw_output_batch", "formatted_text_batch", "content_batch_1", "content_batch_2")
+    RETURN_TYPES = ("STRING", "STRING", "STRING", "STRING", "STRING")
+    RETURN_NAMES = ("raw_output_batch", "formatted_text_batch", "content_batch_1", "content_batch_2", "cache_stats")
     FUNCTION = "read_feed"
 
     @classmethod
@@ -55,87 +110,249 @@ class RssFeedReader:
             "batch_source_1": (["title", "summary", "link"], {"default": "title", "tooltip": "Select the content for the first batch output."}),
             "batch_source_2": (["title", "summary", "link"], {"default": "summary", "tooltip": "Select the content for the second batch output."}),
             "output_mode": (["Concatenated String", "Batch Output"], {"default": "Batch Output", "tooltip": "Batch Output: Return lists for all outputs. Concatenated String: Join raw/formatted text into single strings."}),
+        },
+        "optional": {
+            "fetch_mode": (["Concurrent", "Sequential"], {"default": "Concurrent", "tooltip": "Concurrent: Download all feeds in parallel on a bounded worker pool. Sequential: Download one feed after another. Entries are returned in input order either way."}),
+            "max_workers": ("INT", {"default": 8, "min": 1, "max": 64, "step": 1, "tooltip": "Maximum number of feeds downloaded at the same time in Concurrent mode."}),
+            "feed_timeout": ("FLOAT", {"default": 15.0, "min": 1.0, "max": 300.0, "step": 0.5, "tooltip": "Network timeout in seconds for each feed. A slow feed is skipped instead of stalling the whole run."}),
+            "use_cache": ("BOOLEAN", {"default": False, "tooltip": "Keep an on-disk copy of every feed (in this node pack's cache/feeds/feed_cache.json, bounded by cache_ttl_hours and cache_max_feeds) and only re-download it when the server reports a change (ETag / Last-Modified). Off by default."}),
+            "cache_ttl_hours": ("FLOAT", {"default": 24.0, "min": 0.0, "max": 8760.0, "step": 0.5, "tooltip": "Cached feeds that were not used for this many hours are dropped."}),
+            "cache_max_feeds": ("INT", {"default": 500, "min": 1, "max": 100000, "step": 1, "tooltip": "Maximum number of feeds kept in the cache. The least recently used feeds are dropped first."}),
+            "only_new_entries": ("BOOLEAN", {"default": False, "tooltip": "Only return entries that this node has not returned before. Seen entry IDs are remembered on disk for each feed."}),
+            "seen_index_limit": ("INT", {"default": 10000, "min": 100, "max": 1000000, "step": 100, "tooltip": "Maximum number of seen entry IDs remembered for each feed. The oldest IDs are forgotten first."}),
         }}
     
     def clean_html(self, r): return re.sub(re.compile('<.*?>'), '', r if r else "")
+
+    def _entry_key(self, entry):
+        key = entry.get('id') or entry.get('guid') or entry.get('link') or entry.get('title')
+        if key: return str(key)
+        # Entries without any identifying field are told apart by their content instead of all sharing one key.
+        return "sha1:" + hashlib.sha1(json.dumps(entry, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def _fetch_entries(self, url, timeout, cache):
+        """Returns (entries, cache_hit) for a single feed. cache_hit is None for feeds that are not fetched over HTTP."""
+        # Local files and raw XML strings are handed to feedparser directly and never touch the cache.
+        if not url.startswith(('http://', 'https://')): return feedparser.parse(url).entries, None
+        request_headers, cached = {}, cache.get(url) if cache else None
+        if cached:
+            if cached.get('etag'): request_headers['If-None-Match'] = cached['etag']
+            if cached.get('modified'): request_headers['If-Modified-Since'] = cached['modified']
+        r = http_client.get(url, headers=request_headers, timeout=timeout)
+        if r.status_code == 304 and cached:
+            cache.mark_hit(url); return cached['entries'], True
+        r.raise_for_status()
+        # feedparser uses the headers for encoding detection and for resolving relative links.
+        headers = {k.lower(): v for k, v in r.headers.items()}; headers.setdefault('content-location', r.url)
+        entries = feedparser.parse(r.content, response_headers=headers).entries
+        if cache: cache.put(url, headers.get('etag'), headers.get('last-modified'), json.loads(json.dumps(entries, default=str)))
+        return entries, False
     
-    def read_feed(self, links, max_entries, skip_entries, batch_source_1, batch_source_2, output_mode):
+    def read_feed(self, links, max_entries, skip_entries, batch_source_1, batch_source_2, output_mode, fetch_mode="Concurrent", max_workers=8, feed_timeout=15.0, use_cache=False, cache_ttl_hours=24.0, cache_max_feeds=500, only_new_entries=False, seen_index_limit=10000):
         urls, raw, fmt, b1, b2 = [u.strip() for u in links.splitlines() if u.strip()], [], [], [], []
-        for url in urls:
+        cache = get_feed_cache() if use_cache else None
+        if cache: cache.ttl, cache.max_feeds = cache_ttl_hours * 3600.0, cache_max_feeds
+        seen_index = get_seen_index() if only_new_entries else None
+        if seen_index: seen_index.max_per_feed = seen_index_limit
+        workers = max_workers if fetch_mode == "Concurrent" else 1
+        results = _map_ordered(lambda u: self._fetch_entries(u, feed_timeout, cache), urls, workers)
+        hits = misses = 0
+        for url, (result, error) in zip(urls, results):
+            if error is not None: print(f"ComfyUI_Automation: RSS Error on {url}: {error}"); continue
             try:
-                feed = feedparser.parse(url)
-                for entry in feed.entries[skip_entries:skip_entries+max_entries]:
-                    raw.append(json.dumps(entry, indent=2)); t, l, s_html = getattr(entry,'title',''), getattr(entry,'link',''), getattr(entry,'summary','')
+                entries, cache_hit = result
+                if cache_hit: hits += 1
+                elif cache_hit is not None: misses += 1
+                if seen_index:
+                    # Drop entries returned by an earlier run, then page through what is left.
+                    keys = [self._entry_key(e) for e in entries]
+                    entries = [e for e, new in zip(entries, seen_index.unseen(url, keys)) if new]
+                entries = entries[skip_entries:skip_entries+max_entries]
+                if seen_index: seen_index.mark_seen(url, [self._entry_key(e) for e in entries])
+                # Cached entries come back from disk as plain dicts, so read fields with .get() in both cases.
+                for entry in entries:
+                    raw.append(json.dumps(entry, indent=2, default=str)); t, l, s_html = entry.get('title',''), entry.get('link',''), entry.get('summary','')
                     fmt.append(f"Title: {t}\nLink: {l}\nSummary: {self.clean_html(s_html)}\n---")
-                    v1 = getattr(entry, batch_source_1, ''); b1.append(self.clean_html(v1) if batch_source_1 == 'summary' else v1)
-                    v2 = getattr(entry, batch_source_2, ''); b2.append(self.clean_html(v2) if batch_source_2 == 'summary' else v2)
+                    v1 = entry.get(batch_source_1, ''); b1.append(self.clean_html(v1) if batch_source_1 == 'summary' else v1)
+                    v2 = entry.get(batch_source_2, ''); b2.append(self.clean_html(v2) if batch_source_2 == 'summary' else v2)
             except Exception as e: print(f"ComfyUI_Automation: RSS Error: {e}")
-        if output_mode == "Concatenated String": return ("\n---\n".join(raw), "\n".join(fmt), b1, b2)
-        else: return (raw, fmt, b1, b2)
+        stats = f"This run: {hits} hits, {misses} misses. " + (cache.stats() if cache else "Feed cache disabled.")
+        if cache: cache.save(); print(f"RssFeedReader: {stats}")
+        if output_mode == "Concatenated String": return ("\n---\n".join(raw), "\n".join(fmt), b1, b2, stats)
+        else: return (raw, fmt, b1, b2, stats)
 
 # --- WEB SCRAPER NODES ---
+# Shared by both scrapers: how a batch of URLs is fetched and parsed.
+SCRAPER_EXECUTION_INPUTS = {
+    "execution_mode": (["Parallel", "Sequential"], {"default": "Parallel", "tooltip": "Parallel: Scrape several URLs at once. Sequential: Scrape one URL after another. Results are returned in input order either way."}),
+    "max_workers": ("INT", {"default": 8, "min": 1, "max": 64, "step": 1, "tooltip": "Maximum number of URLs scraped at the same time in Parallel mode."}),
+    "per_host_limit": ("INT", {"default": 2, "min": 1, "max": 64, "step": 1, "tooltip": "Maximum number of simultaneous requests to the same website, to stay polite."}),
+    "timeout": ("FLOAT", {"default": 10.0, "min": 1.0, "max": 300.0, "step": 0.5, "tooltip": "Network timeout in seconds for each URL."}),
+    "parser_engine": (["Auto", "html.parser", "lxml", "selectolax"], {"default": "Auto", "tooltip": "HTML parser. 'Auto' picks the fastest installed engine: selectolax, then lxml, then Python's built-in html.parser."}),
+    "max_page_kb": ("INT", {"default": 0, "min": 0, "max": 65536, "step": 64, "tooltip": "Stop downloading and parse only the first N kilobytes of each page. 0 = no limit. Useful for huge pages where the content is near the top."}),
+}
+
+def _resolve_parser_engine(engine):
+    if engine == "Auto": return "selectolax" if SELECTOLAX_AVAILABLE else ("lxml" if LXML_AVAILABLE else "html.parser")
+    if (engine == "selectolax" and not SELECTOLAX_AVAILABLE) or (engine == "lxml" and not LXML_AVAILABLE):
+        fallback = "lxml" if LXML_AVAILABLE else "html.parser"
+        print(f"ComfyUI_Automation: Parser engine '{engine}' is not installed. Falling back to '{fallback}'."); return fallback
+    return engine
+
+def _fetch_page(url, timeout, max_bytes=0):
+    """Downloads a page through the shared HTTP session, stopping after `max_bytes` if set."""
+    if max_bytes <= 0:
+        r = http_client.get(url, timeout=timeout); r.raise_for_status(); return r.content
+    with http_client.get(url, timeout=timeout, stream=True) as r:
+        r.raise_for_status(); chunks, size = [], 0
+        for chunk in r.iter_content(chunk_size=64 * 1024):
+            chunks.append(chunk); size += len(chunk)
+            if size >= max_bytes: break
+    return b"".join(chunks)[:max_bytes]
+
+class _HtmlDocument:
+    """A small common interface over BeautifulSoup (html.parser / lxml) and selectolax trees."""
+    def __init__(self, content, engine):
+        self.fast = engine == "selectolax"
+        self.tree = FastHTMLParser(content) if self.fast else BeautifulSoup(content, engine)
+
+    def remove(self, selector):
+        for node in (self.tree.css(selector) if self.fast else self.tree.select(selector)): node.decompose()
+
+    def select(self, selector):
+        return self.tree.css(selector) if self.fast else self.tree.select(selector)
+
+    def text(self, node):
+        if node is None: return ""
+        return node.text(separator=' ', strip=True).strip() if self.fast else node.get_text(separator=' ', strip=True)
+
+    def body(self):
+        """Returns the <body>, or the whole document for fragments and pages without one."""
+        if self.tree.body is not None: return self.tree.body
+        return self.tree.root if self.fast else self.tree
+
+    def image_attrs(self, node):
+        """Returns the attribute dicts of every <img> and <picture><source> inside `node`, in document order."""
+        if node is None: return []
+        return [i.attributes for i in node.css('img, picture source')] if self.fast else [i.attrs for i in node.select('img, picture source')]
+
+class _ImageUrlCollector:
+    """
+    Order-preserving, set-backed collection of absolute image URLs. Reads the
+    lazy-load attribute (or `src`) and every candidate of a `srcset`, so pages
+    with thousands of images are de-duplicated in linear time.
+    """
+    # Lazy-load attributes hold the real image while `src` is often a placeholder, so they are tried first.
+    SRC_ATTRS = ('data-src', 'data-lazy-src', 'data-original', 'src')
+    SRCSET_ATTRS = ('data-srcset', 'srcset')
+
+    def __init__(self): self.urls, self._seen = [], set()
+
+    def add(self, url):
+        if url and url not in self._seen: self._seen.add(url); self.urls.append(url)
+
+    def extend(self, urls):
+        for url in urls: self.add(url)
+
+    @staticmethod
+    def srcset_urls(srcset):
+        """
+        Returns the candidate URLs of a srcset, following the HTML parsing rules: a URL runs up to the next
+        whitespace, so commas inside it (CDN transforms such as w_100,h_50) are kept, and only the
+        descriptor that follows it ends at a comma.
+        """
+        urls, position, length = [], 0, len(srcset)
+        while position < length:
+            while position < length and (srcset[position].isspace() or srcset[position] == ','): position += 1
+            start = position
+            while position < length and not srcset[position].isspace(): position += 1
+            url = srcset[start:position]
+            if url.endswith(','):
+                # A trailing comma ends a candidate without descriptors.
+                url = url.rstrip(',')
+            else:
+                while position < length and srcset[position] != ',':
+                    if srcset[position] == '(':
+                        # Descriptors are never parenthesized, but the spec skips over them so a comma inside is not a separator.
+                        position = srcset.find(')', position) + 1 or length
+                    else: position += 1
+            if url: urls.append(url)
+        return urls
+
+    def add_element(self, base_url, attrs):
+        for name in self.SRC_ATTRS:
+            value = (attrs.get(name) or '').strip()
+            # Inline data: placeholders (blank GIFs, blurred previews) are not downloadable images.
+            if value and not value.startswith('data:'):
+                self.add(urljoin(base_url, value)); break
+        for name in self.SRCSET_ATTRS:
+            for url in self.srcset_urls(attrs.get(name) or ''):
+                if not url.startswith('data:'): self.add(urljoin(base_url, url))
+
 class SimpleWebScraper:
-    CATEGORY = "⚫mimikry/Automation/Web"; RETURN_TYPES, RETURN_NAMES = ("STRING", "STRING"), ("extracted_texts_batch", "image_urls_batch"); FUNCTION = "scrape_simple"
+    CATEGORY = "⚫mimikry/Automation/Web"; RETURN_TYPES, RETURN_NAMES = ("STRING", "STRING", "STRING"), ("extracted_texts_batch", "image_urls_batch", "error_batch"); FUNCTION = "scrape_simple"
     @classmethod
     def INPUT_TYPES(s):
-        return {"required": {"url": ("STRING", {"multiline": False, "default": "", "tooltip": "A single URL or a batch of URLs to scrape."})}}
+        return {"required": {"url": ("STRING", {"multiline": False, "default": "", "tooltip": "A single URL or a batch of URLs to scrape."})},
+                "optional": dict(SCRAPER_EXECUTION_INPUTS)}
     
-    def _abs(self, b, l): return urljoin(b, l)
-    def scrape_simple(self, u):
-        ul, at, au = [u] if isinstance(u, str) else u, [], [];
-        for s in ul:
-            if not s: continue
-            try:
-                r=requests.get(s, headers={'User-Agent':'Mozilla/5.0'}, timeout=10); r.raise_for_status()
-                sp=BeautifulSoup(r.content, 'html.parser')
-                at.append(sp.body.get_text(separator=' ', strip=True) if sp.body else "")
-                for i in sp.find_all('img'):
-                    src = i.get('src');
-                    if src: a_url = self._abs(s, src);
-                    if a_url not in au: au.append(a_url)
-            except Exception as e: print(f"ComfyUI_Automation: Scraper Error: {e}")
-        return (at, au)
+    def _scrape_page(self, s, timeout, engine, max_bytes):
+        sp, iu = _HtmlDocument(_fetch_page(s, timeout, max_bytes), engine), _ImageUrlCollector()
+        for i in sp.image_attrs(sp.body()): iu.add_element(s, i)
+        return (sp.text(sp.body()), iu.urls)
+
+    def scrape_simple(self, u, execution_mode="Parallel", max_workers=8, per_host_limit=2, timeout=10.0, parser_engine="Auto", max_page_kb=0):
+        ul, at, au, errors = [s for s in ([u] if isinstance(u, str) else u) if s], [], _ImageUrlCollector(), []
+        workers, engine = max_workers if execution_mode == "Parallel" else 1, _resolve_parser_engine(parser_engine)
+        results = _map_ordered(lambda s: self._scrape_page(s, timeout, engine, max_page_kb * 1024), ul, workers, key=_url_host, per_key_limit=per_host_limit)
+        for s, (result, error) in zip(ul, results):
+            if error is not None:
+                print(f"ComfyUI_Automation: Scraper Error on {s}: {error}"); errors.append(f"{s}: {error}"); continue
+            text, images = result; at.append(text); au.extend(images); errors.append("")
+        print(f"SimpleWebScraper: {http_client.format_stats()}")
+        return (at, au.urls, errors)
 
 class TargetedWebScraper:
-    CATEGORY = "⚫mimikry/Automation/Web"; RETURN_TYPES, RETURN_NAMES = ("STRING", "STRING"), ("extracted_text_batch", "image_urls_batch"); FUNCTION = "scrape_targeted"
+    CATEGORY = "⚫mimikry/Automation/Web"; RETURN_TYPES, RETURN_NAMES = ("STRING", "STRING", "STRING"), ("extracted_text_batch", "image_urls_batch", "error_batch"); FUNCTION = "scrape_targeted"
     @classmethod
     def INPUT_TYPES(s):
         return {"required": {
             "url": ("STRING", {"multiline": False, "default": "", "tooltip": "A single URL or a batch of URLs to scrape."}),
             "selectors": ("STRING", {"multiline": True, "default": "body", "tooltip": "CSS selectors for the main content areas you want to extract. Use browser 'Inspect' tool. E.g., .article-body, #main-content"}),
             "ignore_selectors": ("STRING", {"multiline": True, "default": "nav, footer, .ad-container", "tooltip": "CSS selectors for content to completely remove before extraction. Each on a new line. E.g., to ignore a div with class 'postTitle', add '.postTitle'."})
-        }}
+        },
+        "optional": dict(SCRAPER_EXECUTION_INPUTS)}
     
-    def _abs(self, b, l): return urljoin(b, l)
-    def scrape_targeted(self, url, selectors, ignore_selectors):
-        ul, ft, fi, sl, isl = [url] if isinstance(url, str) else url, [], [], [s.strip() for s in selectors.splitlines() if s.strip()], [s.strip() for s in ignore_selectors.splitlines() if s.strip()]
-        if not sl: return ([], [])
-        for s_url in ul:
-            if not s_url: continue
-            try:
-                r = requests.get(s_url, headers={'User-Agent': 'Mozilla/5.0'}, timeout=10); r.raise_for_status()
-                sp = BeautifulSoup(r.content, 'html.parser')
-                
-                # --- This is the key logic for ignoring elements ---
-                if isl:
-                    # Find all elements matching the ignore_selectors and completely remove them from the page.
-                    for ignored_element in sp.select(','.join(isl)): 
-                        ignored_element.decompose()
-                
-                # Now, find the main content elements in the cleaned-up page.
-                for e in sp.select(','.join(sl)):
-                    # Extract text from the main element.
-                    txt = e.get_text(separator=' ', strip=True)
-                    if txt: ft.append(txt)
-                    
-                    # Also extract images from within that main element.
-                    for i in e.find_all('img'):
-                        src = i.get('src')
-                        if src:
-                            a_url = self._abs(s_url, src)
-                            if a_url not in fi: fi.append(a_url)
-            except Exception as e: print(f"ComfyUI_Automation: Scraper Error on {s_url}: {e}")
-        return (ft, fi)
+    def _scrape_page(self, s_url, sl, isl, timeout, engine, max_bytes):
+        sp, texts, images = _HtmlDocument(_fetch_page(s_url, timeout, max_bytes), engine), [], _ImageUrlCollector()
+        
+        # --- This is the key logic for ignoring elements ---
+        if isl:
+            # Find all elements matching the ignore_selectors and completely remove them from the page.
+            sp.remove(','.join(isl))
+        
+        # Now, find the main content elements in the cleaned-up page.
+        for e in sp.select(','.join(sl)):
+            # Extract text from the main element.
+            txt = sp.text(e)
+            if txt: texts.append(txt)
+            
+            # Also extract images from within that main element.
+            for i in sp.image_attrs(e): images.add_element(s_url, i)
+        return (texts, images.urls)
+
+    def scrape_targeted(self, url, selectors, ignore_selectors, execution_mode="Parallel", max_workers=8, per_host_limit=2, timeout=10.0, parser_engine="Auto", max_page_kb=0):
+        ul, ft, fi, errors = [s for s in ([url] if isinstance(url, str) else url) if s], [], _ImageUrlCollector(), []
+        sl, isl = [s.strip() for s in selectors.splitlines() if s.strip()], [s.strip() for s in ignore_selectors.splitlines() if s.strip()]
+        if not sl: return ([], [], [])
+        workers, engine = max_workers if execution_mode == "Parallel" else 1, _resolve_parser_engine(parser_engine)
+        results = _map_ordered(lambda s_url: self._scrape_page(s_url, sl, isl, timeout, engine, max_page_kb * 1024), ul, workers, key=_url_host, per_key_limit=per_host_limit)
+        for s_url, (result, error) in zip(ul, results):
+            if error is not None:
+                print(f"ComfyUI_Automation: Scraper Error on {s_url}: {error}"); errors.append(f"{s_url}: {error}"); continue
+            texts, images = result; ft.extend(texts); fi.extend(images); errors.append("")
+        print(f"TargetedWebScraper: {http_client.format_stats()}")
+        return (ft, fi.urls, errors)
 
 # --- IMAGE LOADER NODES ---
 class LoadImageFromURL:
@@ -147,30 +364,130 @@ class LoadImageFromURL:
             "resize_mode": (["Don't Resize (First Image Only)", "Stretch", "Crop (Center)", "Pad (Black)"], {"default": "Pad (Black)", "tooltip": "How to handle images of different sizes. 'Don't Resize' is not batch-compatible."}),
             "target_width": ("INT", {"default": 512, "min": 64, "max": 8192, "step": 8, "tooltip": "The width all images will be resized to (unless 'Don't Resize' is selected)."}),
             "target_height": ("INT", {"default": 512, "min": 64, "max": 8192, "step": 8, "tooltip": "The height all images will be resized to (unless 'Don't Resize' is selected)."})
+        },
+        "optional": {
+            "max_workers": ("INT", {"default": 8, "min": 1, "max": 64, "step": 1, "tooltip": "Maximum number of images downloaded and decoded at the same time."}),
+            "timeout": ("FLOAT", {"default": 20.0, "min": 1.0, "max": 300.0, "step": 0.5, "tooltip": "Network timeout in seconds for each image."}),
+            "use_cache": ("BOOLEAN", {"default": False, "tooltip": "Keep downloaded images and their resized versions on disk (in this node pack's cache/images folder, up to cache_max_mb), so repeated runs skip both the download and the decode. Off by default."}),
+            "cache_revalidate_minutes": ("FLOAT", {"default": 60.0, "min": 0.0, "max": 525600.0, "step": 1.0, "tooltip": "Cached images older than this are revalidated with the server (ETag / Last-Modified) before being reused."}),
+            "cache_max_mb": ("INT", {"default": 1024, "min": 16, "max": 1048576, "step": 16, "tooltip": "Maximum size of the image cache on disk. The least recently used images are deleted first."}),
         }}
-    def load_image_from_url(self, image_url, resize_mode, target_width, target_height):
-        ul, it, mt = [image_url] if isinstance(image_url, str) else image_url, [], []
+
+    # Downscaling first decodes/reduces to at least this multiple of the final size, then LANCZOS does the rest.
+    # 2.0 is the same trade-off Image.thumbnail uses and is visually indistinguishable from a full-size resample.
+    REDUCING_GAP = 2.0
+    # Part of the cached variant key. Bump it whenever _decode changes its output, so old resized variants are not reused.
+    DECODE_VERSION = 2
+
+    def _fit_box(self, w, h, ts):
+        # Same centered crop box ImageOps.fit uses, so the resize can be done with a reducing_gap.
+        target_ratio = ts[0] / ts[1]
+        if w / h >= target_ratio: cw, ch = target_ratio * h, h
+        else: cw, ch = w, w / target_ratio
+        return ((w - cw) / 2, (h - ch) / 2, (w + cw) / 2, (h + ch) / 2)
+
+    def _draft(self, i, resize_mode, ts):
+        """For JPEGs, asks the decoder for a reduced-size (1/2, 1/4, 1/8) decode that is still large enough for the target."""
+        if i.format != 'JPEG' or resize_mode == "Don't Resize (First Image Only)": return
+        w, h = i.size
+        if resize_mode == "Stretch": needed = ts
+        else:
+            scale = max(ts[0] / w, ts[1] / h) if resize_mode == "Crop (Center)" else min(ts[0] / w, ts[1] / h)
+            needed = (w * scale, h * scale)
+        i.draft(None, (int(needed[0] * self.REDUCING_GAP), int(needed[1] * self.REDUCING_GAP)))
+
+    def _decode(self, data, resize_mode, ts):
+        """Decodes the image bytes once and returns (rgb, alpha) uint8 arrays; alpha is None for opaque images."""
+        i = Image.open(io.BytesIO(data)); self._draft(i, resize_mode, ts)
+        has_alpha = i.mode in ('RGBA', 'LA', 'PA') or 'transparency' in i.info
+        # Resizing the RGBA image keeps the mask aligned with the image in every resize mode.
+        i = i.convert("RGBA" if has_alpha else "RGB")
+        if resize_mode == "Stretch": i = i.resize(ts, Image.Resampling.LANCZOS, reducing_gap=self.REDUCING_GAP)
+        elif resize_mode == "Crop (Center)": i = i.resize(ts, Image.Resampling.LANCZOS, box=self._fit_box(i.width, i.height, ts), reducing_gap=self.REDUCING_GAP)
+        elif resize_mode == "Pad (Black)":
+            ic = i.copy(); ic.thumbnail(ts, Image.Resampling.LANCZOS, reducing_gap=self.REDUCING_GAP)
+            bg = Image.new(i.mode, ts, (0, 0, 0, 0) if has_alpha else (0, 0, 0)); bg.paste(ic, ((ts[0] - ic.width) // 2, (ts[1] - ic.height) // 2)); i = bg
+        a = np.array(i)
+        return (a[..., :3], a[..., 3]) if has_alpha else (a, None)
+
+    def _fetch_bytes(self, url, timeout, cache, headers=None):
+        """Downloads `url`; returns (bytes, content_hash), or (None, None) if the server answered 304."""
+        r = http_client.get(url, headers=headers, timeout=timeout)
+        if r.status_code == 304:
+            if headers: return None, None
+            raise ValueError("Server answered 304 Not Modified to a request without validators.")
+        r.raise_for_status()
+        return r.content, cache.store_bytes(url, r.content, r.headers.get('ETag'), r.headers.get('Last-Modified')) if cache else None
+
+    def _download(self, url, resize_mode, ts, timeout, cache=None):
+        if cache is None: return self._decode(self._fetch_bytes(url, timeout, None)[0], resize_mode, ts)
+        data, record = None, cache.lookup(url)
+        if record is None:
+            data, content_hash = self._fetch_bytes(url, timeout, cache)
+        else:
+            content_hash = record["hash"]
+            headers = {k: v for k, v in (('If-None-Match', record.get('etag')), ('If-Modified-Since', record.get('modified'))) if v}
+            if not record["fresh"]:
+                # Stale entries are revalidated; a 304 keeps the cached bytes and resized variants.
+                # Without stored validators or cached bytes there is nothing to keep, so the image is downloaded again.
+                conditional = headers if headers and cache.has_bytes(content_hash) else None
+                data, new_hash = self._fetch_bytes(url, timeout, cache, conditional)
+                if data is None: cache.mark_validated(url)
+                else: content_hash = new_hash
+
+        variant_key = f"v{self.DECODE_VERSION}|{resize_mode}|{ts[0]}x{ts[1]}"
+        cached = cache.load_variant(content_hash, variant_key)
+        if cached is not None:
+            cached = np.array(cached)
+            return (cached[..., :3], cached[..., 3]) if cached.shape[-1] == 4 else (cached, None)
+        if data is None: data = cache.load_bytes(content_hash)
+        if data is None: data, content_hash = self._fetch_bytes(url, timeout, cache)
+        rgb, alpha = self._decode(data, resize_mode, ts)
+        cache.store_variant(content_hash, variant_key, rgb if alpha is None else np.dstack((rgb, alpha)))
+        return rgb, alpha
+
+    def _report(self, cache):
+        if cache: cache.save(); print(f"LoadImageFromURL: {cache.stats()}")
+        print(f"LoadImageFromURL: {http_client.format_stats()}")
+
+    def _to_tensors(self, rgb, alpha):
+        image = torch.from_numpy(rgb).float().div_(255.0)
+        mask = torch.from_numpy(alpha).float().div_(255.0) if alpha is not None else torch.ones(rgb.shape[:2], dtype=torch.float32)
+        return image, mask
+
+    def load_image_from_url(self, image_url, resize_mode, target_width, target_height, max_workers=8, timeout=20.0, use_cache=False, cache_revalidate_minutes=60.0, cache_max_mb=1024):
+        ul = [u for u in ([image_url] if isinstance(image_url, str) else image_url) if u and u.strip().startswith(('http://', 'https://'))]
         ts = (target_width, target_height)
-        for url in ul:
-            if not url or not url.strip().startswith(('http://', 'https://')): continue
-            try:
-                r = requests.get(url, headers={'User-Agent': 'Mozilla/5.0'}, timeout=20); r.raise_for_status()
-                i = Image.open(io.BytesIO(r.content)); om = i.mode
-                if resize_mode == "Stretch": i = i.resize(ts, Image.Resampling.LANCZOS)
-                elif resize_mode == "Crop (Center)": i = ImageOps.fit(i, ts, Image.Resampling.LANCZOS)
-                elif resize_mode == "Pad (Black)":
-                    ic = i.copy(); ic.thumbnail(ts, Image.Resampling.LANCZOS)
-                    bg = Image.new('RGB', ts, (0, 0, 0)); bg.paste(ic, ((ts[0] - ic.width) // 2, (ts[1] - ic.height) // 2)); i = bg
-                i = i.convert("RGB"); it.append(torch.from_numpy(np.array(i).astype(np.float32) / 255.0)[None,])
-                if om == 'RGBA':
-                    m = np.array(Image.open(io.BytesIO(r.content)).getchannel('A')).astype(np.float32) / 255.0
-                    if resize_mode != "Don't Resize (First Image Only)": mi = Image.fromarray(m); mi = mi.resize(ts, Image.Resampling.LANCZOS); m = np.array(mi)
-                    mt.append(torch.from_numpy(m))
-                else: mt.append(torch.ones((i.height, i.width), dtype=torch.float32))
-                if resize_mode == "Don't Resize (First Image Only)": break
-            except Exception as e: print(f"ComfyUI_Automation: Image Load Error on {url}: {e}")
-        if not it: return (torch.zeros((1, 64, 64, 3)), torch.zeros((1, 64, 64)))
-        return (torch.cat(it, dim=0), torch.cat(mt, dim=0))
+        cache = get_image_cache() if use_cache else None
+        if cache: cache.revalidate_after, cache.max_bytes = cache_revalidate_minutes * 60.0, cache_max_mb * 1024 * 1024
+
+        if resize_mode == "Don't Resize (First Image Only)":
+            # Only the first image that loads is used, so there is nothing to parallelize.
+            for url in ul:
+                try: image, mask = self._to_tensors(*self._download(url, resize_mode, ts, timeout, cache))
+                except Exception as e: print(f"ComfyUI_Automation: Image Load Error on {url}: {e}"); continue
+                self._report(cache)
+                return (image.unsqueeze(0), mask.unsqueeze(0))
+            self._report(cache)
+            return (torch.zeros((1, 64, 64, 3)), torch.zeros((1, 64, 64)))
+
+        # Every image ends up at the target size, so the whole batch is allocated once and each
+        # worker decodes, resizes and writes its image into its own slot as soon as it arrives.
+        images = torch.empty((len(ul), target_height, target_width, 3), dtype=torch.float32)
+        masks = torch.ones((len(ul), target_height, target_width), dtype=torch.float32)
+        def _load_into_slot(idx):
+            rgb, alpha = self._download(ul[idx], resize_mode, ts, timeout, cache)
+            images[idx].copy_(torch.from_numpy(rgb)).div_(255.0)
+            if alpha is not None: masks[idx].copy_(torch.from_numpy(alpha)).div_(255.0)
+
+        loaded = []
+        for idx, (_, error) in enumerate(_map_ordered(_load_into_slot, list(range(len(ul))), max_workers)):
+            if error is not None: print(f"ComfyUI_Automation: Image Load Error on {ul[idx]}: {error}")
+            else: loaded.append(idx)
+        self._report(cache)
+        if not loaded: return (torch.zeros((1, 64, 64, 3)), torch.zeros((1, 64, 64)))
+        if len(loaded) < len(ul): images, masks = images[loaded], masks[loaded]
+        return (images, masks)
 
 class LayeredImageProcessor:
     CATEGORY = "⚫mimikry/Automation/Image"; RETURN_TYPES = ("IMAGE",); RETURN_NAMES = ("image",); FUNCTION = "process_image"
@@ -310,25 +627,16 @@ class TextOnImage:
 
     @classmethod
     def INPUT_TYPES(s):
-        font_files = set(["arial.ttf", "verdana.ttf", "tahoma.ttf", "cour.ttf", "times.ttf", "DejaVuSans.ttf", "LiberationSans-Regular.ttf"])
-        font_dirs = []
-        if os.name == 'nt': font_dirs.append(os.path.join(os.environ.get('WINDIR', 'C:\\Windows'), 'Fonts'))
-        elif os.name == 'posix': font_dirs.extend(['/usr/share/fonts/truetype/', '/usr/local/share/fonts/', '~/.fonts/', '/System/Library/Fonts/', '/Library/Fonts/'])
-        for directory in font_dirs:
-            try:
-                if os.path.exists(os.path.expanduser(directory)):
-                    for f in os.listdir(os.path.expanduser(directory)):
-                        if f.lower().endswith('.ttf'): font_files.add(f)
-            except: pass
+        font_files = font_registry.list_fonts()
         return {"required": {
             "image": ("IMAGE", {"tooltip": "The image or image batch to draw on."}),
             "text": ("STRING", {"forceInput": True, "tooltip": "The text string or batch of strings to draw. Emojis are supported!"}),
-            "font_name": (sorted(list(font_files)), {"tooltip": "The font file to use for regular text."}),
+            "font_name": (font_files, {"tooltip": "The font file to use for regular text."}),
             "font_size": ("INT", {"default": 50, "min": 1, "max": 1024, "step": 1, "tooltip": "Font size in pixels."}),
             "font_color": ("STRING", {"default": "255, 255, 255", "tooltip": "Text color in R, G, B format."}),
             "wrap_width": ("INT", {"default": 0, "min": 0, "max": 8192, "step": 1, "tooltip": "Maximum width in pixels for text wrapping. Set to 0 to disable wrapping."}),
             "line_height_multiplier": ("FLOAT", {"default": 1.2, "min": 0.5, "max": 3.0, "step": 0.1, "round": 0.01, "tooltip": "Multiplier for line spacing."}),
-            "style": (["None", "Background Block", "Drop Shadow", "Stroke"], {"default": "None"}),
+            "style": (["None", "Background Block", "Drop Shadow", "Stroke", "Soft Shadow", "Outer Glow"], {"default": "None", "tooltip": "Soft Shadow and Outer Glow are blurred by 'effect_blur' and use the alpha of 'style_color'."}),
             "style_color": ("STRING", {"default": "0, 0, 0, 128", "tooltip": "R,G,B,A format for the chosen style."}),
             "bg_padding": ("INT", {"default": 10, "min": 0, "max": 200, "step": 1, "tooltip": "Padding for the Background Block."}),
             "shadow_offset": ("INT", {"default": 5, "min": -100, "max": 100, "step": 1, "tooltip": "Offset for the Drop Shadow."}),
@@ -338,17 +646,15 @@ class TextOnImage:
             "horizontal_align": (["left", "center", "right"], {"tooltip": "Horizontal alignment anchor for the text block."}),
             "vertical_align": (["top", "center", "bottom"], {"tooltip": "Vertical alignment anchor for the text block."}),
             "margin": ("INT", {"default": 20, "min": 0, "max": 1024, "step": 1, "tooltip": "Padding from the edge of the image for alignment."})
+        },
+        "optional": {
+            "execution_mode": (["Sequential", "Multiprocess"], {"default": "Sequential", "tooltip": "Sequential: Render all frames in this process. Multiprocess: Split large batches across fresh worker processes that write into shared memory. Starting the workers takes a few seconds, so it only pays off for long batches. Frame order is the same either way."}),
+            "max_workers": ("INT", {"default": 0, "min": 0, "max": 256, "step": 1, "tooltip": "Maximum number of worker processes in Multiprocess mode. 0 = one per CPU core."}),
+            "min_frames_per_worker": ("INT", {"default": 16, "min": 1, "max": 4096, "step": 1, "tooltip": "Each worker gets at least this many frames. Smaller batches are rendered sequentially because starting workers would cost more than it saves."}),
+            "worker_timeout": ("INT", {"default": 600, "min": 10, "max": 86400, "step": 10, "tooltip": "Seconds to wait for the worker processes in Multiprocess mode. If they take longer, they are stopped and the frames are rendered sequentially."}),
+            "effect_blur": ("INT", {"default": 8, "min": 0, "max": 100, "step": 1, "tooltip": "Blur radius in pixels for the Soft Shadow and Outer Glow styles. Outer Glow spreads by 'stroke_width' before blurring."}),
         }}
 
-    def find_font(self, font_name):
-        font_dirs = [];
-        if os.name == 'nt': font_dirs.append(os.path.join(os.environ.get('WINDIR', 'C:\\Windows'), 'Fonts'))
-        elif os.name == 'posix': font_dirs.extend(['/usr/share/fonts/truetype/', '/usr/local/share/fonts/', '~/.fonts/', '/System/Library/Fonts/', '/Library/Fonts/'])
-        for directory in font_dirs:
-            font_path = os.path.join(os.path.expanduser(directory), font_name)
-            if os.path.exists(font_path): return font_path
-        print(f"ComfyUI_Automation: Font '{font_name}' not found. Falling back to default."); return "DejaVuSans.ttf"
-
     def _parse_color(self, color_string, default_color):
         try:
             parts = [int(c.strip()) for c in color_string.split(',')]
@@ -357,130 +663,163 @@ class TextOnImage:
         except:
             return default_color
 
-    def _get_text_size(self, draw, text, main_font, emoji_font):
-        if emoji_font is None:
-            return draw.textbbox((0,0), text, font=main_font)
-        
-        total_width = 0; min_y = float('inf'); max_y = float('-inf')
-        parts = self.EMOJI_SPLIT_REGEX.split(text)
-        for part in parts:
-            if not part: continue
-            font = emoji_font if self.EMOJI_SPLIT_REGEX.match(part) else main_font
-            try:
-                bbox = draw.textbbox((0,0), part, font=font)
-                total_width += bbox[2] - bbox[0]
-                min_y = min(min_y, bbox[1])
-                max_y = max(max_y, bbox[3])
-            except TypeError: pass
-        max_height = max_y - min_y if min_y != float('inf') else 0
-        return (0, 0, total_width, max_height)
-
-    def _wrap_text(self, text: str, main_font: ImageFont.FreeTypeFont, emoji_font: ImageFont.FreeTypeFont, max_width: int, draw: ImageDraw.ImageDraw) -> str:
-        lines = []
-        words = text.split(' ')
-        if not words: return ""
-        current_line = words[0]
-        for word in words[1:]:
-            test_line = f"{current_line} {word}"
-            line_width = self._get_text_size(draw, test_line, main_font, emoji_font)[2]
-            if line_width <= max_width:
-                current_line = test_line
-            else:
-                lines.append(current_line); current_line = word
-        lines.append(current_line)
-        return "\n".join(lines)
-    
-    def _draw_text_chunked(self, draw, pos, text, main_font, emoji_font, fill, **kwargs):
-        x, y = pos
-        parts = self.EMOJI_SPLIT_REGEX.split(text)
-        for part in parts:
-            if not part: continue
-            is_emoji = self.EMOJI_SPLIT_REGEX.match(part)
-            font_to_use = emoji_font if is_emoji and emoji_font else main_font
-            stroke_width = kwargs.get('stroke_width', 0)
-            stroke_fill = kwargs.get('stroke_fill', None)
-            draw.text((x, y), part, font=font_to_use, fill=fill, embedded_color=True, stroke_width=stroke_width, stroke_fill=stroke_fill)
-            part_width = self._get_text_size(draw, part, main_font, emoji_font)[2]
-            x += part_width
-
-    def draw_text(self, image, text, font_name, font_size, font_color, wrap_width, line_height_multiplier, style, style_color, bg_padding, shadow_offset, stroke_width, x_position, y_position, horizontal_align, vertical_align, margin):
+    def draw_text(self, image, text, font_name, font_size, font_color, wrap_width, line_height_multiplier, style, style_color, bg_padding, shadow_offset, stroke_width, x_position, y_position, horizontal_align, vertical_align, margin, execution_mode="Sequential", max_workers=0, min_frames_per_worker=16, worker_timeout=600, effect_blur=8):
         num_images = image.shape[0]; text_list = [text] if isinstance(text, str) else text; num_texts = len(text_list)
         loop_count = max(num_images, num_texts)
         if num_images > 1 and num_texts > 1: loop_count = min(num_images, num_texts)
-        
-        font_path = self.find_font(font_name)
-        try: main_font = ImageFont.truetype(font_path, font_size)
-        except IOError: main_font = ImageFont.load_default()
+        frame_indices = [i % num_images for i in range(loop_count)]
+        render_args = (text_list, font_name, font_size, font_color, wrap_width, line_height_multiplier, style, style_color, bg_padding, shadow_offset, stroke_width, x_position, y_position, horizontal_align, vertical_align, margin, effect_blur)
+
+        workers = 1
+        if execution_mode == "Multiprocess":
+            workers = min(max_workers or os.cpu_count() or 1, loop_count // max(1, min_frames_per_worker))
+            if workers < 2: print(f"TextOnImage: {loop_count} frames is too few to split across processes. Rendering sequentially.")
+
+        output_images = image[frame_indices].clone()
+        if workers >= 2:
+            try:
+                _render_text_on_image_parallel(output_images, render_args, workers, worker_timeout)
+                return (output_images,)
+            except Exception as e:
+                print(f"TextOnImage: Multiprocess rendering failed, falling back to sequential. Error: {e}")
+                output_images = image[frame_indices].clone()
+
+        self._render_frames(output_images, 0, loop_count, *render_args)
+        return (output_images,)
+
+    def _render_frames(self, output_images, start, end, text_list, font_name, font_size, font_color, wrap_width, line_height_multiplier, style, style_color, bg_padding, shadow_offset, stroke_width, x_position, y_position, horizontal_align, vertical_align, margin, effect_blur=8):
+        """Draws the text of frames [start, end) into output_images in place."""
+        num_texts = len(text_list)
+        main_font = font_registry.get_font(font_name, font_size)
         
         main_color_tuple = self._parse_color(font_color, (255, 255, 255))
         style_color_tuple = self._parse_color(style_color, (0, 0, 0, 255))
         
         emoji_font = self._load_emoji_font(font_size)
+        layout = TextLayout(main_font, emoji_font, self.EMOJI_SPLIT_REGEX)
+        img_width, img_height = output_images.shape[2], output_images.shape[1]
+        # Everything that changes the rendered pixels, except the text itself.
+        settings_key = (font_key(main_font), font_key(emoji_font) if emoji_font else None, main_color_tuple, style_color_tuple, wrap_width, line_height_multiplier, style, bg_padding, shadow_offset, stroke_width, effect_blur,
+                        x_position, y_position, horizontal_align, vertical_align, margin, img_width, img_height)
+        cache = sprite_cache.get_cache()
+
+        # Consecutive frames with the same caption share one cached sprite and are blended together.
+        frame_texts = [text_list[i % num_texts] if text_list else "" for i in range(start, end)]
+        run_start = 0
+        for f in range(1, len(frame_texts) + 1):
+            if f < len(frame_texts) and frame_texts[f] == frame_texts[run_start]: continue
+            text_to_draw = frame_texts[run_start]
+            sprite = cache.get_or_render(("TextOnImage", text_to_draw) + settings_key, lambda: self._render_text_sprite(
+                text_to_draw, layout, img_width, img_height, main_color_tuple, style_color_tuple, wrap_width, line_height_multiplier, style, bg_padding, shadow_offset, stroke_width, effect_blur, x_position, y_position, horizontal_align, vertical_align, margin))
+            if sprite is not None: compositing.blend(output_images[start + run_start:start + f], *sprite)
+            run_start = f
+
+    def _render_text_sprite(self, text_to_draw, layout, img_width, img_height, main_color_tuple, style_color_tuple, wrap_width, line_height_multiplier, style, bg_padding, shadow_offset, stroke_width, effect_blur, x_position, y_position, horizontal_align, vertical_align, margin):
+        """Renders one caption with its style into a premultiplied (sprite, x, y), or None if nothing is visible."""
+        # The text is drawn with opaque inks onto a transparent layer, which leaves it premultiplied and
+        # composites exactly like drawing straight onto the frame (whose alpha was always discarded).
+        main_color_tuple = tuple(main_color_tuple[:3]) + (255,)
+        effect_alpha = style_color_tuple[3] / 255.0 if len(style_color_tuple) > 3 else 1.0
+        style_color_tuple = tuple(style_color_tuple[:3]) + (255,)
+
+        text_layer = Image.new('RGBA', (img_width, img_height), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(text_layer)
+        # Soft Shadow and Outer Glow are drawn on their own layer, which is blurred and put under the text.
+        effect_layer = Image.new('RGBA', (img_width, img_height), (0, 0, 0, 0)) if style in ("Soft Shadow", "Outer Glow") else None
+        effect_draw = ImageDraw.Draw(effect_layer) if effect_layer is not None else None
+        
+        final_text = layout.wrap(text_to_draw, wrap_width) if wrap_width > 0 else text_to_draw
+        
+        lines = final_text.split('\n')
+        
+        single_line_height = layout.bbox("hg")[3]
+        adjusted_line_height = single_line_height * line_height_multiplier
+
+        total_block_width = 0
+        for line in lines:
+            total_block_width = max(total_block_width, layout.bbox(line)[2])
+        total_block_height = adjusted_line_height * (len(lines) -1) + single_line_height if lines else 0
+
+        if vertical_align == "top": y_start = margin
+        elif vertical_align == "bottom": y_start = img_height - total_block_height - margin
+        else: y_start = (img_height - total_block_height) / 2
+        y_start += y_position
+        
+        current_y = y_start
+        for line in lines:
+            line_width = layout.bbox(line)[2]
 
-        output_images = []
-        for i in range(loop_count):
-            img_tensor = image[i % num_images]
-            text_to_draw = text_list[i % num_texts] if text_list else ""
-            
-            pil_image = Image.fromarray((img_tensor.cpu().numpy() * 255).astype(np.uint8)).convert("RGBA")
-            draw = ImageDraw.Draw(pil_image)
-            
-            final_text = self._wrap_text(text_to_draw, main_font, emoji_font, wrap_width, draw) if wrap_width > 0 else text_to_draw
-            
-            img_width, img_height = pil_image.size
-            lines = final_text.split('\n')
-            
-            single_line_height = self._get_text_size(draw, "hg", main_font, emoji_font)[3]
-            adjusted_line_height = single_line_height * line_height_multiplier
-
-            total_block_width = 0
-            for line in lines:
-                total_block_width = max(total_block_width, self._get_text_size(draw, line, main_font, emoji_font)[2])
-            total_block_height = adjusted_line_height * (len(lines) -1) + single_line_height if lines else 0
-
-            if vertical_align == "top": y_start = margin
-            elif vertical_align == "bottom": y_start = img_height - total_block_height - margin
-            else: y_start = (img_height - total_block_height) / 2
-            y_start += y_position
-            
-            current_y = y_start
-            for line in lines:
-                line_width = self._get_text_size(draw, line, main_font, emoji_font)[2]
-
-                if horizontal_align == "left": x_start = margin
-                elif horizontal_align == "right": x_start = img_width - total_block_width - margin
-                else: x_start = (img_width - total_block_width) / 2
-                x_start += x_position
-
-                line_x_offset = 0
-                if horizontal_align == "center":
-                    line_x_offset = (total_block_width - line_width) / 2
-                elif horizontal_align == "right":
-                    line_x_offset = total_block_width - line_width
-                
-                line_pos = (x_start + line_x_offset, current_y)
-                
-                if style == "Background Block":
-                    bg_x0 = line_pos[0] - bg_padding
-                    bg_y0 = line_pos[1] - bg_padding
-                    bg_x1 = line_pos[0] + line_width + bg_padding
-                    bg_y1 = line_pos[1] + single_line_height + bg_padding
-                    draw.rectangle([bg_x0, bg_y0, bg_x1, bg_y1], fill=style_color_tuple)
-                elif style == "Drop Shadow":
-                    shadow_pos = (line_pos[0] + shadow_offset, line_pos[1] + shadow_offset)
-                    self._draw_text_chunked(draw, shadow_pos, line, main_font, emoji_font, fill=style_color_tuple)
-                elif style == "Stroke":
-                    self._draw_text_chunked(draw, line_pos, line, main_font, emoji_font, fill=main_color_tuple, stroke_width=stroke_width, stroke_fill=style_color_tuple)
-
-                if style != "Stroke":
-                    self._draw_text_chunked(draw, line_pos, line, main_font, emoji_font, fill=main_color_tuple)
-
-                current_y += adjusted_line_height
+            if horizontal_align == "left": x_start = margin
+            elif horizontal_align == "right": x_start = img_width - total_block_width - margin
+            else: x_start = (img_width - total_block_width) / 2
+            x_start += x_position
+
+            line_x_offset = 0
+            if horizontal_align == "center":
+                line_x_offset = (total_block_width - line_width) / 2
+            elif horizontal_align == "right":
+                line_x_offset = total_block_width - line_width
             
-            final_image = pil_image.convert("RGB")
-            output_images.append(torch.from_numpy(np.array(final_image).astype(np.float32) / 255.0))
+            line_pos = (x_start + line_x_offset, current_y)
             
-        return (torch.stack(output_images),)
+            if style == "Background Block":
+                bg_x0 = line_pos[0] - bg_padding
+                bg_y0 = line_pos[1] - bg_padding
+                bg_x1 = line_pos[0] + line_width + bg_padding
+                bg_y1 = line_pos[1] + single_line_height + bg_padding
+                draw.rectangle([bg_x0, bg_y0, bg_x1, bg_y1], fill=style_color_tuple)
+            elif style == "Drop Shadow":
+                shadow_pos = (line_pos[0] + shadow_offset, line_pos[1] + shadow_offset)
+                layout.draw(draw, shadow_pos, line, fill=style_color_tuple)
+            elif style == "Stroke":
+                layout.draw(draw, line_pos, line, fill=main_color_tuple, stroke_width=stroke_width, stroke_fill=style_color_tuple)
+            elif style == "Soft Shadow":
+                layout.draw(effect_draw, (line_pos[0] + shadow_offset, line_pos[1] + shadow_offset), line, fill=style_color_tuple)
+            elif style == "Outer Glow":
+                layout.draw(effect_draw, line_pos, line, fill=style_color_tuple, stroke_width=stroke_width, stroke_fill=style_color_tuple)
+
+            if style != "Stroke":
+                layout.draw(draw, line_pos, line, fill=main_color_tuple)
+
+            current_y += adjusted_line_height
+        
+        if effect_layer is None: return compositing.pil_to_sprite(text_layer, premultiplied=True)
+
+        # Blurring the premultiplied layer keeps color and coverage consistent at the soft edges.
+        if effect_blur > 0: effect_layer = effect_layer.filter(ImageFilter.GaussianBlur(effect_blur))
+        effect = torch.from_numpy(np.asarray(effect_layer, dtype=np.float32) / 255.0)
+        if style == "Outer Glow": effect = effect + effect * (1.0 - effect[..., 3:])  # A second pass over itself makes the halo read at small alphas.
+        effect.mul_(effect_alpha)
+        text = torch.from_numpy(np.asarray(text_layer, dtype=np.float32) / 255.0)
+        return compositing.trim(text + effect * (1.0 - text[..., 3:]), 0, 0)
+
+def _render_text_on_image_shard(output_images, start, end, render_args):
+    # Runs in a worker process. output_images lives in shared memory, so frames are written in place
+    # and nothing but the shard bounds and the text settings is pickled.
+    torch.set_num_threads(1)
+    TextOnImage()._render_frames(output_images, start, end, *render_args)
+    return start
+
+def _render_text_on_image_parallel(output_images, render_args, workers, timeout):
+    """
+    Renders TextOnImage frames in contiguous shards on a process pool, in place. Raises
+    TimeoutError (after stopping the workers) if they take longer than `timeout` seconds.
+    """
+    # Forking the multithreaded ComfyUI server could copy locks held by other threads into the workers,
+    # so they start from a fresh interpreter instead (forkserver where available, otherwise spawn).
+    context = torch.multiprocessing.get_context("forkserver" if "forkserver" in torch.multiprocessing.get_all_start_methods() else "spawn")
+    output_images.share_memory_()
+    # Workers build their own font registry, so they get the font's resolved path rather than its name.
+    render_args = (render_args[0], font_registry.find_font(render_args[1])) + tuple(render_args[2:])
+    bounds = np.linspace(0, output_images.shape[0], workers + 1).astype(int)
+    shards = [(output_images, int(start), int(end), render_args) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+    bootstrap = (os.path.join(os.path.dirname(os.path.abspath(__file__)), "process_worker.py"),
+                 {"PACKAGE_NAME": __package__, "PACKAGE_DIR": os.path.dirname(os.path.abspath(__file__))})
+    # Leaving the block terminates the workers, including ones still running after a timeout.
+    with context.Pool(processes=len(shards), initializer=runpy.run_path, initargs=bootstrap) as pool:
+        try: pool.starmap_async(_render_text_on_image_shard, shards).get(timeout)
+        except torch.multiprocessing.TimeoutError: raise TimeoutError(f"The worker processes did not finish within {timeout} seconds.")
+    print(f"TextOnImage: Rendered {output_images.shape[0]} frames on {len(shards)} worker processes.")
 
 class PasteTextOnImageBatch:
     CATEGORY = "⚫mimikry/Automation/Image"
@@ -490,23 +829,13 @@ class PasteTextOnImageBatch:
     
     @classmethod
     def INPUT_TYPES(s):
-        font_files = set(["arial.ttf", "verdana.ttf", "tahoma.ttf", "cour.ttf", "times.ttf", "DejaVuSans.ttf", "LiberationSans-Regular.ttf"])
-        font_dirs = []
-        if os.name == 'nt': font_dirs.append(os.path.join(os.environ.get('WINDIR', 'C:\\Windows'), 'Fonts'))
-        elif os.name == 'posix': font_dirs.extend(['/usr/share/fonts/truetype/', '/usr/local/share/fonts/', '~/.fonts/', '/System/Library/Fonts/', '/Library/Fonts/'])
-        for directory in font_dirs:
-            try:
-                if os.path.exists(os.path.expanduser(directory)):
-                    for f in os.listdir(os.path.expanduser(directory)):
-                        if f.lower().endswith('.ttf'):
-                            font_files.add(f)
-            except: pass
+        font_files = font_registry.list_fonts()
 
         return {
             "required": {
                 "background_image": ("IMAGE", {"tooltip": "The image or image batch to paste the text onto."}),
                 "text": ("STRING", {"forceInput": True, "tooltip": "The text string or batch of strings to display."}),
-                "font_name": (sorted(list(font_files)), {"tooltip": "The font file to use."}),
+                "font_name": (font_files, {"tooltip": "The font file to use."}),
                 "font_size": ("INT", {"default": 50, "min": 1, "max": 1024, "step": 1}),
                 "font_color": ("STRING", {"default": "255, 255, 255, 255", "tooltip": "Text color in R, G, B, A format."}),
                 "wrap_width": ("INT", {"default": 0, "min": 0, "max": 8192, "step": 1}),
@@ -523,27 +852,43 @@ class PasteTextOnImageBatch:
         }
 
     # Helper methods are unchanged
-    def find_font(self, font_name):
-        font_dirs = [];
-        if os.name == 'nt': font_dirs.append(os.path.join(os.environ.get('WINDIR', 'C:\\Windows'), 'Fonts'))
-        elif os.name == 'posix': font_dirs.extend(['/usr/share/fonts/truetype/', '/usr/local/share/fonts/', '~/.fonts/', '/System/Library/Fonts/', '/Library/Fonts/'])
-        for directory in font_dirs:
-            font_path = os.path.join(os.path.expanduser(directory), font_name)
-            if os.path.exists(font_path): return font_path
-        print(f"ComfyUI_Automation: Font '{font_name}' not found. Falling back to default."); return "DejaVuSans.ttf"
-
-    def _wrap_text(self, text: str, font: ImageFont.FreeTypeFont, max_width: int, draw: ImageDraw.ImageDraw) -> str:
-        lines = []
-        words = text.split()
-        if not words: return ""
-        current_line = words[0]
-        for word in words[1:]:
-            test_line = f"{current_line} {word}"
-            if draw.textbbox((0, 0), test_line, font=font)[2] <= max_width:
-                current_line = test_line
-            else: lines.append(current_line); current_line = word
-        lines.append(current_line)
-        return "\n".join(lines)
+    def _render_text_sprite(self, text_to_draw, layout, color_tuple, wrap_width, canvas_size, x_position, y_position, horizontal_align, vertical_align, margin):
+        """
+        Renders one text into a tight premultiplied RGBA sprite and returns (sprite_tensor, x, y)
+        with its position on the canvas, or None if nothing would be drawn.
+        """
+        layer_width, layer_height = canvas_size
+        font = layout.main_font
+        final_text = layout.wrap(" ".join(text_to_draw.split()), wrap_width) if wrap_width > 0 else text_to_draw
+        if not final_text: return None
+
+        try: bbox = layout.bbox(final_text)
+        except AttributeError: bbox = (0,0,0,0)
+        
+        text_width, text_height = bbox[2] - bbox[0], bbox[3] - bbox[1]
+        
+        if horizontal_align == "left": x = margin
+        elif horizontal_align == "right": x = layer_width - text_width - margin
+        else: x = (layer_width - text_width) / 2
+        
+        if vertical_align == "top": y = margin
+        elif vertical_align == "bottom": y = layer_height - text_height - margin
+        else: y = (layer_height - text_height) / 2
+        
+        x += x_position
+        y += y_position
+
+        # Draw on a small layer whose origin is a whole pixel at or before the anchor, so subpixel
+        # placement rounds exactly as it would on a full-canvas layer, then crop to the ink box.
+        ink = (x + bbox[0], y + bbox[1], x + bbox[2], y + bbox[3])
+        ox, oy = min(int(np.floor(ink[0])) - 1, int(np.floor(x))), min(int(np.floor(ink[1])) - 1, int(np.floor(y)))
+        sw, sh = int(np.ceil(ink[2])) + 1 - ox, int(np.ceil(ink[3])) + 1 - oy
+        if sw <= 0 or sh <= 0: return None
+        layer = Image.new('RGBA', (sw, sh), (0, 0, 0, 0))
+        ImageDraw.Draw(layer).text((x - ox, y - oy), final_text, font=font, fill=color_tuple)
+        sprite = compositing.pil_to_sprite(layer)
+        if sprite is None: return None
+        return (sprite[0], ox + sprite[1], oy + sprite[2])
 
     def paste_text(self, background_image, text, font_name, font_size, font_color, wrap_width, x_position, y_position, horizontal_align, vertical_align, margin, text_durations=None):
         num_bg_frames = background_image.shape[0]
@@ -566,62 +911,43 @@ class PasteTextOnImageBatch:
 
         # --- END OF NEW LOGIC ---
 
-        font_path = self.find_font(font_name)
-        try: font = ImageFont.truetype(font_path, font_size)
-        except IOError: font = ImageFont.load_default()
+        font = font_registry.get_font(font_name, font_size)
         
         try:
             color_parts = [int(c.strip()) for c in font_color.split(',')]
             if len(color_parts) == 3: color_parts.append(255)
             color_tuple = tuple(color_parts)
         except: color_tuple = (255, 255, 255, 255)
-        
-        output_images = []
-        # Loop over every frame of the background image
-        for i in range(num_bg_frames):
-            bg_tensor = background_image[i]
 
-            # Determine which text to use for the current frame
+        # Determine which text to use for every frame
+        frame_texts = []
+        for i in range(num_bg_frames):
             if use_duration_logic:
                 # Use the pre-calculated map to find the correct text index
-                if i < len(text_index_map):
-                    text_index_to_use = text_index_map[i]
-                else:
-                    text_index_to_use = text_index_map[-1] # Use last text if durations are too short
-                text_to_draw = text_list[text_index_to_use % num_texts] # Modulo for safety if text list is shorter than durations
+                text_index_to_use = text_index_map[i] if i < len(text_index_map) else text_index_map[-1] # Use last text if durations are too short
+                frame_texts.append(text_index_to_use % num_texts) # Modulo for safety if text list is shorter than durations
             else:
                 # Default behavior: cycle through texts frame by frame
-                text_to_draw = text_list[i % num_texts]
-
-            # The rest of the logic remains the same
-            bg_pil = Image.fromarray((bg_tensor.cpu().numpy() * 255).astype(np.uint8)).convert("RGBA")
-            text_layer = Image.new('RGBA', bg_pil.size, (0, 0, 0, 0))
-            draw = ImageDraw.Draw(text_layer)
-            
-            final_text = self._wrap_text(text_to_draw, font, wrap_width, draw) if wrap_width > 0 else text_to_draw
-            
-            layer_width, layer_height = text_layer.size
-            try: bbox = draw.textbbox((0, 0), final_text, font=font)
-            except AttributeError: bbox = (0,0,0,0)
-            
-            text_width, text_height = bbox[2] - bbox[0], bbox[3] - bbox[1]
-            
-            if horizontal_align == "left": x = margin
-            elif horizontal_align == "right": x = layer_width - text_width - margin
-            else: x = (layer_width - text_width) / 2
-            
-            if vertical_align == "top": y = margin
-            elif vertical_align == "bottom": y = layer_height - text_height - margin
-            else: y = (layer_height - text_height) / 2
-            
-            x += x_position
-            y += y_position
-            
-            draw.text((x, y), final_text, font=font, fill=color_tuple)
-            composited_image = Image.alpha_composite(bg_pil, text_layer).convert("RGB")
-            output_images.append(torch.from_numpy(np.array(composited_image).astype(np.float32) / 255.0))
-            
-        return (torch.stack(output_images),)
+                frame_texts.append(i % num_texts)
+
+        # Each distinct text is rendered once into a small sprite, then blended over every run of
+        # consecutive frames that show it in a single tensor operation.
+        canvas_size = (background_image.shape[2], background_image.shape[1])
+        layout = TextLayout(font)
+        sprites = {}
+        output_images = background_image.clone()
+        run_start = 0
+        for i in range(1, num_bg_frames + 1):
+            if i < num_bg_frames and frame_texts[i] == frame_texts[run_start]: continue
+            text_to_draw = text_list[frame_texts[run_start]]
+            if text_to_draw not in sprites:
+                sprites[text_to_draw] = self._render_text_sprite(text_to_draw, layout, color_tuple, wrap_width, canvas_size, x_position, y_position, horizontal_align, vertical_align, margin)
+            if sprites[text_to_draw] is not None:
+                compositing.blend(output_images[run_start:i], *sprites[text_to_draw])
+            run_start = i
+        
+        print(f"PasteTextOnImage: Rendered {len(sprites)} distinct texts for {num_bg_frames} frames.")
+        return (output_images,)
 
 # --- SRT VIDEO NODES ---
 class SRTParser:
@@ -830,18 +1156,43 @@ class AudioReactivePaster:
                 "gaussian_sigma": ("FLOAT", {"default": 3.0, "min": 0.1, "max": 50.0, "step": 0.1}),
                 "ema_span": ("INT", {"default": 10, "min": 1, "max": 200, "step": 1}),
                 "sma_window": ("INT", {"default": 3, "min": 1, "max": 50, "step": 1})
+            },
+            "optional": {
+                "envelope_mode": (audio_features.ENVELOPE_MODES, {"default": "Peak", "tooltip": "How each frame's loudness is measured. Peak: Loudest sample. RMS: Average energy, steadier than Peak. Band Energy: RMS of only the frequencies between band_low_hz and band_high_hz."}),
+                "band_low_hz": ("FLOAT", {"default": 20.0, "min": 0.0, "max": 24000.0, "step": 1.0, "tooltip": "Lower edge of the Band Energy frequency band. If it is above band_high_hz the two edges are swapped; if they are equal, Band Energy falls back to plain RMS."}),
+                "band_high_hz": ("FLOAT", {"default": 250.0, "min": 1.0, "max": 24000.0, "step": 1.0, "tooltip": "Upper edge of the Band Energy frequency band. 20-250 Hz follows kick drums and bass. Reversed edges are swapped; equal edges fall back to plain RMS."}),
+                "reactive_feature": (["Envelope"] + list(AudioFeatureExtractor.FEATURES), {"default": "Envelope", "tooltip": "What drives the motion. Envelope: The loudness measured by envelope_mode. The others come from the shared spectral analysis (see the Audio Features node)."}),
+                "bass_max_hz": ("FLOAT", {"default": 250.0, "min": 20.0, "max": 24000.0, "step": 1.0, "tooltip": "For the Bass/Mid/High features: upper edge of the bass band and lower edge of the mid band. Use the same value as the Audio Features node to follow the same curve."}),
+                "mid_max_hz": ("FLOAT", {"default": 4000.0, "min": 20.0, "max": 24000.0, "step": 1.0, "tooltip": "For the Mid/High features: upper edge of the mid band and lower edge of the high band."}),
             }
         }
 
     def _tensor_to_pil(self, t): return Image.fromarray((t.cpu().numpy() * 255).astype(np.uint8))
     def _pil_to_tensor_single(self, p): return torch.from_numpy(np.array(p).astype(np.float32) / 255.0)
+    def _prepare_overlay(self, overlay_frame, mask_frame, size):
+        """Resizes one overlay frame and its mask to `size` and returns them as a premultiplied (sprite, 0, 0)."""
+        pil_overlay = self._tensor_to_pil(overlay_frame)
+        pil_mask = self._tensor_to_pil(mask_frame)
+        
+        # Resizing logic (allows upscaling)
+        if pil_overlay.width > 0 and pil_overlay.height > 0:
+            aspect_ratio = pil_overlay.width / pil_overlay.height
+            if pil_overlay.width >= pil_overlay.height:
+                new_w = size; new_h = max(1, int(new_w / aspect_ratio))
+            else:
+                new_h = size; new_w = max(1, int(new_h * aspect_ratio))
+            pil_overlay = pil_overlay.resize((new_w, new_h), Image.Resampling.LANCZOS)
+        
+        pil_mask = pil_mask.resize(pil_overlay.size, Image.Resampling.LANCZOS)
+        # The mask drives the blend, exactly like pasting the overlay with mask=pil_mask.
+        return compositing.image_mask_to_sprite(self._pil_to_tensor_single(pil_overlay.convert("RGB")), self._pil_to_tensor_single(pil_mask.convert("L"))), 0, 0
     def smooth_data(self, d, m, gs, es, sw):
         if m == "Gaussian": return gaussian_filter1d(d, sigma=gs)
         elif m == "Exponential Moving Average (EMA)": return pd.Series(d).ewm(span=es, adjust=True).mean().tolist()
         elif m == "Simple Moving Average (SMA)": return pd.Series(d).rolling(window=sw, center=True, min_periods=1).mean().bfill().ffill().tolist()
         return d
 
-    def process(self, background_image, overlay_image, overlay_mask, audio, fps, size, horizontal_align, vertical_align, margin, x_offset, y_offset, x_strength, y_strength, smoothing_method, gaussian_sigma, ema_span, sma_window):
+    def process(self, background_image, overlay_image, overlay_mask, audio, fps, size, horizontal_align, vertical_align, margin, x_offset, y_offset, x_strength, y_strength, smoothing_method, gaussian_sigma, ema_span, sma_window, envelope_mode="Peak", band_low_hz=20.0, band_high_hz=250.0, reactive_feature="Envelope", bass_max_hz=250.0, mid_max_hz=4000.0):
         
         if isinstance(background_image, list): background_image = background_image[0]
         if isinstance(overlay_image, list): overlay_image = overlay_image[0]
@@ -858,17 +1209,18 @@ class AudioReactivePaster:
         if num_overlay_frames > 1 and num_overlay_frames != num_video_frames:
             print(f"AudioReactivePaster: Warning! Overlay timeline ({num_overlay_frames} frames) does not match background timeline ({num_video_frames} frames).")
 
-        # Audio processing logic
-        sample_rate, waveform = audio['sample_rate'], audio['waveform'][0]
-        if waveform.shape[0] > 1: waveform = torch.mean(waveform, dim=0, keepdim=True)
-        total_audio_samples = waveform.shape[1]; samples_per_frame = int(sample_rate / fps)
-        
-        if total_audio_samples < samples_per_frame:
+        # Audio processing logic: one amplitude per frame, from windows that follow the exact samples-per-frame.
+        samples, sample_rate = audio_features.to_mono(audio)
+        if len(samples) < sample_rate / fps:
             print("AudioReactivePaster: FATAL ERROR - Audio clip is shorter than a single video frame."); return (video_timeline, torch.zeros((1, 100, num_video_frames, 3)))
             
-        raw_amplitudes = [torch.max(torch.abs(waveform[0, int(i / fps * sample_rate) : int(i / fps * sample_rate) + samples_per_frame])).item() if int(i / fps * sample_rate) < total_audio_samples else 0 for i in range(num_video_frames)]
-        max_amp = max(raw_amplitudes) if raw_amplitudes else 1.0; max_amp = 1.0 if max_amp == 0 else max_amp
-        norm_amps = [a / max_amp for a in raw_amplitudes]
+        if reactive_feature in AudioFeatureExtractor.FEATURES:
+            bands = audio_features.feature_bands(bass_max_hz, mid_max_hz)
+            raw_amplitudes = audio_features.analyze(audio, fps, num_video_frames, bands)[AudioFeatureExtractor.FEATURES[reactive_feature]]
+        else:
+            raw_amplitudes = audio_features.frame_envelope(samples, sample_rate, fps, num_video_frames, envelope_mode, band_low_hz, band_high_hz)
+        max_amp = raw_amplitudes.max() if len(raw_amplitudes) else 1.0; max_amp = 1.0 if max_amp == 0 else max_amp
+        norm_amps = raw_amplitudes / max_amp
         final_amps = self.smooth_data(norm_amps, smoothing_method, gaussian_sigma, ema_span, sma_window)
         
         # Visualization
@@ -878,54 +1230,198 @@ class AudioReactivePaster:
         
         cw, ch = video_timeline.shape[2], video_timeline.shape[1]
 
-        # Process frame by frame, modifying the input tensor in-place
-        for i in range(num_video_frames):
-            bg_tensor_frame = video_timeline[i]
-            # No need to convert background to RGBA, paste handles it.
-            bg_pil = self._tensor_to_pil(bg_tensor_frame)
-            amp = final_amps[i]
-            
-            overlay_idx = i % num_overlay_frames
-            pil_overlay = self._tensor_to_pil(overlay_image[overlay_idx])
-            pil_mask = self._tensor_to_pil(overlay_mask[i % overlay_mask.shape[0]])
-            
-            # Resizing logic (allows upscaling)
-            if pil_overlay.width > 0 and pil_overlay.height > 0:
-                aspect_ratio = pil_overlay.width / pil_overlay.height
-                if pil_overlay.width >= pil_overlay.height:
-                    new_w = size; new_h = max(1, int(new_w / aspect_ratio))
-                else:
-                    new_h = size; new_w = max(1, int(new_h * aspect_ratio))
-                pil_overlay = pil_overlay.resize((new_w, new_h), Image.Resampling.LANCZOS)
-            
-            pil_mask = pil_mask.resize(pil_overlay.size, Image.Resampling.LANCZOS)
-            
-            # Positioning logic
-            if horizontal_align == "left": x = margin
-            elif horizontal_align == "right": x = cw - pil_overlay.width - margin
-            else: x = (cw - pil_overlay.width) // 2
-            if vertical_align == "top": y = margin
-            elif vertical_align == "bottom": y = ch - pil_overlay.height - margin
-            else: y = (ch - pil_overlay.height) // 2
-            
-            fx = int(x + x_offset + (amp * x_strength)); fy = int(y + y_offset + (amp * y_strength))
-            
-            # --- START OF FIX: Reverted to the correct paste method ---
-            # This is the original, correct logic that uses the mask properly.
-            bg_pil.paste(pil_overlay, (fx, fy), mask=pil_mask)
-            # --- END OF FIX ---
-            
-            # Write the modified frame back to the original tensor
-            video_timeline[i] = self._pil_to_tensor_single(bg_pil)
+        # The overlay only moves, so each distinct overlay/mask frame is resized once and every frame just
+        # blends the prepared sprite at its amplitude-driven position.
+        pairs = [(i % num_overlay_frames, i % overlay_mask.shape[0]) for i in range(num_video_frames)]
+        sprites = sprite_cache.OverlaySprites(("AudioReactivePaster", size), overlay_image, overlay_mask,
+                                              [pair for i, pair in enumerate(pairs) if i == 0 or pair != pairs[i - 1]])
+        # Consecutive frames with the same sprite and position are blended together, in place.
+        run_start, run = 0, None
+        for i in range(num_video_frames + 1):
+            placement = None
+            if i < num_video_frames:
+                key = overlay_idx, mask_idx = pairs[i]
+                sprite = run[3] if run is not None and run[0] == key else sprites.get(key, lambda: self._prepare_overlay(overlay_image[overlay_idx], overlay_mask[mask_idx], size))[0]
+                
+                # Positioning logic
+                if horizontal_align == "left": x = margin
+                elif horizontal_align == "right": x = cw - sprite.shape[1] - margin
+                else: x = (cw - sprite.shape[1]) // 2
+                if vertical_align == "top": y = margin
+                elif vertical_align == "bottom": y = ch - sprite.shape[0] - margin
+                else: y = (ch - sprite.shape[0]) // 2
+                
+                fx = int(x + x_offset + (final_amps[i] * x_strength)); fy = int(y + y_offset + (final_amps[i] * y_strength))
+                placement = (key, fx, fy, sprite)
+                if run is not None and placement[:3] == run[:3]: continue
+            if run is not None: compositing.blend(video_timeline[run_start:i], run[3], run[1], run[2])
+            run_start, run = i, placement
 
         # Return the modified input tensor and the visualization
         return (video_timeline, viz_tensor)
     
     
+class AudioFeatureExtractor:
+    """
+    Analyzes an audio input once into per-frame features aligned to the video fps: the energy of the
+    bass, mid and high frequency bands, onset strength, beat positions and tempo. The analysis is
+    cached by waveform, so other audio-reactive nodes using the same audio reuse it.
+    """
+    CATEGORY = "⚫mimikry/Automation/Video"
+    RETURN_TYPES = ("FLOAT", "FLOAT", "FLOAT", "FLOAT", "FLOAT", "INT", "FLOAT", "IMAGE")
+    RETURN_NAMES = ("bass", "mid", "high", "onset", "beat_pulse", "beat_frames", "tempo_bpm", "feature_visualization")
+    FUNCTION = "extract"
+    # Display names of the per-frame features, mapped to their keys in the analysis.
+    FEATURES = {"Bass": "bass", "Mid": "mid", "High": "high", "Onset": "onset", "Beat Pulse": "beat_pulse"}
+
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "audio": ("AUDIO", {"tooltip": "The audio to analyze."}),
+                "fps": ("INT", {"default": 24, "min": 1, "max": 120, "tooltip": "MUST match the FPS of your video timeline."}),
+                "num_frames": ("INT", {"default": 0, "min": 0, "max": 9999999, "step": 1, "tooltip": "Number of frames to output. 0 = the full length of the audio."}),
+                "bass_max_hz": ("FLOAT", {"default": 250.0, "min": 20.0, "max": 24000.0, "step": 1.0, "tooltip": "Upper edge of the bass band (starts at 20 Hz) and lower edge of the mid band."}),
+                "mid_max_hz": ("FLOAT", {"default": 4000.0, "min": 20.0, "max": 24000.0, "step": 1.0, "tooltip": "Upper edge of the mid band and lower edge of the high band."}),
+            }
+        }
+
+    def extract(self, audio, fps, num_frames, bass_max_hz, mid_max_hz):
+        if isinstance(audio, list): audio = audio[0]
+        features = audio_features.analyze(audio, fps, num_frames, audio_features.feature_bands(bass_max_hz, mid_max_hz))
+        frames = features["num_frames"]
+        print(f"AudioFeatureExtractor: {frames} frames, {len(features['beats'])} beats, ~{features['tempo']:.1f} BPM.")
+
+        # One row per feature, drawn as a bar graph over time.
+        rows = [features[key] for key in self.FEATURES.values()]
+        viz = np.ones((len(rows) * 50, frames, 3), dtype=np.float32)
+        for r, values in enumerate(rows):
+            heights = np.round(np.clip(values, 0, 1) * 49).astype(int)
+            filled = np.arange(50)[:, None] >= (49 - heights)[None, :]
+            viz[r * 50:(r + 1) * 50][filled] = 0.0
+        viz[:, features["beats"], 1:] *= 0.3  # Beat columns are tinted red.
+        viz_tensor = torch.from_numpy(viz).unsqueeze(0)
+
+        return ([float(v) for v in features["bass"]], [float(v) for v in features["mid"]], [float(v) for v in features["high"]],
+                [float(v) for v in features["onset"]], [float(v) for v in features["beat_pulse"]], [int(b) for b in features["beats"]], features["tempo"], viz_tensor)
+
 # FILE: nodes.py
 
 # ... (previous code, including TextOnImage) ...
 
+class _TextBlockRenderer:
+    """
+    Renders the animation steps of one AnimateTextOnImage text block. The block is laid out once from
+    its final text; completed lines are drawn once into a cached layer and every step only redraws the
+    band around the line that is still being revealed. Background blocks are normally all drawn before
+    any text, so when a block would reach into an earlier line's text the step is drawn in full instead.
+    """
+    def __init__(self, layout, full_text_layout, canvas_size, style, main_color, style_color, bg_padding, shadow_offset, stroke_width, font_size, line_height_multiplier, x_position, y_position, horizontal_align, vertical_align, margin):
+        self.layout, self.canvas_size, self.style = layout, canvas_size, style
+        self.main_color, self.style_color = main_color, style_color
+        self.bg_padding, self.shadow_offset, self.stroke_width = bg_padding, shadow_offset, stroke_width
+        self.horizontal_align = horizontal_align
+        canvas_w, canvas_h = canvas_size
+
+        self.full_width, _ = layout.size(full_text_layout)
+        lines_full, (_, self.single_line_height) = full_text_layout.split('\n'), layout.size("hg")
+        self.adjusted_line_height = self.single_line_height * line_height_multiplier
+        total_block_height = self.adjusted_line_height * (len(lines_full) - 1) + self.single_line_height if lines_full else 0
+
+        if vertical_align == "top": y_start = margin
+        elif vertical_align == "bottom": y_start = canvas_h - total_block_height - margin
+        else: y_start = (canvas_h - total_block_height) / 2
+        if horizontal_align == "left": x_start = margin
+        elif horizontal_align == "right": x_start = canvas_w - self.full_width - margin
+        else: x_start = (canvas_w - self.full_width) / 2
+        self.x_base = x_start + x_position
+        self._line_ys = [y_start + y_position]
+
+        # How far one line's drawing can reach above or below its line box (tall glyphs, stroke, shadow, block).
+        self.reach = font_size + stroke_width + abs(shadow_offset) + (bg_padding if style == "Background Block" else 0)
+        self._text_bottoms = {}
+        self.layer, self.done, self.base = None, None, None
+
+    def _line_y(self, index):
+        # Accumulated exactly like drawing line after line, so positions round the same way.
+        while len(self._line_ys) <= index: self._line_ys.append(self._line_ys[-1] + self.adjusted_line_height)
+        return self._line_ys[index]
+
+    def _line_pos(self, index, line):
+        line_width, _ = self.layout.size(line)
+        line_x_offset = (self.full_width - line_width) / 2 if self.horizontal_align == "center" else (self.full_width - line_width) if self.horizontal_align == "right" else 0
+        return (self.x_base + line_x_offset, self._line_y(index)), line_width
+
+    def _draw_block(self, draw, index, line, dy=0):
+        (x, y), line_width = self._line_pos(index, line); y -= dy
+        draw.rectangle([x - self.bg_padding, y - self.bg_padding, x + line_width + self.bg_padding, y + self.single_line_height + self.bg_padding], fill=self.style_color)
+
+    def _draw_text(self, draw, index, line, dy=0):
+        (x, y), _ = self._line_pos(index, line); y -= dy
+        if self.style == "Drop Shadow":
+            self.layout.draw(draw, (x + self.shadow_offset, y + self.shadow_offset), line, fill=self.style_color)
+        elif self.style == "Stroke":
+            self.layout.draw(draw, (x, y), line, fill=self.style_color, stroke_width=self.stroke_width, stroke_fill=self.style_color)
+        self.layout.draw(draw, (x, y), line, fill=self.main_color)
+
+    def _text_bottom(self, index, line):
+        key = (index, line)
+        if key not in self._text_bottoms:
+            bottom = max(self.layout.bbox(line)[3], self.single_line_height) + self.stroke_width + max(0, self.shadow_offset)
+            self._text_bottoms[key] = self._line_y(index) + bottom
+        return self._text_bottoms[key]
+
+    def _blocks_overlap_text(self, lines):
+        text_bottom = float('-inf')
+        for index, line in enumerate(lines):
+            if index > 0 and self._line_y(index) - self.bg_padding < text_bottom: return True
+            text_bottom = max(text_bottom, self._text_bottom(index, line))
+        return False
+
+    def _render_full(self, lines):
+        layer = Image.new('RGBA', self.canvas_size, (0, 0, 0, 0))
+        draw = ImageDraw.Draw(layer)
+        if self.style == "Background Block":
+            for index, line in enumerate(lines): self._draw_block(draw, index, line)
+        for index, line in enumerate(lines): self._draw_text(draw, index, line)
+        sprite = compositing.pil_to_sprite(layer)
+        return [sprite] if sprite is not None else []
+
+    def render(self, text):
+        """Returns the (sprite, x, y) tuples that make up the given step, to be blended in order."""
+        lines = text.split('\n')
+        if self.style == "Background Block" and self._blocks_overlap_text(lines): return self._render_full(lines)
+        done, current, index = lines[:-1], lines[-1], len(lines) - 1
+        canvas_w, canvas_h = self.canvas_size
+        top = max(0, int(np.floor(self._line_y(index) - self.reach)))
+        bottom = min(canvas_h, int(np.ceil(self._line_y(index) + self.single_line_height + self.reach)))
+
+        if done != self.done:
+            if self.done is None or done[:len(self.done)] != self.done:
+                self.layer, self.done = Image.new('RGBA', self.canvas_size, (0, 0, 0, 0)), []
+            draw = ImageDraw.Draw(self.layer)
+            for j in range(len(self.done), len(done)):
+                if self.style == "Background Block": self._draw_block(draw, j, done[j])
+                self._draw_text(draw, j, done[j])
+            self.done = list(done)
+            # The completed lines, minus the band that the current line's patch replaces, trimmed
+            # to what is still visible so each blend only touches the dirty rectangle.
+            self.base = compositing.pil_to_sprite(self.layer)
+            if self.base is not None:
+                sprite, x, y = self.base
+                sprite[max(0, top - y):max(0, bottom - y)] = 0
+                self.base = compositing.trim(sprite, x, y)
+
+        sprites = [self.base] if self.base is not None else []
+        if bottom > top:
+            patch = self.layer.crop((0, top, canvas_w, bottom))
+            draw = ImageDraw.Draw(patch)
+            if self.style == "Background Block": self._draw_block(draw, index, current, top)
+            self._draw_text(draw, index, current, top)
+            sprite = compositing.pil_to_sprite(patch)
+            if sprite is not None: sprites.append((sprite[0], sprite[1], sprite[2] + top))
+        return sprites
+
 class AnimateTextOnImage:
     CATEGORY = "⚫mimikry/Automation/Image"
     RETURN_TYPES = ("IMAGE",)
@@ -986,16 +1482,7 @@ class AnimateTextOnImage:
     
     @classmethod
     def INPUT_TYPES(s):
-        font_files = set(["arial.ttf", "verdana.ttf", "tahoma.ttf", "cour.ttf", "times.ttf", "DejaVuSans.ttf", "LiberationSans-Regular.ttf"])
-        font_dirs = []
-        if os.name == 'nt': font_dirs.append(os.path.join(os.environ.get('WINDIR', 'C:\\Windows'), 'Fonts'))
-        elif os.name == 'posix': font_dirs.extend(['/usr/share/fonts/truetype/', '/usr/local/share/fonts/', '~/.fonts/', '/System/Library/Fonts/', '/Library/Fonts/'])
-        for directory in font_dirs:
-            try:
-                if os.path.exists(os.path.expanduser(directory)):
-                    for f in os.listdir(os.path.expanduser(directory)):
-                        if f.lower().endswith('.ttf'): font_files.add(f)
-            except: pass
+        font_files = font_registry.list_fonts()
 
         return {
             "required": {
@@ -1004,7 +1491,7 @@ class AnimateTextOnImage:
                 "animation_type": (["Typewriter (Character by Character)", "Reveal (Word by Word)"],),
                 "animation_duration": ("INT", {"default": 30, "min": 1, "max": 9999, "tooltip": "Duration of the typing/reveal effect for each text block."}),
                 "duration_unit": (["Frames", "Percent of Text Duration"], {"default": "Frames", "tooltip": "'Frames': Fixed duration. 'Percent': Duration is a percentage of the text's total display time."}),
-                "font_name": (sorted(list(font_files)),),
+                "font_name": (font_files,),
                 "font_size": ("INT", {"default": 50, "min": 1, "max": 1024, "step": 1}),
                 "font_color": ("STRING", {"default": "255, 255, 255, 255", "tooltip": "R,G,B,A format for the main text."}),
                 "wrap_width": ("INT", {"default": 0, "min": 0, "max": 8192, "step": 1}),
@@ -1023,53 +1510,6 @@ class AnimateTextOnImage:
             "optional": { "text_durations": ("INT", {"forceInput": True}) }
         }
 
-    def find_font(self, font_name):
-        font_dirs = [];
-        if os.name == 'nt': font_dirs.append(os.path.join(os.environ.get('WINDIR', 'C:\\Windows'), 'Fonts'))
-        elif os.name == 'posix': font_dirs.extend(['/usr/share/fonts/truetype/', '/usr/local/share/fonts/', '~/.fonts/', '/System/Library/Fonts/', '/Library/Fonts/'])
-        for directory in font_dirs:
-            font_path = os.path.join(os.path.expanduser(directory), font_name)
-            if os.path.exists(font_path): return font_path
-        print(f"ComfyUI_Automation: Font '{font_name}' not found. Falling back to default."); return "DejaVuSans.ttf"
-
-    def _get_text_size(self, draw, text, main_font, emoji_font):
-        if emoji_font is None:
-            try: bbox = draw.textbbox((0,0), text, font=main_font); return bbox[2] - bbox[0], bbox[3] - bbox[1]
-            except TypeError: return 0, 0
-        total_width = 0; min_y, max_y = float('inf'), float('-inf')
-        for part in self.EMOJI_SPLIT_REGEX.split(text):
-            if not part: continue
-            font = emoji_font if self.EMOJI_SPLIT_REGEX.match(part) else main_font
-            try:
-                bbox = draw.textbbox((0,0), part, font=font); total_width += bbox[2] - bbox[0]; min_y, max_y = min(min_y, bbox[1]), max(max_y, bbox[3])
-            except TypeError: pass
-        max_height = max_y - min_y if min_y != float('inf') else 0; return total_width, max_height
-
-    def _wrap_text(self, text: str, main_font, emoji_font, max_width: int, draw) -> str:
-        lines, words = [], text.split(' ')
-        if not words: return ""
-        current_line = words[0]
-        for word in words[1:]:
-            test_line = f"{current_line} {word}"
-            line_width, _ = self._get_text_size(draw, test_line, main_font, emoji_font)
-            if line_width <= max_width: current_line = test_line
-            else: lines.append(current_line); current_line = word
-        lines.append(current_line); return "\n".join(lines)
-    
-    def _draw_text_chunked(self, draw, pos, text, main_font, emoji_font, fill, **kwargs):
-        x, y = pos
-        for part in self.EMOJI_SPLIT_REGEX.split(text):
-            if not part: continue
-            is_emoji = self.EMOJI_SPLIT_REGEX.match(part)
-            font_to_use = emoji_font if is_emoji and emoji_font else main_font
-            stroke_width = kwargs.get('stroke_width', 0)
-            stroke_fill = kwargs.get('stroke_fill', None)
-            # Pillow's text function handles the actual drawing
-            draw.text((x, y), part, font=font_to_use, fill=fill, embedded_color=True, stroke_width=stroke_width, stroke_fill=stroke_fill)
-            # We need to manually calculate the width to advance the cursor
-            part_width, _ = self._get_text_size(draw, part, main_font, emoji_font)
-            x += part_width
-    
     def _parse_color(self, color_string, default_color):
         try:
             parts = [int(c.strip()) for c in color_string.split(',')];
@@ -1079,7 +1519,8 @@ class AnimateTextOnImage:
 
     def animate_text(self, background_image, text, animation_type, animation_duration, duration_unit, font_name, font_size, font_color, wrap_width, line_height_multiplier, style, style_color, bg_padding, shadow_offset, stroke_width, x_position, y_position, horizontal_align, vertical_align, margin, text_durations=None):
         
-        output_tensor = background_image
+        # Text is blended in place, so draw on a copy and leave the input batch untouched.
+        output_tensor = background_image.clone()
         num_bg_frames = output_tensor.shape[0]
 
         text_list = [text] if isinstance(text, str) else text
@@ -1091,93 +1532,363 @@ class AnimateTextOnImage:
                 except ValueError: durations = [num_bg_frames]
         else:
             durations = [num_bg_frames] * len(text_list)
-        font_path = self.find_font(font_name)
-        try: main_font = ImageFont.truetype(font_path, font_size)
-        except IOError: main_font = ImageFont.load_default()
+        main_font = font_registry.get_font(font_name, font_size)
         main_color_tuple = self._parse_color(font_color, (255, 255, 255, 255))
         style_color_tuple = self._parse_color(style_color, (0, 0, 0, 128))
         emoji_font = self._load_emoji_font(font_size)
-        temp_draw = ImageDraw.Draw(Image.new('RGBA', (1,1)))
+        layout = TextLayout(main_font, emoji_font, self.EMOJI_SPLIT_REGEX)
 
-        frame_to_text_info = {}
+        # Each frame maps to (text index, length of the revealed prefix), or None for the full text.
+        # Greedy wrapping is prefix-stable, so every step is a prefix of one wrapped string.
+        blocks, frame_steps = [], [None] * num_bg_frames
         current_frame = 0
         for i, text_item in enumerate(text_list):
             if i >= len(durations): break
             display_duration = durations[i]
             anim_dur = int(display_duration * (animation_duration / 100.0)) if duration_unit == "Percent of Text Duration" else animation_duration
             anim_dur = max(1, min(anim_dur, display_duration))
-            final_text = self._wrap_text(text_item, main_font, emoji_font, wrap_width, temp_draw) if wrap_width > 0 else text_item
-            animation_steps = []
+            final_text = layout.wrap(text_item, wrap_width, ink_width=True) if wrap_width > 0 else text_item
             if animation_type == "Typewriter (Character by Character)":
-                animation_steps = [final_text[:j+1] for j in range(len(final_text))]
+                step_source, step_ends = final_text, range(1, len(final_text) + 1)
             else:
                 unwrapped_words = text_item.split()
-                animation_steps = [self._wrap_text(" ".join(unwrapped_words[:j+1]), main_font, emoji_font, wrap_width, temp_draw) if wrap_width > 0 else " ".join(unwrapped_words[:j+1]) for j in range(len(unwrapped_words))]
-            num_steps, frames_per_step = len(animation_steps), anim_dur / len(animation_steps) if len(animation_steps) > 0 else float('inf')
+                step_source = layout.wrap(" ".join(unwrapped_words), wrap_width, ink_width=True) if wrap_width > 0 else " ".join(unwrapped_words)
+                step_ends = list(np.cumsum([len(w) + 1 for w in unwrapped_words]) - 1)
+            blocks.append((final_text, step_source))
+            num_steps, frames_per_step = len(step_ends), anim_dur / len(step_ends) if len(step_ends) > 0 else float('inf')
             for frame_offset in range(display_duration):
                 frame_idx = current_frame + frame_offset
                 if frame_idx >= num_bg_frames: break
-                text_to_draw = final_text
+                step_end = None
                 if frame_offset < anim_dur and num_steps > 0:
-                    text_to_draw = animation_steps[min(int(frame_offset / frames_per_step), num_steps - 1)]
-                frame_to_text_info[frame_idx] = {"full_text_layout": final_text, "draw_text": text_to_draw}
+                    step_end = int(step_ends[min(int(frame_offset / frames_per_step), num_steps - 1)])
+                    # The last step usually shows the full text, so it joins the same run as the hold after it.
+                    if step_end == len(step_source) and step_source == final_text: step_end = None
+                frame_steps[frame_idx] = (i, step_end)
             current_frame += display_duration
 
-        canvas_w, canvas_h = output_tensor.shape[2], output_tensor.shape[1]
-        for i in range(num_bg_frames):
-            text_info = frame_to_text_info.get(i)
-            if not (text_info and text_info["draw_text"]): continue
-
-            bg_tensor_frame = output_tensor[i]
-            bg_pil = Image.fromarray((bg_tensor_frame.cpu().numpy() * 255).astype(np.uint8)).convert("RGBA")
-            text_layer = Image.new('RGBA', bg_pil.size, (0, 0, 0, 0))
-            draw = ImageDraw.Draw(text_layer)
-
-            full_text_layout, current_text = text_info["full_text_layout"], text_info["draw_text"]
-            full_width, _ = self._get_text_size(temp_draw, full_text_layout, main_font, emoji_font)
-            lines_full, (_, single_line_height) = full_text_layout.split('\n'), self._get_text_size(temp_draw, "hg", main_font, emoji_font)
-            adjusted_line_height = single_line_height * line_height_multiplier
-            total_block_height = adjusted_line_height * (len(lines_full) - 1) + single_line_height if lines_full else 0
-            
-            if vertical_align == "top": y_start = margin
-            elif vertical_align == "bottom": y_start = canvas_h - total_block_height - margin
-            else: y_start = (canvas_h - total_block_height) / 2
-            if horizontal_align == "left": x_start = margin
-            elif horizontal_align == "right": x_start = canvas_w - full_width - margin
-            else: x_start = (canvas_w - full_width) / 2
-            final_x_base, final_y_base = x_start + x_position, y_start + y_position
-            
-            lines_to_draw = current_text.split('\n')
+        # Frames that show the same step share one render and one batched blend.
+        # Text blocks follow each other on the timeline, so only the current block's renderer is kept.
+        canvas_size = (output_tensor.shape[2], output_tensor.shape[1])
+        renderer, renderer_block = None, None
+        run_start = 0
+        for f in range(1, num_bg_frames + 1):
+            if f < num_bg_frames and frame_steps[f] == frame_steps[run_start]: continue
+            step = frame_steps[run_start]
+            if step is not None:
+                final_text, step_source = blocks[step[0]]
+                text_to_draw = final_text if step[1] is None else step_source[:step[1]]
+                if text_to_draw:
+                    if renderer_block != step[0]:
+                        renderer, renderer_block = _TextBlockRenderer(layout, final_text, canvas_size, style, main_color_tuple, style_color_tuple, bg_padding, shadow_offset, stroke_width, font_size, line_height_multiplier, x_position, y_position, horizontal_align, vertical_align, margin), step[0]
+                    for sprite in renderer.render(text_to_draw):
+                        compositing.blend(output_tensor[run_start:f], *sprite)
+            run_start = f
 
-            if style == "Background Block":
-                current_y_bg = final_y_base
-                for line in lines_to_draw:
-                    line_width, _ = self._get_text_size(temp_draw, line, main_font, emoji_font)
-                    line_x_offset = (full_width - line_width) / 2 if horizontal_align == "center" else (full_width - line_width) if horizontal_align == "right" else 0
-                    line_pos = (final_x_base + line_x_offset, current_y_bg)
-                    draw.rectangle([line_pos[0] - bg_padding, line_pos[1] - bg_padding, line_pos[0] + line_width + bg_padding, line_pos[1] + single_line_height + bg_padding], fill=style_color_tuple)
-                    current_y_bg += adjusted_line_height
-
-            current_y_text = final_y_base
-            for line in lines_to_draw:
-                line_width, _ = self._get_text_size(temp_draw, line, main_font, emoji_font)
-                line_x_offset = (full_width - line_width) / 2 if horizontal_align == "center" else (full_width - line_width) if horizontal_align == "right" else 0
-                line_pos = (final_x_base + line_x_offset, current_y_text)
-
-                if style == "Drop Shadow":
-                    shadow_pos = (line_pos[0] + shadow_offset, line_pos[1] + shadow_offset)
-                    self._draw_text_chunked(draw, shadow_pos, line, main_font, emoji_font, fill=style_color_tuple)
-                elif style == "Stroke":
-                    self._draw_text_chunked(draw, line_pos, line, main_font, emoji_font, fill=style_color_tuple, stroke_width=stroke_width, stroke_fill=style_color_tuple)
-                
-                self._draw_text_chunked(draw, line_pos, line, main_font, emoji_font, fill=main_color_tuple)
-                current_y_text += adjusted_line_height
+        return (output_tensor,)
+    
+class _CaptionTrack:
+    """
+    Timed captions for a timeline, shared by the caption nodes. Each cue is laid out once into a
+    base sprite (the styled text) plus, for karaoke highlighting, one premultiplied sprite per word.
+    `burn()` composites them onto any run of frames given the time of its first frame, so a long
+    timeline can be processed in chunks while cues are still rendered only once.
+    SRT only times whole cues, so word starts are spread across each cue by word length.
+    """
+    HIGHLIGHT_MODES = ["None", "Spoken Words", "Current Word"]
+
+    def __init__(self, texts, starts, ends, layout, canvas_size, font_size, main_color, highlight_color, style, style_color, bg_padding, shadow_offset, stroke_width, line_height_multiplier, wrap_width, x_position, y_position, horizontal_align, vertical_align, margin, highlight_mode="None"):
+        cues = [(text.split(), s, e) for text, s, e in zip(texts, starts, ends) if text and text.strip() and e > s]
+        cues.sort(key=lambda c: c[1])
+        self.cues = cues
+        self.cue_starts = np.array([c[1] for c in cues], dtype=np.float64)
+        self.word_starts = [self._word_starts(words, s, e) for words, s, e in cues]
+        self.layout, self.canvas_size, self.highlight_mode = layout, canvas_size, highlight_mode
+        self.font_size, self.main_color, self.highlight_color = font_size, main_color, highlight_color
+        self.style, self.style_color, self.bg_padding, self.shadow_offset, self.stroke_width = style, style_color, bg_padding, shadow_offset, stroke_width
+        self.line_height_multiplier, self.wrap_width = line_height_multiplier, wrap_width
+        self.x_position, self.y_position, self.horizontal_align, self.vertical_align, self.margin = x_position, y_position, horizontal_align, vertical_align, margin
+        self._rendered = {}
+
+    def _word_starts(self, words, start_ms, end_ms):
+        # Longer words take longer to say; each word's share of the cue follows its length (plus its space).
+        weights = np.cumsum([0] + [len(w) + 1 for w in words], dtype=np.float64)
+        return start_ms + (end_ms - start_ms) * weights[:-1] / weights[-1]
+
+    def _render_cue(self, words):
+        """
+        Lays a cue out once. Returns its base sprite (every word in the main color, with the style)
+        and one premultiplied highlight sprite per word, each as (sprite, x, y) or None.
+        """
+        layout = self.layout
+        canvas_w, canvas_h = self.canvas_size
+        text = " ".join(words)
+        lines = (layout.wrap(text, self.wrap_width) if self.wrap_width > 0 else text).split('\n')
+        single_line_height = layout.bbox("hg")[3]
+        adjusted_line_height = single_line_height * self.line_height_multiplier
+        block_width = max(layout.bbox(line)[2] for line in lines)
+        block_height = adjusted_line_height * (len(lines) - 1) + single_line_height
+
+        if self.vertical_align == "top": y_start = self.margin
+        elif self.vertical_align == "bottom": y_start = canvas_h - block_height - self.margin
+        else: y_start = (canvas_h - block_height) / 2
+        if self.horizontal_align == "left": x_start = self.margin
+        elif self.horizontal_align == "right": x_start = canvas_w - block_width - self.margin
+        else: x_start = (canvas_w - block_width) / 2
+        x_start += self.x_position; y_start += self.y_position
+
+        line_positions = []
+        current_y = y_start
+        for line in lines:
+            line_width = layout.bbox(line)[2]
+            line_x_offset = (block_width - line_width) / 2 if self.horizontal_align == "center" else (block_width - line_width) if self.horizontal_align == "right" else 0
+            line_positions.append((x_start + line_x_offset, current_y))
+            current_y += adjusted_line_height
+
+        # Draw on a layer that just covers the cue; its whole-pixel origin at or before every anchor keeps
+        # subpixel glyph placement identical to drawing on the full frame.
+        reach = self.font_size + self.stroke_width + abs(self.shadow_offset) + self.bg_padding
+        ox, oy = int(np.floor(x_start)) - reach, int(np.floor(y_start)) - reach
+        size = (int(np.ceil(block_width + 2 * reach)) + 1, int(np.ceil(block_height + 2 * reach)) + 1)
+        layer = Image.new('RGBA', size, (0, 0, 0, 0)); draw = ImageDraw.Draw(layer)
+        for line, (x, y) in zip(lines, line_positions):
+            if self.style == "Background Block":
+                line_width = layout.bbox(line)[2]
+                draw.rectangle([x - ox - self.bg_padding, y - oy - self.bg_padding, x - ox + line_width + self.bg_padding, y - oy + single_line_height + self.bg_padding], fill=self.style_color)
+        for line, (x, y) in zip(lines, line_positions):
+            if self.style == "Drop Shadow": layout.draw(draw, (x - ox + self.shadow_offset, y - oy + self.shadow_offset), line, fill=self.style_color)
+            elif self.style == "Stroke": layout.draw(draw, (x - ox, y - oy), line, fill=self.style_color, stroke_width=self.stroke_width, stroke_fill=self.style_color)
+            layout.draw(draw, (x - ox, y - oy), line, fill=self.main_color)
+        base = compositing.pil_to_sprite(layer)
+        if base is not None: base = (base[0], base[1] + ox, base[2] + oy)
+        if self.highlight_mode == "None": return base, []
+
+        # One coverage mask per word, recolored once into its highlight sprite.
+        color = torch.tensor(self.highlight_color[:3], dtype=torch.float32) / 255.0; alpha = self.highlight_color[3] / 255.0
+        word_sprites = []
+        for line, (x, y) in zip(lines, line_positions):
+            prefix = ""
+            for word in line.split(' '):
+                word_x = x + layout.advance(prefix) if prefix else x
+                mask_layer = Image.new('RGBA', size, (0, 0, 0, 0))
+                layout.draw(ImageDraw.Draw(mask_layer), (word_x - ox, y - oy), word, fill=(255, 255, 255, 255))
+                bbox = mask_layer.getchannel("A").getbbox()
+                if bbox is None: word_sprites.append(None)
+                else:
+                    mask = torch.from_numpy(np.asarray(mask_layer.getchannel("A").crop(bbox), dtype=np.float32) / 255.0).unsqueeze(-1) * alpha
+                    word_sprites.append((torch.cat((color * mask, mask), dim=-1), bbox[0] + ox, bbox[1] + oy))
+                prefix += word + " "
+        return base, word_sprites
+
+    def frame_states(self, frame_times):
+        """Maps frame timestamps (ms) to (cue, highlighted word) states, or None where no cue is showing."""
+        cue_index = np.searchsorted(self.cue_starts, frame_times, side='right') - 1
+        states = []
+        for t, c in zip(frame_times, cue_index):
+            if c < 0 or t >= self.cues[c][2]: states.append(None)
+            elif self.highlight_mode == "None": states.append((int(c), -1))
+            else: states.append((int(c), int(np.searchsorted(self.word_starts[c], t, side='right')) - 1))
+        return states
+
+    def burn(self, frames, start_ms, fps):
+        """Composites the captions onto a (B, H, W, 3) frame batch in place; frame 0 is shown at start_ms."""
+        num_frames = frames.shape[0]
+        if num_frames == 0 or not self.cues: return frames
+        states = self.frame_states(start_ms + np.arange(num_frames) * (1000.0 / fps))
+        run_start = 0
+        for f in range(1, num_frames + 1):
+            if f < num_frames and states[f] == states[run_start]: continue
+            state = states[run_start]
+            if state is not None:
+                c, word = state
+                if c not in self._rendered:
+                    self._rendered.clear()  # Cues are visited in order; only the current one needs to stay cached.
+                    self._rendered[c] = self._render_cue(self.cues[c][0])
+                base, word_sprites = self._rendered[c]
+                run = frames[run_start:f]
+                if base is not None: compositing.blend(run, *base)
+                if self.highlight_mode == "Spoken Words": highlighted = word_sprites[:word + 1]
+                elif self.highlight_mode == "Current Word": highlighted = word_sprites[word:word + 1]
+                else: highlighted = []
+                for sprite in highlighted:
+                    if sprite is not None: compositing.blend(run, *sprite)
+            run_start = f
+        return frames
+
+class KaraokeCaptions:
+    """
+    Burns SRT captions into a video timeline with word-by-word karaoke highlighting. Each cue is
+    laid out and rendered once; every word gets a cached highlight sprite, and each frame only
+    blends the sprites of the words its timestamp has reached.
+    """
+    CATEGORY = "⚫mimikry/Automation/Video"
+    RETURN_TYPES = ("IMAGE",)
+    RETURN_NAMES = ("image_timeline",)
+    FUNCTION = "render_captions"
 
-            composited_image = Image.alpha_composite(bg_pil, text_layer).convert("RGB")
-            output_tensor[i] = torch.from_numpy(np.array(composited_image).astype(np.float32) / 255.0)
+    @classmethod
+    def INPUT_TYPES(s):
+        font_files = font_registry.list_fonts()
+        return {
+            "required": {
+                "background_image": ("IMAGE", {"tooltip": "The video timeline to burn the captions into. The input is left unchanged; the captions are drawn into a copy."}),
+                "text_batch": ("STRING", {"forceInput": True, "tooltip": "Connect the 'text_batch' from an SRT Parser here. Empty entries (pauses) are skipped."}),
+                "start_ms_batch": ("INT", {"forceInput": True, "tooltip": "Connect the 'start_ms_batch' from an SRT Parser here."}),
+                "end_ms_batch": ("INT", {"forceInput": True, "tooltip": "Connect the 'end_ms_batch' from an SRT Parser here."}),
+                "fps": ("INT", {"default": 24, "min": 1, "max": 120, "tooltip": "MUST match the FPS of your background video timeline."}),
+                "highlight_mode": (["Spoken Words", "Current Word"], {"default": "Spoken Words", "tooltip": "'Spoken Words': Every word that has been reached stays highlighted. 'Current Word': Only the word being spoken is highlighted."}),
+                "font_name": (font_files, {"tooltip": "The font file to use."}),
+                "font_size": ("INT", {"default": 50, "min": 1, "max": 1024, "step": 1}),
+                "font_color": ("STRING", {"default": "255, 255, 255, 255", "tooltip": "R,G,B,A format for words that are not highlighted."}),
+                "highlight_color": ("STRING", {"default": "255, 220, 0, 255", "tooltip": "R,G,B,A format for highlighted words."}),
+                "wrap_width": ("INT", {"default": 0, "min": 0, "max": 8192, "step": 1, "tooltip": "Maximum width in pixels for text wrapping. Set to 0 to disable wrapping."}),
+                "line_height_multiplier": ("FLOAT", {"default": 1.2, "min": 0.5, "max": 3.0, "step": 0.1, "round": 0.01}),
+                "style": (["None", "Background Block", "Drop Shadow", "Stroke"], {"default": "Stroke"}),
+                "style_color": ("STRING", {"default": "0, 0, 0, 255", "tooltip": "R,G,B,A format for the chosen style (background, shadow, or stroke color)."}),
+                "bg_padding": ("INT", {"default": 10, "min": 0, "max": 200, "step": 1, "tooltip": "Padding for the Background Block."}),
+                "shadow_offset": ("INT", {"default": 5, "min": -100, "max": 100, "step": 1, "tooltip": "Offset for the Drop Shadow."}),
+                "stroke_width": ("INT", {"default": 3, "min": 0, "max": 50, "step": 1, "tooltip": "Width of the text stroke."}),
+                "x_position": ("INT", {"default": 0, "min": -8192, "max": 8192, "step": 1}),
+                "y_position": ("INT", {"default": 0, "min": -8192, "max": 8192, "step": 1}),
+                "horizontal_align": (["left", "center", "right"], {"default": "center"}),
+                "vertical_align": (["top", "center", "bottom"], {"default": "bottom"}),
+                "margin": ("INT", {"default": 60, "min": 0, "max": 1024, "step": 1}),
+            },
+            "optional": {
+                "timeline_start_ms": ("INT", {"default": 0, "min": 0, "max": 2**31 - 1, "step": 1, "tooltip": "SRT time of the first frame of the timeline, for timelines that start partway through the subtitles."}),
+            }
+        }
+
+    def _parse_color(self, color_string, default_color):
+        try:
+            parts = [int(c.strip()) for c in color_string.split(',')]
+            if len(parts) == 3: parts.append(255)
+            return tuple(parts)
+        except: return default_color
 
+    def render_captions(self, background_image, text_batch, start_ms_batch, end_ms_batch, fps, highlight_mode, font_name, font_size, font_color, highlight_color, wrap_width, line_height_multiplier, style, style_color, bg_padding, shadow_offset, stroke_width, x_position, y_position, horizontal_align, vertical_align, margin, timeline_start_ms=0):
+        # Captions are blended in place, so draw on a copy and leave the input (and ComfyUI's cached output upstream) untouched.
+        output_tensor = background_image.clone()
+        texts = [text_batch] if isinstance(text_batch, str) else list(text_batch)
+        starts = [start_ms_batch] if isinstance(start_ms_batch, int) else list(start_ms_batch)
+        ends = [end_ms_batch] if isinstance(end_ms_batch, int) else list(end_ms_batch)
+        if not (len(texts) == len(starts) == len(ends)):
+            print(f"KaraokeCaptions: Warning! Got {len(texts)} texts, {len(starts)} start times and {len(ends)} end times. Extra entries are ignored.")
+
+        main_font = font_registry.get_font(font_name, font_size)
+        helper = TextOnImage()
+        layout = TextLayout(main_font, helper._load_emoji_font(font_size), helper.EMOJI_SPLIT_REGEX)
+        canvas_size = (output_tensor.shape[2], output_tensor.shape[1])
+        track = _CaptionTrack(texts, starts, ends, layout, canvas_size, font_size, self._parse_color(font_color, (255, 255, 255, 255)), self._parse_color(highlight_color, (255, 220, 0, 255)),
+                              style, self._parse_color(style_color, (0, 0, 0, 255)), bg_padding, shadow_offset, stroke_width, line_height_multiplier, wrap_width,
+                              x_position, y_position, horizontal_align, vertical_align, margin, highlight_mode)
+        if not track.cues:
+            print("KaraokeCaptions: No captions to render."); return (output_tensor,)
+
+        track.burn(output_tensor, timeline_start_ms, fps)
+        print(f"KaraokeCaptions: Rendered {len(track.cues)} captions over {output_tensor.shape[0]} frames.")
         return (output_tensor,)
-    
+
+class SubtitleBurnIn:
+    """
+    Burns SRT captions into a video file or frame folder without loading the whole timeline.
+    Frames are streamed through in fixed-size chunks: each chunk is read, captioned with the shared
+    caption track (cues are still laid out only once) and written straight to the encoder or to
+    frame files, so peak memory stays at one chunk regardless of the video's length.
+    """
+    CATEGORY = "⚫mimikry/Automation/Video"
+    RETURN_TYPES = ("STRING", "INT")
+    RETURN_NAMES = ("output_path", "frame_count")
+    FUNCTION = "burn_in"
+    OUTPUT_NODE = True
+
+    @classmethod
+    def INPUT_TYPES(s):
+        font_files = font_registry.list_fonts()
+        return {
+            "required": {
+                "source_path": ("STRING", {"multiline": False, "default": "", "tooltip": "A video file (needs ffmpeg) or a folder of numbered frame images to read."}),
+                "output_path": ("STRING", {"multiline": False, "default": "", "tooltip": "A video file such as 'out.mp4' (needs ffmpeg), or a folder (a path without extension) to write numbered PNG frames into."}),
+                "text_batch": ("STRING", {"forceInput": True, "tooltip": "Connect the 'text_batch' from an SRT Parser here. Empty entries (pauses) are skipped."}),
+                "start_ms_batch": ("INT", {"forceInput": True, "tooltip": "Connect the 'start_ms_batch' from an SRT Parser here."}),
+                "end_ms_batch": ("INT", {"forceInput": True, "tooltip": "Connect the 'end_ms_batch' from an SRT Parser here."}),
+                "fps": ("INT", {"default": 0, "min": 0, "max": 120, "tooltip": "Frame rate of the source. 0 uses the video's own frame rate (24 for frame folders)."}),
+                "chunk_size": ("INT", {"default": 32, "min": 1, "max": 1024, "step": 1, "tooltip": "Frames processed at a time. Peak memory is about chunk_size x width x height x 12 bytes."}),
+                "highlight_mode": (_CaptionTrack.HIGHLIGHT_MODES, {"default": "None", "tooltip": "'None': Plain subtitles. 'Spoken Words' / 'Current Word': Karaoke highlighting, like the Karaoke Captions node."}),
+                "font_name": (font_files, {"tooltip": "The font file to use."}),
+                "font_size": ("INT", {"default": 50, "min": 1, "max": 1024, "step": 1}),
+                "font_color": ("STRING", {"default": "255, 255, 255, 255", "tooltip": "R,G,B,A format."}),
+                "highlight_color": ("STRING", {"default": "255, 220, 0, 255", "tooltip": "R,G,B,A format for highlighted words (karaoke modes only)."}),
+                "wrap_width": ("INT", {"default": 0, "min": 0, "max": 8192, "step": 1, "tooltip": "Maximum width in pixels for text wrapping. Set to 0 to disable wrapping."}),
+                "line_height_multiplier": ("FLOAT", {"default": 1.2, "min": 0.5, "max": 3.0, "step": 0.1, "round": 0.01}),
+                "style": (["None", "Background Block", "Drop Shadow", "Stroke"], {"default": "Stroke"}),
+                "style_color": ("STRING", {"default": "0, 0, 0, 255", "tooltip": "R,G,B,A format for the chosen style (background, shadow, or stroke color)."}),
+                "bg_padding": ("INT", {"default": 10, "min": 0, "max": 200, "step": 1, "tooltip": "Padding for the Background Block."}),
+                "shadow_offset": ("INT", {"default": 5, "min": -100, "max": 100, "step": 1, "tooltip": "Offset for the Drop Shadow."}),
+                "stroke_width": ("INT", {"default": 3, "min": 0, "max": 50, "step": 1, "tooltip": "Width of the text stroke."}),
+                "x_position": ("INT", {"default": 0, "min": -8192, "max": 8192, "step": 1}),
+                "y_position": ("INT", {"default": 0, "min": -8192, "max": 8192, "step": 1}),
+                "horizontal_align": (["left", "center", "right"], {"default": "center"}),
+                "vertical_align": (["top", "center", "bottom"], {"default": "bottom"}),
+                "margin": ("INT", {"default": 60, "min": 0, "max": 1024, "step": 1}),
+            },
+            "optional": {
+                "ffmpeg_args": ("STRING", {"multiline": False, "default": video_io.DEFAULT_FFMPEG_ARGS, "tooltip": "Encoder arguments used when writing a video file."}),
+                "keep_audio": ("BOOLEAN", {"default": True, "tooltip": "When both source and output are video files, copy the source's audio track into the output."}),
+            }
+        }
+
+    def burn_in(self, source_path, output_path, text_batch, start_ms_batch, end_ms_batch, fps, chunk_size, highlight_mode, font_name, font_size, font_color, highlight_color, wrap_width, line_height_multiplier, style, style_color, bg_padding, shadow_offset, stroke_width, x_position, y_position, horizontal_align, vertical_align, margin, ffmpeg_args=video_io.DEFAULT_FFMPEG_ARGS, keep_audio=True):
+        if not source_path or not os.path.exists(source_path):
+            return (f"Error: Source not found at '{source_path}'.", 0)
+        if not output_path:
+            return ("Error: An output path is required.", 0)
+        texts = [text_batch] if isinstance(text_batch, str) else list(text_batch)
+        starts = [start_ms_batch] if isinstance(start_ms_batch, int) else list(start_ms_batch)
+        ends = [end_ms_batch] if isinstance(end_ms_batch, int) else list(end_ms_batch)
+
+        reader = writer = None
+        try:
+            reader = video_io.open_reader(source_path)
+            frame_rate = fps or reader.fps or 24
+            audio_source = source_path if keep_audio and not os.path.isdir(source_path) else None
+            writer = video_io.open_writer(output_path, reader.width, reader.height, frame_rate, ffmpeg_args, audio_source)
+
+            parse = KaraokeCaptions()._parse_color
+            main_font = font_registry.get_font(font_name, font_size)
+            helper = TextOnImage()
+            layout = TextLayout(main_font, helper._load_emoji_font(font_size), helper.EMOJI_SPLIT_REGEX)
+            track = _CaptionTrack(texts, starts, ends, layout, (reader.width, reader.height), font_size, parse(font_color, (255, 255, 255, 255)), parse(highlight_color, (255, 220, 0, 255)),
+                                  style, parse(style_color, (0, 0, 0, 255)), bg_padding, shadow_offset, stroke_width, line_height_multiplier, wrap_width,
+                                  x_position, y_position, horizontal_align, vertical_align, margin, highlight_mode)
+
+            print(f"SubtitleBurnIn: Burning {len(track.cues)} captions into '{source_path}' at {frame_rate:g} fps, {chunk_size} frames at a time...")
+            frame_index = 0
+            # The next chunk is decoded on a background thread while the current one is captioned and encoded.
+            with ThreadPoolExecutor(max_workers=1) as prefetcher:
+                pending = prefetcher.submit(reader.read, chunk_size)
+                while True:
+                    chunk = pending.result()
+                    if len(chunk) == 0: break
+                    pending = prefetcher.submit(reader.read, chunk_size)
+                    frames = torch.from_numpy(chunk).to(torch.float32).div_(255.0)
+                    track.burn(frames, frame_index * 1000.0 / frame_rate, frame_rate)
+                    writer.write(frames.mul_(255.0).round_().clamp_(0, 255).to(torch.uint8).numpy())
+                    frame_index += len(chunk)
+            writer.close(); writer = None
+            print(f"SubtitleBurnIn: Wrote {frame_index} frames to '{output_path}'.")
+            return (output_path, frame_index)
+        except Exception as e:
+            error_message = f"SubtitleBurnIn: FAILED. Error: {e}"
+            print(error_message)
+            traceback.print_exc()
+            return (error_message, 0)
+        finally:
+            if writer is not None:
+                try: writer.close()
+                except Exception: pass
+            if reader is not None: reader.close()
+
 # --- UTILITY NODES ---
 class StringBatchToString:
     CATEGORY = "⚫mimikry/Automation/Utils"; RETURN_TYPES, RETURN_NAMES = ("STRING",), ("string",); FUNCTION = "convert"
@@ -1328,15 +2039,11 @@ class TransformPaster:
             np_array = np_array.squeeze(-1)
         return Image.fromarray(np_array)
 
-    def _pil_to_tensor(self, pil_image):
-        return torch.from_numpy(np.array(pil_image).astype(np.float32) / 255.0).unsqueeze(0)
-
     def process(self, background_image, overlay_image, overlay_mask, size, rotation, x_offset, y_offset, interpolation):
-        bg_pil = self._tensor_to_pil(background_image)
         overlay_pil = self._tensor_to_pil(overlay_image)
         mask_pil = self._tensor_to_pil(overlay_mask, is_mask=True)
 
-        if bg_pil is None or overlay_pil is None or mask_pil is None:
+        if background_image is None or overlay_pil is None or mask_pil is None:
             return (torch.zeros((1, 64, 64, 3)),)
 
         resampling_filter = getattr(Image.Resampling, interpolation, Image.Resampling.LANCZOS)
@@ -1362,16 +2069,14 @@ class TransformPaster:
             # --- END OF FIX ---
             
         # 3. Paste onto the background
-        bg_rgba = bg_pil.convert("RGBA")
+        output_tensor = background_image[:1].clone()
         
-        canvas_center_x, canvas_center_y = bg_rgba.width // 2, bg_rgba.height // 2
+        canvas_center_x, canvas_center_y = output_tensor.shape[2] // 2, output_tensor.shape[1] // 2
         paste_x = canvas_center_x + x_offset - (overlay_rgba.width // 2)
         paste_y = canvas_center_y + y_offset - (overlay_rgba.height // 2)
 
-        bg_rgba.paste(overlay_rgba, (paste_x, paste_y), mask=overlay_rgba)
-
-        final_pil = bg_rgba.convert("RGB")
-        output_tensor = self._pil_to_tensor(final_pil)
+        sprite = compositing.pil_to_sprite(overlay_rgba, crop=False)
+        compositing.blend(output_tensor, sprite[0], paste_x, paste_y)
 
         return (output_tensor,)
     
@@ -1463,7 +2168,7 @@ class WebhookUploader:
 
         try:
             print(f"WebhookUploader: Sending JSON payload to {webhook_url}")
-            response = requests.post(webhook_url, json=payload, headers=headers)
+            response = http_client.post(webhook_url, json=payload, headers=headers)
             response_text = f"Status Code: {response.status_code}\nResponse: {response.text}"
             print(f"WebhookUploader: {response_text}")
             return (response_text,)
@@ -1946,6 +2651,8 @@ class TransformPasterBatch:
     RETURN_TYPES = ("IMAGE",)
     RETURN_NAMES = ("composited_image",)
     FUNCTION = "process_batch"
+    WARP_CHUNK_FRAMES = 32  # Most frames the Batched Warp engine hands to one warp_blend call.
+    WARP_SOURCE_CACHE_BYTES = 512 * 1024 * 1024  # Filtered overlay frames kept for reuse while warping an animated overlay.
 
     @classmethod
     def INPUT_TYPES(s):
@@ -1966,6 +2673,11 @@ class TransformPasterBatch:
                 "x_offset": ("INT", {"default": 0, "min": -8192, "max": 8192, "step": 1}),
                 "y_offset": ("INT", {"default": 0, "min": -8192, "max": 8192, "step": 1}),
                 "interpolation": (resampling_methods, {"default": "LANCZOS"}),
+            },
+            "optional": {
+                "overlay_duration": ("INT", {"default": 0, "min": 0, "max": 999999, "step": 1, "tooltip": "Length of the paste window in frames. The overlay loops to fill it, e.g. a single-frame logo over the whole timeline. 0 = the overlay's own length."}),
+                "keyframes_json": ("STRING", {"multiline": True, "default": "", "tooltip": "Optional JSON keyframes, counted from the start of the paste window, e.g. [{\"frame\": 0, \"x_offset\": -400, \"opacity\": 0, \"easing\": \"ease_out\"}, {\"frame\": 24, \"x_offset\": 0, \"opacity\": 1}]. Animates x_offset, y_offset, size, rotation and opacity; properties without keyframes use the inputs above. Easings: linear, ease_in, ease_out, ease_in_out, hold."}),
+                "transform_engine": (["Auto", "PIL", "Batched Warp"], {"default": "Auto", "tooltip": "PIL: Resize and rotate each distinct overlay frame with the chosen filter. Batched Warp: Transform chunks of frames in one affine warp (bilinear, with antialiased downscaling); needed for keyframes. Auto: Batched Warp when keyframes are set."}),
             }
         }
 
@@ -1974,14 +2686,87 @@ class TransformPasterBatch:
         np_array = (tensor_frame.cpu().numpy() * 255).astype(np.uint8)
         return Image.fromarray(np_array, 'L') if is_mask else Image.fromarray(np_array, 'RGB')
 
-    def _pil_to_tensor(self, pil_image):
-        return torch.from_numpy(np.array(pil_image).astype(np.float32) / 255.0)
+    def _prepare_overlay(self, overlay_frame, mask_frame, size, rotation, resampling_filter):
+        """Masks, scales and rotates one overlay frame into an uncropped sprite, returned as (sprite, 0, 0)."""
+        # 1. Convert the overlay frame to PIL
+        overlay_rgba = self._tensor_to_pil(overlay_frame).convert("RGBA")
+        overlay_rgba.putalpha(self._tensor_to_pil(mask_frame, is_mask=True))
 
-    def process_batch(self, background_image, overlay_image, overlay_mask, alignment_mode, start_frame_offset, size, rotation, x_offset, y_offset, interpolation):
+        # 2. Scale
+        if overlay_rgba.width > 0 and overlay_rgba.height > 0:
+            aspect = overlay_rgba.width / overlay_rgba.height
+            new_w, new_h = (size, max(1, int(size / aspect))) if aspect >= 1 else (max(1, int(size * aspect)), size)
+            overlay_rgba = overlay_rgba.resize((new_w, new_h), resample=resampling_filter)
+
+        # 3. Rotate
+        if rotation != 0:
+            overlay_rgba = overlay_rgba.rotate(rotation, resample=Image.Resampling.BICUBIC, expand=True)
+        return compositing.pil_to_sprite(overlay_rgba, crop=False)
+
+    def _process_warp(self, output_timeline, overlay_image, overlay_mask, paste_start_index, paste_end_index, size, rotation, x_offset, y_offset, keyframe_list):
+        """Pastes the overlay with per-frame transforms from the keyframe tracks, warping whole chunks of frames at once."""
+        num_bg_frames = output_timeline.shape[0]
+        first, last = max(paste_start_index, 0), min(paste_end_index, num_bg_frames)
+        if first >= last: return
+        # Keyframe frames count from the start of the paste window.
+        local = np.arange(first, last) - paste_start_index
+        tracks = {prop: keyframes.evaluate(keyframe_list, prop, local, default) for prop, default in
+                  (("x_offset", x_offset), ("y_offset", y_offset), ("size", size), ("rotation", rotation), ("opacity", 1.0))}
+        src_h, src_w = overlay_image.shape[1], overlay_image.shape[2]
+        scale = np.maximum(tracks["size"], 0.0) / max(src_w, src_h, 1)
+        center_x = output_timeline.shape[2] // 2 + tracks["x_offset"]
+        center_y = output_timeline.shape[1] // 2 + tracks["y_offset"]
+        opacity = np.clip(tracks["opacity"], 0.0, 1.0) * (scale > 0)
+
+        device = output_timeline.device
+        if overlay_image.shape[0] == 1 and overlay_mask.shape[0] == 1:
+            sprite = compositing.image_mask_to_sprite(overlay_image[:1].to(device), overlay_mask[:1].to(device))
+            compositing.warp_blend(output_timeline[first:last], sprite, center_x, center_y, scale, scale, tracks["rotation"], opacity)
+            return
+
+        # An animated overlay is filtered one distinct (overlay frame, mask frame, pyramid level) at a time, never as
+        # a full-resolution batch. Filtered frames that are shown again later (looping overlays, repeated levels) are
+        # kept until their last use, within WARP_SOURCE_CACHE_BYTES.
+        levels = compositing.mip_level(scale)
+        keys = list(zip((local % overlay_image.shape[0]).tolist(), (local % overlay_mask.shape[0]).tolist(), levels.tolist()))
+        remaining = {}
+        for key in keys: remaining[key] = remaining.get(key, 0) + 1
+        filtered, filtered_bytes = {}, 0
+
+        def source(key):
+            nonlocal filtered_bytes
+            sprite = filtered.get(key)
+            if sprite is None:
+                overlay_idx, mask_idx, level = key
+                sprite = compositing.image_mask_to_sprite(overlay_image[overlay_idx:overlay_idx + 1].to(device), overlay_mask[mask_idx:mask_idx + 1].to(device))
+                sprite = compositing.prefilter(sprite, compositing.mip_size(src_w, src_h, level))[0]
+                if remaining[key] > 1 and filtered_bytes + sprite.numel() * sprite.element_size() <= self.WARP_SOURCE_CACHE_BYTES:
+                    filtered[key] = sprite; filtered_bytes += sprite.numel() * sprite.element_size()
+            remaining[key] -= 1
+            if remaining[key] == 0 and key in filtered:
+                filtered_bytes -= sprite.numel() * sprite.element_size(); del filtered[key]
+            return sprite
+
+        start = 0
+        while start < len(keys):
+            # A chunk shares one pyramid level, so its filtered frames have the same size and can be stacked.
+            level_w, level_h = compositing.mip_size(src_w, src_h, levels[start])
+            max_frames = max(1, min(self.WARP_CHUNK_FRAMES, compositing.WARP_PIXEL_BUDGET // (level_w * level_h)))
+            end = start + 1
+            while end < len(keys) and end - start < max_frames and levels[end] == levels[start]: end += 1
+            chunk = slice(start, end)
+            sprites = torch.stack([source(key) for key in keys[chunk]])
+            compositing.warp_blend(output_timeline[first + start:first + end], sprites, center_x[chunk], center_y[chunk], scale[chunk], scale[chunk],
+                                   tracks["rotation"][chunk], opacity[chunk], source_size=(src_w, src_h))
+            start = end
+
+    def process_batch(self, background_image, overlay_image, overlay_mask, alignment_mode, start_frame_offset, size, rotation, x_offset, y_offset, interpolation, overlay_duration=0, keyframes_json="", transform_engine="Auto"):
         
         num_bg_frames = background_image.shape[0]
         num_overlay_frames = overlay_image.shape[0]
         num_mask_frames = overlay_mask.shape[0]
+        # The overlay loops when the paste window is longer than the overlay batch.
+        overlay_length = overlay_duration if overlay_duration > 0 else num_overlay_frames
 
         # Work in-place on the background image tensor to save memory
         output_timeline = background_image
@@ -1991,55 +2776,49 @@ class TransformPasterBatch:
         if alignment_mode == "Paste at End":
             # Calculate the start frame so the overlay's last frame aligns with the background's last frame.
             # Then, subtract the offset (a positive offset moves it earlier in time).
-            paste_start_index = (num_bg_frames - num_overlay_frames) - start_frame_offset
+            paste_start_index = (num_bg_frames - overlay_length) - start_frame_offset
         else: # "Paste at Start"
             paste_start_index = start_frame_offset
             
-        paste_end_index = paste_start_index + num_overlay_frames
+        paste_end_index = paste_start_index + overlay_length
         
         print(f"TransformPasterBatch: Alignment='{alignment_mode}', Offset={start_frame_offset}.")
         print(f"TransformPasterBatch: Calculated paste window for background: frames {paste_start_index} to {paste_end_index - 1}.")
         # --- END OF NEW LOGIC ---
 
-        resampling_filter = getattr(Image.Resampling, interpolation, Image.Resampling.LANCZOS)
-
-        # Loop through all background frames
-        for i in range(num_bg_frames):
-            
-            # Check if the current frame is inside our calculated paste window.
-            if i >= paste_start_index and i < paste_end_index:
-                # Calculate the corresponding index for the overlay and mask.
-                overlay_idx = i - paste_start_index
-                mask_idx = overlay_idx % num_mask_frames
-                
-                # 1. Convert single frames to PIL
-                bg_pil = self._tensor_to_pil(output_timeline[i]).convert("RGBA")
-                overlay_pil = self._tensor_to_pil(overlay_image[overlay_idx])
-                mask_pil = self._tensor_to_pil(overlay_mask[mask_idx], is_mask=True)
-                
-                overlay_rgba = overlay_pil.convert("RGBA")
-                overlay_rgba.putalpha(mask_pil)
-
-                # 2. Scale
-                if overlay_rgba.width > 0 and overlay_rgba.height > 0:
-                    aspect = overlay_rgba.width / overlay_rgba.height
-                    new_w, new_h = (size, max(1, int(size / aspect))) if aspect >= 1 else (max(1, int(size * aspect)), size)
-                    overlay_rgba = overlay_rgba.resize((new_w, new_h), resample=resampling_filter)
-
-                # 3. Rotate
-                if rotation != 0:
-                    overlay_rgba = overlay_rgba.rotate(rotation, resample=Image.Resampling.BICUBIC, expand=True)
-                
-                # 4. Paste
-                paste_x = (bg_pil.width // 2) + x_offset - (overlay_rgba.width // 2)
-                paste_y = (bg_pil.height // 2) + y_offset - (overlay_rgba.height // 2)
-                bg_pil.paste(overlay_rgba, (paste_x, paste_y), mask=overlay_rgba)
+        try: keyframe_list = keyframes.parse_keyframes(keyframes_json)
+        except ValueError as e:
+            print(f"TransformPasterBatch: Ignoring keyframes. {e}"); keyframe_list = []
+        if transform_engine == "Batched Warp" or (transform_engine == "Auto" and keyframe_list):
+            print(f"TransformPasterBatch: Warping with {len(keyframe_list)} keyframes.")
+            self._process_warp(output_timeline, overlay_image, overlay_mask, paste_start_index, paste_end_index, size, rotation, x_offset, y_offset, keyframe_list)
+            print("TransformPasterBatch: Processing complete.")
+            return (output_timeline,)
+        if keyframe_list: print("TransformPasterBatch: Keyframes are only applied by the Batched Warp engine. Using the constant transform.")
 
-                # 5. Convert back to tensor and update timeline
-                output_timeline[i] = self._pil_to_tensor(bg_pil.convert("RGB"))
-            else:
-                # If we're outside the paste window, do nothing.
-                continue
+        resampling_filter = getattr(Image.Resampling, interpolation, Image.Resampling.LANCZOS)
+        # Calculate the corresponding overlay and mask index of every pasted frame.
+        frames = range(max(paste_start_index, 0), min(paste_end_index, num_bg_frames))
+        pairs = [((i - paste_start_index) % num_overlay_frames, (i - paste_start_index) % num_mask_frames) for i in frames]
+        # Each distinct (overlay, mask) pair is converted, resized and rotated once, not once per frame. Consecutive
+        # frames with the same pair form one run and fetch their sprite once.
+        sprites = sprite_cache.OverlaySprites(("TransformPasterBatch", size, rotation, interpolation), overlay_image, overlay_mask,
+                                              [pair for j, pair in enumerate(pairs) if j == 0 or pair != pairs[j - 1]])
+
+        # Consecutive frames that show the same prepared overlay are pasted with one blend.
+        run_start, run_key, run_sprite = None, None, None
+        for j, i in enumerate(range(frames.start, frames.stop + 1)):
+            key = sprite = None
+            if i < frames.stop:
+                key = overlay_idx, mask_idx = pairs[j]
+                if key == run_key: continue
+                sprite = sprites.get(key, lambda: self._prepare_overlay(overlay_image[overlay_idx], overlay_mask[mask_idx], size, rotation, resampling_filter))
+            if run_sprite is not None:
+                # Paste straight into the timeline tensor
+                paste_x = (output_timeline.shape[2] // 2) + x_offset - (run_sprite[0].shape[1] // 2)
+                paste_y = (output_timeline.shape[1] // 2) + y_offset - (run_sprite[0].shape[0] // 2)
+                compositing.blend(output_timeline[run_start:i], run_sprite[0], paste_x, paste_y)
+            run_start, run_key, run_sprite = i, key, sprite
 
         print("TransformPasterBatch: Processing complete.")
         return (output_timeline,)
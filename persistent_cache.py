@@ -0,0 +1,315 @@
+# Contains the on-disk caches used by the automation nodes to avoid repeating network work between queue runs.
+
+# --- IMPORTS ---
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+
+# All caches live next to the node pack so they survive ComfyUI restarts.
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+
+def get_cache_path(*parts):
+    """Returns a path inside the cache directory, creating the parent folders if needed."""
+    path = os.path.join(CACHE_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+def _atomic_write_json(path, data):
+    # Write to a temp file first so an interrupted run never leaves a half-written cache behind.
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, default=str)
+    os.replace(tmp_path, path)
+
+# --- FEED CACHE ---
+class FeedCache:
+    """
+    Persistent per-URL cache for RSS/Atom feeds. For every feed it stores the
+    ETag / Last-Modified validators and the parsed entries, so later runs can send
+    a conditional request and reuse the cached parse when the server answers 304.
+    Records that were not used within `ttl` seconds are dropped, and only the
+    `max_feeds` most recently used feeds are kept.
+    """
+    def __init__(self, path, ttl=86400.0, max_feeds=500):
+        self.path = path
+        self.ttl = ttl
+        self.max_feeds = max_feeds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._records = None
+        self._dirty = False
+
+    def _load(self):
+        if self._records is not None: return
+        self._records = {}
+        if not os.path.exists(self.path): return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._records = json.load(f)
+        except Exception as e:
+            print(f"ComfyUI_Automation: Feed cache at '{self.path}' could not be read and will be rebuilt. Error: {e}")
+
+    def get(self, url):
+        """Returns the cached record for `url` ({'etag', 'modified', 'entries', ...}) or None."""
+        with self._lock:
+            self._load()
+            record = self._records.get(url)
+            if record is None: return None
+            if time.time() - record.get('last_used', 0) > self.ttl:
+                del self._records[url]; self._dirty = True
+                return None
+            return record
+
+    def put(self, url, etag, modified, entries):
+        with self._lock:
+            self._load()
+            self._records[url] = {'etag': etag, 'modified': modified, 'entries': entries, 'last_used': time.time()}
+            self.misses += 1; self._dirty = True
+
+    def mark_hit(self, url):
+        """Records that the cached entries for `url` were reused after a 304 response."""
+        with self._lock:
+            record = self._records.get(url) if self._records else None
+            if record is not None: record['last_used'] = time.time()
+            self.hits += 1; self._dirty = True
+
+    def save(self):
+        """Applies TTL and size eviction and writes the cache to disk if anything changed."""
+        with self._lock:
+            if not self._dirty or self._records is None: return
+            now = time.time()
+            records = {u: r for u, r in self._records.items() if now - r.get('last_used', 0) <= self.ttl}
+            if len(records) > self.max_feeds:
+                newest = sorted(records, key=lambda u: records[u].get('last_used', 0), reverse=True)[:self.max_feeds]
+                records = {u: records[u] for u in newest}
+            self._records = records
+            try:
+                _atomic_write_json(self.path, records); self._dirty = False
+            except Exception as e:
+                print(f"ComfyUI_Automation: Could not write feed cache to '{self.path}'. Error: {e}")
+
+    def stats(self):
+        with self._lock:
+            cached = len(self._records) if self._records else 0
+            return f"Feed cache: {self.hits} hits, {self.misses} misses, {cached} feeds cached."
+
+_FEED_CACHE = None
+_SINGLETON_LOCK = threading.Lock()
+
+def get_feed_cache():
+    """Returns the process-wide feed cache, loading it lazily on first use."""
+    global _FEED_CACHE
+    with _SINGLETON_LOCK:
+        if _FEED_CACHE is None:
+            _FEED_CACHE = FeedCache(get_cache_path("feeds", "feed_cache.json"))
+        return _FEED_CACHE
+
+# --- SEEN ENTRY INDEX ---
+def _hash64(text):
+    # 64-bit keys keep the index compact; collisions are negligible at a few million entries per feed.
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'big', signed=True)
+
+class SeenEntryIndex:
+    """
+    SQLite-backed index of the entries (by id, GUID or link) that were already
+    returned for each feed. Keys are stored as 64-bit hashes in a WITHOUT ROWID
+    table, so lookups stay fast with hundreds of thousands of IDs. Each feed keeps
+    at most `max_per_feed` keys; the oldest ones are dropped first.
+    """
+    LOOKUP_CHUNK = 500
+
+    def __init__(self, path, max_per_feed=10000):
+        self.path = path
+        self.max_per_feed = max_per_feed
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS seen (feed INTEGER NOT NULL, key INTEGER NOT NULL, seen_at INTEGER NOT NULL, PRIMARY KEY (feed, key)) WITHOUT ROWID")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS seen_by_age ON seen (feed, seen_at)")
+        return self._conn
+
+    def unseen(self, feed_url, entry_keys):
+        """Returns a list of booleans, True for every key that was not seen before for this feed."""
+        if not entry_keys: return []
+        feed, hashed = _hash64(feed_url), [_hash64(k) for k in entry_keys]
+        with self._lock:
+            conn, seen = self._connect(), set()
+            for start in range(0, len(hashed), self.LOOKUP_CHUNK):
+                chunk = hashed[start:start + self.LOOKUP_CHUNK]
+                rows = conn.execute(f"SELECT key FROM seen WHERE feed = ? AND key IN ({','.join('?' * len(chunk))})", (feed, *chunk))
+                seen.update(row[0] for row in rows)
+        return [h not in seen for h in hashed]
+
+    def mark_seen(self, feed_url, entry_keys):
+        """Adds the keys to the index and trims the feed back to `max_per_feed` keys."""
+        if not entry_keys: return
+        # Microsecond timestamps plus the position in the batch keep "oldest first" trimming deterministic.
+        feed, now = _hash64(feed_url), int(time.time() * 1_000_000)
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO seen (feed, key, seen_at) VALUES (?, ?, ?)", [(feed, _hash64(k), now + i) for i, k in enumerate(entry_keys)])
+                count = conn.execute("SELECT COUNT(*) FROM seen WHERE feed = ?", (feed,)).fetchone()[0]
+                if count > self.max_per_feed:
+                    conn.execute("DELETE FROM seen WHERE feed = ? AND key IN (SELECT key FROM seen WHERE feed = ? ORDER BY seen_at ASC LIMIT ?)", (feed, feed, count - self.max_per_feed))
+
+_SEEN_INDEX = None
+
+def get_seen_index():
+    """Returns the process-wide seen-entry index, opening the database lazily on first use."""
+    global _SEEN_INDEX
+    with _SINGLETON_LOCK:
+        if _SEEN_INDEX is None:
+            _SEEN_INDEX = SeenEntryIndex(get_cache_path("feeds", "seen_entries.sqlite3"))
+        return _SEEN_INDEX
+
+# --- IMAGE CACHE ---
+class ImageCache:
+    """
+    Content-addressed on-disk cache for downloaded images. Each URL points to the
+    SHA-256 of its bytes, so identical images behind different URLs are stored
+    once. Next to the original bytes it keeps already resized variants as uint8
+    .npy files (memory-mappable), keyed by the resize settings, so a fresh hit
+    skips both the download and the decode. URLs older than `revalidate_after`
+    seconds are revalidated with a conditional request. When the cache grows
+    beyond `max_bytes` the least recently used images are deleted.
+    """
+    def __init__(self, root, max_bytes=1024 * 1024 * 1024, revalidate_after=3600.0):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.revalidate_after = revalidate_after
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index = None
+        self._dirty = False
+
+    def _index_path(self): return os.path.join(self.root, "index.json")
+
+    def _blob_path(self, content_hash, suffix): return os.path.join(self.root, content_hash[:2], f"{content_hash}{suffix}")
+
+    def _load(self):
+        if self._index is not None: return
+        self._index = {"urls": {}, "blobs": {}}
+        if not os.path.exists(self._index_path()): return
+        try:
+            with open(self._index_path(), 'r', encoding='utf-8') as f:
+                self._index = json.load(f)
+        except Exception as e:
+            print(f"ComfyUI_Automation: Image cache index could not be read and will be rebuilt. Error: {e}")
+
+    def lookup(self, url):
+        """Returns {'hash', 'etag', 'modified', 'fresh'} for a cached URL, or None."""
+        with self._lock:
+            self._load()
+            record = self._index["urls"].get(url)
+            if record is None or record["hash"] not in self._index["blobs"]: return None
+            return dict(record, fresh=time.time() - record.get("validated", 0) <= self.revalidate_after)
+
+    def mark_validated(self, url):
+        with self._lock:
+            record = self._index["urls"].get(url)
+            if record is not None: record["validated"] = time.time(); self._dirty = True
+
+    def _touch(self, content_hash):
+        blob = self._index["blobs"].get(content_hash)
+        if blob is not None: blob["last_used"] = time.time(); self._dirty = True
+        return blob
+
+    def _write_file(self, path, write):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f: write(f)
+        os.replace(tmp_path, path)
+        return os.path.getsize(path)
+
+    def store_bytes(self, url, data, etag=None, modified=None):
+        """Stores the downloaded bytes for `url` and returns their content hash."""
+        content_hash = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            self._load()
+            known = content_hash in self._index["blobs"]
+        size = 0 if known else self._write_file(self._blob_path(content_hash, ".bin"), lambda f: f.write(data))
+        with self._lock:
+            if not known: self._index["blobs"][content_hash] = {"size": size, "variants": {}, "last_used": time.time()}
+            self._index["urls"][url] = {"hash": content_hash, "etag": etag, "modified": modified, "validated": time.time()}
+            self._touch(content_hash); self.misses += 1
+        return content_hash
+
+    def has_bytes(self, content_hash):
+        return os.path.exists(self._blob_path(content_hash, ".bin"))
+
+    def load_bytes(self, content_hash):
+        path = self._blob_path(content_hash, ".bin")
+        if not os.path.exists(path): return None
+        with self._lock: self._touch(content_hash)
+        with open(path, 'rb') as f: return f.read()
+
+    def load_variant(self, content_hash, variant_key):
+        """Returns the cached uint8 array (memory-mapped) for a resize variant, or None."""
+        with self._lock:
+            blob = self._touch(content_hash)
+            name = blob["variants"].get(variant_key) if blob else None
+        if name is None: return None
+        try:
+            array = np.load(os.path.join(self.root, content_hash[:2], name), mmap_mode='r')
+        except Exception:
+            return None
+        with self._lock: self.hits += 1
+        return array
+
+    def store_variant(self, content_hash, variant_key, array):
+        name = f"{content_hash}_{hashlib.sha1(variant_key.encode('utf-8')).hexdigest()[:12]}.npy"
+        size = self._write_file(os.path.join(self.root, content_hash[:2], name), lambda f: np.save(f, np.ascontiguousarray(array, dtype=np.uint8)))
+        with self._lock:
+            blob = self._index["blobs"].get(content_hash)
+            if blob is None: return
+            if variant_key not in blob["variants"]: blob["size"] += size
+            blob["variants"][variant_key] = name; self._dirty = True
+
+    def _delete_blob(self, content_hash):
+        blob = self._index["blobs"].pop(content_hash)
+        for name in [f"{content_hash}.bin"] + list(blob["variants"].values()):
+            try: os.remove(os.path.join(self.root, content_hash[:2], name))
+            except OSError: pass
+
+    def save(self):
+        """Evicts the least recently used images above `max_bytes` and writes the index to disk."""
+        with self._lock:
+            if not self._dirty or self._index is None: return
+            blobs = self._index["blobs"]
+            total = sum(b["size"] for b in blobs.values())
+            if total > self.max_bytes:
+                for content_hash in sorted(blobs, key=lambda h: blobs[h]["last_used"]):
+                    if total <= self.max_bytes: break
+                    total -= blobs[content_hash]["size"]; self._delete_blob(content_hash)
+                self._index["urls"] = {u: r for u, r in self._index["urls"].items() if r["hash"] in blobs}
+            try:
+                _atomic_write_json(self._index_path(), self._index); self._dirty = False
+            except Exception as e:
+                print(f"ComfyUI_Automation: Could not write image cache index. Error: {e}")
+
+    def stats(self):
+        with self._lock:
+            blobs = self._index["blobs"] if self._index else {}
+            size_mb = sum(b["size"] for b in blobs.values()) / (1024 * 1024)
+            return f"Image cache: {self.hits} hits, {self.misses} downloads, {len(blobs)} images ({size_mb:.1f} MB)."
+
+_IMAGE_CACHE = None
+
+def get_image_cache():
+    """Returns the process-wide image cache."""
+    global _IMAGE_CACHE
+    with _SINGLETON_LOCK:
+        if _IMAGE_CACHE is None:
+            _IMAGE_CACHE = ImageCache(os.path.join(CACHE_DIR, "images"))
+        return _IMAGE_CACHE
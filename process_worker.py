@@ -0,0 +1,23 @@
+# Bootstraps the worker processes used by the Multiprocess mode of the text nodes. Workers are started with
+# spawn or forkserver, so they begin in a fresh interpreter that cannot import this node pack by name: ComfyUI
+# loads custom nodes from their folder, not from sys.path. Each worker runs this file by path (runpy.run_path)
+# with PACKAGE_NAME and PACKAGE_DIR set, which registers the folder under the package name the parent uses.
+# The tasks it receives (functions in <package>.nodes) then unpickle normally. The package __init__ is not run.
+
+# --- IMPORTS ---
+import sys
+import types
+
+def register_package(name, directory):
+    """Makes `name` importable as a package whose modules live in `directory`, with empty stand-ins for its parents."""
+    parts = name.split('.')
+    for i in range(1, len(parts)):
+        parent = '.'.join(parts[:i])
+        if parent not in sys.modules:
+            module = types.ModuleType(parent); module.__path__ = []
+            sys.modules[parent] = module
+    if name not in sys.modules:
+        package = types.ModuleType(name); package.__path__ = [directory]; package.__package__ = name
+        sys.modules[name] = package
+
+if "PACKAGE_NAME" in globals(): register_package(PACKAGE_NAME, PACKAGE_DIR)
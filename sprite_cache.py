@@ -0,0 +1,134 @@
+# Contains the process-wide cache of rendered sprites. A styled caption (text plus shadow, stroke, glow or
+# background layers) or a transformed overlay is rendered once and kept as a premultiplied float sprite, so later
+# frames, batch items and queue runs that show the same content with the same settings only blend it. The cache is an LRU bounded
+# by the memory its sprites use, not by entry count, because sprite sizes vary from a word to a full frame.
+
+# --- IMPORTS ---
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+_SETTINGS = {
+    # Memory the cached sprites may use. Can be set with COMFYUI_AUTOMATION_SPRITE_CACHE_MB (0 disables caching).
+    "max_bytes": int(float(os.environ.get("COMFYUI_AUTOMATION_SPRITE_CACHE_MB", "256")) * 1024 * 1024),
+    # Overlays with up to this many frames are keyed by content, so later runs reuse their sprites; longer
+    # overlays are keyed by frame index within one node call (see OverlaySprites).
+    "content_key_max_frames": 8,
+}
+
+def tensor_key(tensor):
+    """Returns a short digest of a tensor's shape and contents, for keying sprites rendered from image data."""
+    data = tensor.detach().cpu().contiguous().numpy()
+    return (tuple(data.shape), hashlib.blake2b(data.tobytes(), digest_size=16).digest())
+
+def _sprite_bytes(value):
+    if value is None: return 0
+    sprite = value[0]
+    return sprite.numel() * sprite.element_size()
+
+class SpriteCache:
+    """
+    LRU mapping of hashable keys to rendered sprites, (sprite, x, y) tuples or None for sprites
+    with no visible pixels. Least recently used sprites are evicted once their total size exceeds max_bytes.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        size = _sprite_bytes(value)
+        with self._lock:
+            if key in self._entries: self._bytes -= _sprite_bytes(self._entries.pop(key))
+            # A sprite bigger than the whole cache would only evict everything else.
+            if size > self.max_bytes: return value
+            self._entries[key] = value
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= _sprite_bytes(evicted)
+        return value
+
+    def get_or_render(self, key, render):
+        """Returns the cached sprite for key, calling render() and caching its result on a miss."""
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing: value = self.put(key, render())
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear(); self._bytes = 0
+
+    @property
+    def size_bytes(self):
+        return self._bytes
+
+    def __len__(self):
+        return len(self._entries)
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+def configure(max_bytes=None):
+    """Changes the memory cap. The cache is rebuilt (and emptied) on its next use."""
+    global _CACHE
+    with _CACHE_LOCK:
+        if max_bytes is not None: _SETTINGS["max_bytes"] = max_bytes
+        _CACHE = None
+
+def get_cache():
+    """Returns the process-wide SpriteCache, creating it on first use."""
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None: _CACHE = SpriteCache(_SETTINGS["max_bytes"])
+        return _CACHE
+
+class OverlaySprites:
+    """
+    Prepared sprites of an overlay/mask pair for one node call, fetched by (overlay index, mask index). A still
+    image or short loop is keyed by content digest in the process-wide cache, so later runs reuse it. Longer
+    overlays are keyed by index: hashing every full-resolution frame costs about as much as preparing it, and a
+    video overlay rarely repeats across runs. Their sprites are kept only until the pair's last use in `pairs`
+    (the sequence of pairs the call will fetch), within the sprite cache's memory cap.
+    """
+    def __init__(self, prefix, overlay, mask, pairs):
+        self.prefix, self.overlay, self.mask = prefix, overlay, mask
+        self.by_content = max(overlay.shape[0], mask.shape[0]) <= _SETTINGS["content_key_max_frames"]
+        self._overlay_keys, self._mask_keys = {}, {}
+        self._remaining, self._held, self._held_bytes = {}, {}, 0
+        for pair in pairs: self._remaining[pair] = self._remaining.get(pair, 0) + 1
+
+    def key(self, pair):
+        """Returns the hashable key of the pair's sprite: prefix plus content digests, or prefix plus the indices."""
+        if not self.by_content: return self.prefix + pair
+        overlay_idx, mask_idx = pair
+        if overlay_idx not in self._overlay_keys: self._overlay_keys[overlay_idx] = tensor_key(self.overlay[overlay_idx])
+        if mask_idx not in self._mask_keys: self._mask_keys[mask_idx] = tensor_key(self.mask[mask_idx])
+        return self.prefix + (self._overlay_keys[overlay_idx], self._mask_keys[mask_idx])
+
+    def get(self, pair, render):
+        """Returns the pair's sprite, calling render() when it is not held. Counts as one of the pair's uses."""
+        if self.by_content: return get_cache().get_or_render(self.key(pair), render)
+        value = self._held.get(pair)
+        if value is None:
+            value = render()
+            size = _sprite_bytes(value)
+            if self._remaining.get(pair, 0) > 1 and self._held_bytes + size <= _SETTINGS["max_bytes"]:
+                self._held[pair] = value; self._held_bytes += size
+        self._remaining[pair] = self._remaining.get(pair, 1) - 1
+        if self._remaining[pair] <= 0 and pair in self._held:
+            self._held_bytes -= _sprite_bytes(self._held.pop(pair))
+        return value
@@ -0,0 +1,138 @@
+# Contains the emoji-aware text layout engine shared by the text nodes. Every measurement is memoized by
+# (font file, size, string), so repeated words, lines and style passes never hit FreeType twice, and
+# wrapping adds up cached per-word widths and measures only the lines at each break instead of every growing line.
+
+# --- IMPORTS ---
+import threading
+from functools import lru_cache
+from PIL import Image, ImageDraw
+
+MEASURE_CACHE_SIZE = 16384
+
+# A throwaway RGBA canvas: its textbbox() measures exactly like the per-frame layers the nodes draw on.
+_MEASURE_DRAW = ImageDraw.Draw(Image.new('RGBA', (1, 1)))
+# Fonts are registered by key so the memoized functions below can be keyed on plain hashable values.
+_FONTS = {}
+_FONTS_LOCK = threading.Lock()
+
+def font_key(font):
+    """Returns a hashable key identifying a font by file, size and face index."""
+    path = getattr(font, 'path', None)
+    if isinstance(path, (str, bytes)):
+        return (path, getattr(font, 'size', None), getattr(font, 'index', 0))
+    return ('id', id(font))
+
+def _register(font):
+    key = font_key(font)
+    if key not in _FONTS:
+        with _FONTS_LOCK: _FONTS.setdefault(key, font)
+    return key
+
+@lru_cache(maxsize=MEASURE_CACHE_SIZE)
+def _bbox(key, text):
+    return _MEASURE_DRAW.textbbox((0, 0), text, font=_FONTS[key])
+
+@lru_cache(maxsize=MEASURE_CACHE_SIZE)
+def _advance(key, text):
+    if '\n' in text: return _bbox(key, text)[2]
+    try: return _FONTS[key].getlength(text)
+    except (AttributeError, TypeError, ValueError): return _bbox(key, text)[2]
+
+@lru_cache(maxsize=MEASURE_CACHE_SIZE)
+def _split(regex, text):
+    return tuple((part, bool(regex.match(part))) for part in regex.split(text) if part)
+
+def measure_bbox(font, text):
+    """Memoized equivalent of draw.textbbox((0, 0), text, font=font)."""
+    return _bbox(_register(font), text)
+
+def clear_cache():
+    """Drops every memoized measurement and registered font."""
+    _bbox.cache_clear(); _advance.cache_clear(); _split.cache_clear()
+    with _FONTS_LOCK: _FONTS.clear()
+
+class TextLayout:
+    """
+    Measures, wraps and draws text set in a main font with an optional emoji fallback font.
+    When `emoji_font` is given, text is split with `split_regex` into runs and each run is
+    measured with its own font; without it, text is measured as one string with the main font.
+    Line layouts are computed once per instance and reused by every drawing pass.
+    """
+    def __init__(self, main_font, emoji_font=None, split_regex=None):
+        self.main_font, self.emoji_font, self.split_regex = main_font, emoji_font, split_regex
+        self._main_key = _register(main_font)
+        self._emoji_key = _register(emoji_font) if emoji_font is not None else None
+        self._runs = {}
+
+    def _parts(self, text):
+        if self.split_regex is None: return ((text, False),) if text else ()
+        return _split(self.split_regex, text)
+
+    def bbox(self, text):
+        """
+        Returns the text's bounding box. With an emoji font this is (0, 0, total_width, height),
+        summing the widths of the runs, otherwise the main font's textbbox at the origin.
+        """
+        if self._emoji_key is None: return _bbox(self._main_key, text)
+        total_width = 0; min_y = float('inf'); max_y = float('-inf')
+        for part, is_emoji in self._parts(text):
+            try: bbox = _bbox(self._emoji_key if is_emoji else self._main_key, part)
+            except TypeError: continue
+            total_width += bbox[2] - bbox[0]
+            min_y = min(min_y, bbox[1]); max_y = max(max_y, bbox[3])
+        return (0, 0, total_width, max_y - min_y if min_y != float('inf') else 0)
+
+    def size(self, text):
+        """Returns (width, height) of the text's bounding box."""
+        bbox = self.bbox(text)
+        return bbox[2] - bbox[0], bbox[3] - bbox[1]
+
+    def advance(self, text):
+        """Returns how far the pen moves after drawing the text, for placing whatever follows it."""
+        if self._emoji_key is None: return _advance(self._main_key, text)
+        total = 0
+        for part, is_emoji in self._parts(text):
+            try: total += _advance(self._emoji_key if is_emoji else self._main_key, part)
+            except TypeError: pass
+        return total
+
+    def wrap(self, text, max_width, ink_width=False):
+        """
+        Greedily wraps text at spaces so no line is wider than max_width. Words are added while the cached
+        per-word advances say they fit, then the break is settled on the textbbox of the candidate line
+        itself, so kerning and side bearings break lines exactly where measuring every growing line would.
+        A line's width is the right edge of its box (x1), or with ink_width=True the box's own width (x1 - x0),
+        which is what AnimateTextOnImage has always measured; the two differ for glyphs with a left bearing.
+        """
+        def width(line):
+            bbox = self.bbox(line)
+            return bbox[2] - bbox[0] if ink_width else bbox[2]
+        words = text.split(' ')
+        space = self.advance(' ')
+        lines, start = [], 0
+        while start < len(words):
+            end, line_advance = start + 1, self.advance(words[start])
+            while end < len(words) and line_advance + space + self.bbox(words[end])[2] <= max_width:
+                line_advance += space + self.advance(words[end]); end += 1
+            while end < len(words) and width(' '.join(words[start:end + 1])) <= max_width: end += 1
+            while end - start > 1 and width(' '.join(words[start:end])) > max_width: end -= 1
+            lines.append(' '.join(words[start:end])); start = end
+        return "\n".join(lines)
+
+    def line_runs(self, line):
+        """Returns the line's runs as (text, font, x_offset) tuples, computed once per line."""
+        runs = self._runs.get(line)
+        if runs is None:
+            runs, x = [], 0
+            for part, is_emoji in self._parts(line):
+                font = self.emoji_font if is_emoji and self.emoji_font else self.main_font
+                runs.append((part, font, x))
+                x += self.size(part)[0]
+            self._runs[line] = runs
+        return runs
+
+    def draw(self, draw, pos, line, fill, stroke_width=0, stroke_fill=None):
+        """Draws one line of text at pos, each run with its own font."""
+        x, y = pos
+        for part, font, x_offset in self.line_runs(line):
+            draw.text((x + x_offset, y), part, font=font, fill=fill, embedded_color=True, stroke_width=stroke_width, stroke_fill=stroke_fill)
@@ -0,0 +1,147 @@
+# Contains the frame readers and writers used by the streaming video nodes. Frames are read and written a
+# chunk at a time, either as image files in a folder or through an ffmpeg pipe, so a whole video never has
+# to be held in memory.
+
+# --- IMPORTS ---
+import os
+import re
+import json
+import shlex
+import shutil
+import subprocess
+import numpy as np
+from PIL import Image
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.bmp', '.tif', '.tiff')
+DEFAULT_FFMPEG_ARGS = "-c:v libx264 -pix_fmt yuv420p -crf 18"
+
+def find_ffmpeg(tool="ffmpeg"):
+    """Returns the path of ffmpeg (or ffprobe), honouring COMFYUI_AUTOMATION_FFMPEG for ffmpeg itself, or None."""
+    if tool == "ffmpeg" and os.environ.get("COMFYUI_AUTOMATION_FFMPEG"): return os.environ["COMFYUI_AUTOMATION_FFMPEG"]
+    return shutil.which(tool)
+
+def _natural_key(name):
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r'(\d+)', name)]
+
+def list_frame_files(directory):
+    """Returns the image files in a folder, in natural order (frame_2 before frame_10)."""
+    files = [f for f in os.listdir(directory) if f.lower().endswith(IMAGE_EXTENSIONS)]
+    return [os.path.join(directory, f) for f in sorted(files, key=_natural_key)]
+
+class FrameDirectoryReader:
+    """Reads a folder of numbered images as uint8 RGB frames. Every frame is converted to the first frame's size."""
+    def __init__(self, directory):
+        self.files = list_frame_files(directory)
+        if not self.files: raise ValueError(f"No image files found in '{directory}'.")
+        with Image.open(self.files[0]) as first: self.width, self.height = first.size
+        self.fps = None
+        self._position = 0
+
+    def __len__(self):
+        return len(self.files)
+
+    def read(self, count):
+        """Returns the next `count` frames as a (n, H, W, 3) uint8 array; n is 0 at the end."""
+        files = self.files[self._position:self._position + count]
+        self._position += len(files)
+        chunk = np.empty((len(files), self.height, self.width, 3), dtype=np.uint8)
+        for i, path in enumerate(files):
+            with Image.open(path) as img:
+                img = img.convert("RGB")
+                if img.size != (self.width, self.height): img = img.resize((self.width, self.height), Image.Resampling.LANCZOS)
+                chunk[i] = np.asarray(img)
+        return chunk
+
+    def close(self):
+        pass
+
+def _rotation(stream):
+    """Returns a probed video stream's display rotation in degrees, from its side data or its legacy 'rotate' tag."""
+    for side_data in stream.get("side_data_list", []):
+        if "rotation" in side_data:
+            try: return int(round(float(side_data["rotation"]))) % 360
+            except (TypeError, ValueError): pass
+    try: return int(stream.get("tags", {}).get("rotate", 0)) % 360
+    except (TypeError, ValueError): return 0
+
+class FFmpegReader:
+    """Decodes a video file to uint8 RGB frames through an ffmpeg pipe."""
+    def __init__(self, path):
+        ffmpeg, ffprobe = find_ffmpeg(), find_ffmpeg("ffprobe")
+        if ffmpeg is None or ffprobe is None: raise RuntimeError("ffmpeg and ffprobe are required to read video files. Install them or use a folder of frames.")
+        probe = subprocess.run([ffprobe, "-v", "error", "-select_streams", "v:0", "-show_entries", "stream=width,height,avg_frame_rate,nb_frames:stream_tags=rotate:stream_side_data=rotation", "-of", "json", path],
+                               capture_output=True, text=True, check=True)
+        stream = json.loads(probe.stdout)["streams"][0]
+        self.width, self.height = int(stream["width"]), int(stream["height"])
+        # ffmpeg applies the rotation metadata of phone videos while decoding, so a stream stored as 1920x1080
+        # and rotated by 90 degrees arrives as upright 1080x1920 frames.
+        if _rotation(stream) % 180 == 90: self.width, self.height = self.height, self.width
+        num, _, den = stream.get("avg_frame_rate", "0/1").partition("/")
+        self.fps = float(num) / float(den or 1) if float(den or 1) else None
+        self.frame_count = int(stream["nb_frames"]) if str(stream.get("nb_frames", "")).isdigit() else None
+        self._frame_bytes = self.width * self.height * 3
+        self._process = subprocess.Popen([ffmpeg, "-v", "error", "-i", path, "-f", "rawvideo", "-pix_fmt", "rgb24", "-"], stdout=subprocess.PIPE)
+
+    def __len__(self):
+        return self.frame_count or 0
+
+    def read(self, count):
+        """Returns the next `count` frames as a (n, H, W, 3) uint8 array; n is 0 at the end."""
+        data = self._process.stdout.read(self._frame_bytes * count)
+        n = len(data) // self._frame_bytes
+        # frombuffer over bytes is read-only, so copy into a writable array like the folder reader returns.
+        return np.frombuffer(data, dtype=np.uint8, count=n * self._frame_bytes).reshape(n, self.height, self.width, 3).copy()
+
+    def close(self):
+        self._process.stdout.close()
+        self._process.wait()
+
+class FrameDirectoryWriter:
+    """Writes frames as numbered PNG files into a folder."""
+    def __init__(self, directory, prefix="frame"):
+        os.makedirs(directory, exist_ok=True)
+        self.directory, self.prefix = directory, prefix
+        self.count = 0
+
+    def write(self, frames):
+        """Writes a (n, H, W, 3) uint8 array of frames."""
+        for frame in frames:
+            Image.fromarray(frame).save(os.path.join(self.directory, f"{self.prefix}_{self.count:06d}.png"))
+            self.count += 1
+
+    def close(self):
+        pass
+
+class FFmpegWriter:
+    """
+    Encodes frames to a video file through an ffmpeg pipe. If `audio_source` is a video file,
+    its audio track (if any) is copied into the output.
+    """
+    def __init__(self, path, width, height, fps, ffmpeg_args=DEFAULT_FFMPEG_ARGS, audio_source=None):
+        ffmpeg = find_ffmpeg()
+        if ffmpeg is None: raise RuntimeError("ffmpeg is required to write video files. Install it or write to a folder of frames.")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        command = [ffmpeg, "-v", "error", "-y", "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-r", str(fps), "-i", "-"]
+        if audio_source: command += ["-i", audio_source, "-map", "0:v", "-map", "1:a?", "-c:a", "copy", "-shortest"]
+        # shlex keeps quoted arguments (e.g. -metadata title="My video") together.
+        command += shlex.split(ffmpeg_args) + [path]
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE)
+        self.count = 0
+
+    def write(self, frames):
+        """Writes a (n, H, W, 3) uint8 array of frames."""
+        self._process.stdin.write(np.ascontiguousarray(frames).tobytes())
+        self.count += len(frames)
+
+    def close(self):
+        self._process.stdin.close()
+        if self._process.wait() != 0: raise RuntimeError(f"ffmpeg exited with code {self._process.returncode}.")
+
+def open_reader(path):
+    """Opens a frame folder or a video file for chunked reading."""
+    return FrameDirectoryReader(path) if os.path.isdir(path) else FFmpegReader(path)
+
+def open_writer(path, width, height, fps, ffmpeg_args=DEFAULT_FFMPEG_ARGS, audio_source=None):
+    """Opens a frame folder (a path without a file extension) or a video file for chunked writing."""
+    if os.path.isdir(path) or not os.path.splitext(path)[1]: return FrameDirectoryWriter(path)
+    return FFmpegWriter(path, width, height, fps, ffmpeg_args, audio_source)